@@ -0,0 +1,115 @@
+# aadhaar_index.py
+# Lookup-by-Aadhaar through the HMAC blind index (Customer.aadhaar_bidx) and a batch tool
+# that builds the index for customers saved before the column existed.
+#
+# Usage:
+#   python aadhaar_index.py            # build index for all un-indexed rows (chunks of 500)
+#   python aadhaar_index.py --chunk 2000
+#
+# Needs MFI_BLIND_INDEX_KEY (see encryption_utils) -- the same value the app runs with.
+
+import argparse
+import re
+import time
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Customer, upgrade_schema
+from encryption_utils import blind_index, decrypt_data
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def find_customer_by_aadhaar(db: Session, aadhaar: str):
+    """Returns the Customer with this Aadhaar (indexed equality probe) or None."""
+    bidx = blind_index(aadhaar)
+    if not bidx:
+        return None
+    return db.query(Customer).filter(Customer.aadhaar_bidx == bidx).first()
+
+
+def _plain_aadhaar(stored_value: str):
+    """Decrypts a stored Aadhaar. Early desktop builds saved it unencrypted, so accept raw digits too."""
+    if not stored_value:
+        return None
+    if re.fullmatch(r'[\d\s-]{12,14}', stored_value):
+        return stored_value
+    decrypted = decrypt_data(stored_value)
+    if decrypted == "DECRYPTION_FAILED":
+        return None
+    return decrypted
+
+
+def backfill_aadhaar_index(db: Session, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Builds aadhaar_bidx for rows where it is NULL, one chunk per short transaction.
+    Safe to stop and re-run: indexed rows are skipped by the WHERE clause.
+
+    Returns: {'indexed', 'duplicates', 'failed', 'seconds'}
+    """
+    started = time.perf_counter()
+    indexed = duplicates = failed = 0
+    last_id = 0
+    # bidx values seen in this run; combined with a DB probe this catches duplicate Aadhaar
+    # before the unique index rejects the whole chunk.
+    seen = set()
+
+    while True:
+        rows = db.query(Customer.id, Customer.aadhaar_encrypted).filter(
+            Customer.aadhaar_bidx.is_(None),
+            Customer.id > last_id
+        ).order_by(Customer.id).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        candidates = {}
+        for row in rows:
+            bidx = blind_index(_plain_aadhaar(row.aadhaar_encrypted))
+            if not bidx:
+                failed += 1
+                continue
+            candidates[row.id] = bidx
+
+        already_used = {
+            value for (value,) in db.query(Customer.aadhaar_bidx).filter(
+                Customer.aadhaar_bidx.in_(list(candidates.values()))
+            )
+        } if candidates else set()
+
+        updates = []
+        for customer_id, bidx in candidates.items():
+            if bidx in already_used or bidx in seen:
+                duplicates += 1
+                print(f"Duplicate Aadhaar for customer ID {customer_id}; left un-indexed for manual review.")
+                continue
+            seen.add(bidx)
+            updates.append({'id': customer_id, 'aadhaar_bidx': bidx})
+
+        if updates:
+            db.execute(update(Customer), updates)
+        db.commit()
+        indexed += len(updates)
+        print(f"Indexed {indexed} customers so far (last ID {last_id})")
+
+    return {
+        'indexed': indexed,
+        'duplicates': duplicates,
+        'failed': failed,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the Aadhaar blind index for existing customers.")
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per transaction")
+    args = parser.parse_args()
+
+    upgrade_schema()
+    session = SessionLocal()
+    try:
+        result = backfill_aadhaar_index(session, chunk_size=args.chunk)
+        print(f"✅ Done: {result}")
+    finally:
+        session.close()
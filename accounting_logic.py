@@ -123,14 +123,25 @@ def allocate_payment(db: Session, loan_id: int, payment_amount: float, payment_d
         
     # 2. Get Current Outstanding Principal
     outstanding_principal = get_current_outstanding_principal(db, loan_id)
-    
+
+    return allocate_amount(payment_amount, outstanding_principal, loan.annual_interest_rate, last_date, payment_date)
+
+
+def allocate_amount(payment_amount: float, outstanding_principal: float, annual_rate: float,
+                    last_date: date, payment_date: date) -> tuple[float, float, float]:
+    """
+    Pure Daily Reducing Balance allocation (no DB access), shared by allocate_payment and the
+    bulk collection sync. annual_rate is a fraction (0.24 = 24%), as in loan_calc.
+
+    Returns: (principal_allocated, interest_allocated, remaining_balance)
+    """
     if outstanding_principal <= 0:
         return 0.0, 0.0, payment_amount # Loan is already fully paid
 
     # 3. Calculate Interest Due for the period (Daily Reducing Balance)
     
     # Days since last transaction
-    days = (payment_date - last_date).days
+    days = (payment_date - last_date).days if last_date else 0
     
     if days <= 0:
         # If paying on the same day as the last payment, assume only principal is paid
@@ -138,9 +149,9 @@ def allocate_payment(db: Session, loan_id: int, payment_amount: float, payment_d
         days = 1 
     
     # Daily Interest = (Outstanding Principal * Daily Rate)
-    # Annual Rate: loan.interest_rate (e.g., 18%)
-    daily_rate = loan.interest_rate / 100 / 365 
-    interest_due = outstanding_principal * daily_rate * days
+    # FIXED: LoanAccount has annual_interest_rate (a fraction), not interest_rate (a percentage)
+    daily_rate = (annual_rate or 0.0) / 365
+    interest_due = round(outstanding_principal * daily_rate * days, 2)  # to the paisa, so the parts add up to the payment
     
     # 4. Allocate Payment
     
@@ -164,4 +175,30 @@ def allocate_payment(db: Session, loan_id: int, payment_amount: float, payment_d
         principal_allocated = principal_allocation_limit
         remaining_balance -= principal_allocation_limit
         
-    return round(principal_allocated, 2), round(interest_allocated, 2), round(remaining_balance, 2)
\ No newline at end of file
+    return round(principal_allocated, 2), round(interest_allocated, 2), round(remaining_balance, 2)
+
+
+def collection_gl_rows(loan_id: int, amount_paid: float, principal_amount: float, interest_amount: float,
+                       tx_date: datetime) -> list:
+    """
+    The GL lines of post_collection_to_gl as plain dicts, for bulk inserts. Whatever the allocation
+    didn't take (overpayment beyond principal + interest) is credited to Customer Advance A/C, so the
+    Cash debit always equals the credits.
+    """
+    excess_amount = round(amount_paid - principal_amount - interest_amount, 2)
+    rows = [
+        {'loan_account_id': loan_id, 'transaction_date': tx_date, 'account_head': 'Cash A/C',
+         'debit': amount_paid, 'credit': 0.0,
+         'narration': f"Cash received for Loan ID {loan_id} payment."},
+        {'loan_account_id': loan_id, 'transaction_date': tx_date, 'account_head': 'Loan Interest Income A/C',
+         'debit': 0.0, 'credit': interest_amount,
+         'narration': f"Interest portion of payment for Loan ID {loan_id}."},
+        {'loan_account_id': loan_id, 'transaction_date': tx_date, 'account_head': 'Loan Principal Receivable A/C',
+         'debit': 0.0, 'credit': principal_amount,
+         'narration': f"Principal portion of payment for Loan ID {loan_id}."},
+    ]
+    if excess_amount > 0:
+        rows.append({'loan_account_id': loan_id, 'transaction_date': tx_date, 'account_head': 'Customer Advance A/C',
+                     'debit': 0.0, 'credit': excess_amount,
+                     'narration': f"Excess payment held as advance for Loan ID {loan_id}."})
+    return rows
@@ -1,17 +1,28 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, current_app, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, current_app, send_file, g, has_request_context
 from datetime import datetime, timedelta
 import os
 import re
-import sqlite3
 import threading # For thread-safe counter
 import math
+import time
 import uuid # For temp IDs if needed, but not using now
+from normalize_utils import normalize_phone, normalize_aadhaar, normalize_pan
+import db_backend
+import export_utils
+import job_queue
+import batch_documents
+import request_profiler
+import slow_query_log
+import metrics
 app = Flask(__name__)
 # IMPORTANT: For security, never use a hardcoded secret key in a production app.
 app.secret_key = 'your_super_secret_key_for_finvestacore_app'
 app.config['TEMPLATES_AUTO_RELOAD'] = True
-# SQLite DB setup
+# DB setup: SQLite file by default, PostgreSQL when DATABASE_URL is set (see db_backend)
 DB_PATH = 'finvestacore.db'
+db = db_backend.create_backend(os.environ.get('DATABASE_URL'), sqlite_path=DB_PATH)
+# Heavy reports read from a replica (refreshed copy of the SQLite file / REPORT_DATABASE_URL standby)
+report_db = db_backend.create_report_backend(db, os.environ.get('REPORT_DATABASE_URL'))
 LOCK = threading.Lock() # For thread-safe
 
 # New helper function added
@@ -22,13 +33,58 @@ def _round_amount(amount):
 
 
 def get_db_connection():
-    """Get a connection to the SQLite database with timeout and WAL."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row # Allows dict-like access
-    conn.execute("PRAGMA busy_timeout = 5000")  # 5s retry on lock
-    # WAL: Uncomment and run once on startup if not set: conn.execute("PRAGMA journal_mode = WAL")
+    """Get a connection from the configured backend (SQLite file or pooled PostgreSQL).
+
+    Rows allow dict-like access; leaving a `with` block commits (or rolls back) and closes it.
+    """
+    started = time.perf_counter()
+    conn = db.connect()
+    metrics.observe('mfi_db_connect_wait_seconds', time.perf_counter() - started, backend=db.name)
+    return conn
+
+def get_report_connection():
+    """Read-only connection for reports: the replica while it is fresh enough, otherwise the primary.
+
+    `?source=primary` on the request forces the primary. Which one was used and how old its data is
+    are sent back in the X-Report-* headers (see add_report_freshness_headers).
+    """
+    forced = has_request_context() and request.args.get('source') == 'primary'
+    source, age = 'primary', 0.0
+    if report_db is not None and not forced:
+        try:
+            replica_age = report_db.age()
+        except db_backend.DatabaseError as e:
+            app.logger.warning("Report replica unavailable, using primary: %s", e)
+            replica_age = None
+        if replica_age is not None and replica_age <= report_db.max_age:
+            source, age = 'replica', replica_age
+    if has_request_context():
+        g.report_source, g.report_age = source, age
+    metrics.inc('mfi_report_reads_total', source=source)
+    if source == 'primary':
+        return get_db_connection()
+    started = time.perf_counter()
+    conn = report_db.connect()
+    metrics.observe('mfi_db_connect_wait_seconds', time.perf_counter() - started, backend=f"{report_db.name}_replica")
     return conn
 
+@app.after_request
+def add_report_freshness_headers(response):
+    if 'report_source' in g:
+        response.headers['X-Report-Source'] = g.report_source
+        response.headers['X-Report-Age'] = f"{g.report_age:.0f}"
+        response.headers['X-Report-As-Of'] = (datetime.now() - timedelta(seconds=g.report_age)).isoformat(timespec='seconds')
+    return response
+
+# PROFILE_REQUESTS=1: per-request SQL count/time, Server-Timing header, /admin/profile (request_profiler)
+if os.environ.get('PROFILE_REQUESTS') == '1':
+    request_profiler.install(app)
+# Statements slower than SLOW_QUERY_MS (default 250, 0 = off) with their plans -> slow_queries.log
+slow_query_log.install()
+# GET /metrics for Prometheus, summed over all gunicorn workers (metrics; METRICS=0 turns it off)
+if os.environ.get('METRICS') != '0':
+    metrics.install(app)
+
 def init_db():
     """Initialize the database with tables."""
     with get_db_connection() as conn:
@@ -74,7 +130,10 @@ def init_db():
                 nominee_dob TEXT,
                 nominee_age TEXT,
                 nominee_relation TEXT NOT NULL DEFAULT '',
-                guarantor_relation TEXT NOT NULL DEFAULT ''
+                guarantor_relation TEXT NOT NULL DEFAULT '',
+                phone_e164 TEXT,
+                aadhaar_norm TEXT,
+                pan_norm TEXT
             )
         ''')
       
@@ -82,17 +141,24 @@ def init_db():
         columns_to_add = [
             ('education', 'TEXT'),
             ('occupation', 'TEXT'),
-            ('nominee_name', 'TEXT NOT NULL DEFAULT ""'),
+            ('nominee_name', "TEXT NOT NULL DEFAULT ''"),
             ('nominee_dob', 'TEXT'),
             ('nominee_age', 'TEXT'),
-            ('nominee_relation', 'TEXT NOT NULL DEFAULT ""'),
-            ('guarantor_relation', 'TEXT NOT NULL DEFAULT ""')
+            ('nominee_relation', "TEXT NOT NULL DEFAULT ''"),
+            ('guarantor_relation', "TEXT NOT NULL DEFAULT ''"),
+            # Normalized lookup columns (see normalize_utils)
+            ('phone_e164', 'TEXT'),
+            ('aadhaar_norm', 'TEXT'),
+            ('pan_norm', 'TEXT')
         ]
         for col_name, col_type in columns_to_add:
             try:
                 cursor.execute(f'ALTER TABLE members ADD COLUMN {col_name} {col_type}')
-            except sqlite3.OperationalError:
+            except db_backend.OperationalError:
                 pass # Column already exists
+        # Backfill normalized columns for rows saved before they existed, then index them
+        backfill_member_lookup_columns(cursor)
+        create_member_lookup_indexes(cursor)
       
         # Loans table
         cursor.execute('''
@@ -138,7 +204,7 @@ def init_db():
         for col_name, col_type in loan_columns_to_add:
             try:
                 cursor.execute(f'ALTER TABLE loans ADD COLUMN {col_name} {col_type}')
-            except sqlite3.OperationalError:
+            except db_backend.OperationalError:
                 pass # Column already exists
         # Ensure total_paid is 0 for existing loans
         cursor.execute('UPDATE loans SET total_paid = ROUND(0, 2) WHERE total_paid IS NULL')
@@ -246,32 +312,302 @@ def init_db():
                 description TEXT
             )
         ''')
+        create_report_date_indexes(cursor)  # after the tables: a fresh DB has none before this point
+        create_ledger_table(cursor)
+        create_member_summary_table(cursor)
         conn.commit()
+def backfill_member_lookup_columns(cursor):
+    """Fills phone_e164/aadhaar_norm/pan_norm for members that only have raw values."""
+    cursor.execute('''
+        SELECT id, phone_number, aadhaar, pan FROM members
+        WHERE (phone_e164 IS NULL AND phone_number IS NOT NULL)
+           OR (aadhaar_norm IS NULL AND aadhaar IS NOT NULL)
+           OR (pan_norm IS NULL AND pan IS NOT NULL)
+    ''')
+    updates = [
+        (normalize_phone(row[1]), normalize_aadhaar(row[2]), normalize_pan(row[3]), row[0])
+        for row in cursor.fetchall()
+    ]
+    if updates:
+        cursor.executemany(
+            'UPDATE members SET phone_e164 = ?, aadhaar_norm = ?, pan_norm = ? WHERE id = ?', updates
+        )
+
+def create_member_lookup_indexes(cursor):
+    """Unique indexes on the normalized columns (NULLs are allowed to repeat)."""
+    for col_name in ('phone_e164', 'aadhaar_norm', 'pan_norm'):
+        # Savepoint: on PostgreSQL a failed statement would otherwise abort the whole init transaction
+        cursor.execute('SAVEPOINT lookup_index')
+        try:
+            cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS ux_members_{col_name} ON members ({col_name})')
+            cursor.execute('RELEASE SAVEPOINT lookup_index')
+        except db_backend.IntegrityError:
+            cursor.execute('ROLLBACK TO SAVEPOINT lookup_index')
+            cursor.execute('RELEASE SAVEPOINT lookup_index')
+            # Old data already has duplicates in canonical form (e.g. '98765 43210' and '+919876543210').
+            # Keep lookups fast with a plain index until the duplicates are merged by hand.
+            app.logger.warning(f"Duplicate {col_name} values in members; created non-unique index instead")
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS ix_members_{col_name} ON members ({col_name})')
+
+def create_report_date_indexes(cursor):
+    """Date indexes for the range reports, so a month partition (parallel_reports) reads only its rows."""
+    for table, col_name in (('payments', 'pay_date'), ('transactions', 'pay_date'), ('loans', 'loan_date'),
+                            ('fees', 'fee_date'), ('expenses', 'date')):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS ix_{table}_{col_name} ON {table} ({col_name})')
+
+# ---------------------------------------------------------------------------
+# Ledger projection: one row per ledger line with the outstanding after it, so member
+# statements are a range scan on (member_id, date) instead of a UNION + sort per request.
+# Rebuilt per member inside every write that touches loans/transactions (a member has few
+# loans), which also keeps back-dated payments and deleted EMIs right.
+# ---------------------------------------------------------------------------
+
+LEDGER_SOURCE_SQL = """
+    SELECT l.member_id, l.loan_id, l.loan_date as date, 'loan_disbursed' as type,
+           'Loan Sanctioned - Total Repayable' as description,
+           CASE
+               WHEN l.repayment_type = 'monthly' THEN l.emi * COALESCE(l.tenure_months, 0)
+               WHEN l.repayment_type = 'daily' THEN l.emi * COALESCE(l.tenure_days, 120)
+               ELSE l.amount
+           END as amount,
+           0 as kind, NULL as source_id
+    FROM loans l
+    WHERE l.member_id IS NOT NULL AND l.loan_date IS NOT NULL {member_filter}
+    UNION ALL
+    SELECT l.member_id, t.loan_id, t.pay_date as date, t.type as type,
+           CASE
+               WHEN t.type = 'emi' THEN 'EMI Payment'
+               WHEN t.type = 'advance' THEN 'Advance Payment'
+               WHEN t.type = 'penalty' THEN 'Penalty Added'
+               ELSE 'Other Payment'
+           END as description,
+           t.amount as amount,
+           1 as kind, t.id as source_id
+    FROM transactions t
+    JOIN loans l ON t.loan_id = l.loan_id
+    WHERE l.member_id IS NOT NULL AND t.type IN ('emi', 'advance', 'penalty') {member_filter}
+"""
+
+# delta: effect on the outstanding (+ disbursed / penalty, - EMI / advance); balances are running sums
+# (CAST AS NUMERIC: Postgres has ROUND(numeric, int) only, not ROUND(double precision, int))
+LEDGER_INSERT_SQL = """
+    INSERT INTO ledger_entries (member_id, loan_id, date, type, description, amount, delta,
+                                loan_balance, balance, source_id)
+    SELECT member_id, loan_id, date, type, description, amount, delta,
+           ROUND(CAST(SUM(delta) OVER (PARTITION BY loan_id ORDER BY date, kind, source_id
+                                       ROWS UNBOUNDED PRECEDING) AS NUMERIC), 2),
+           ROUND(CAST(SUM(delta) OVER (PARTITION BY member_id ORDER BY date, kind, source_id, loan_id
+                                       ROWS UNBOUNDED PRECEDING) AS NUMERIC), 2),
+           source_id
+    FROM (
+        SELECT s.*, CASE WHEN s.type IN ('loan_disbursed', 'penalty') THEN s.amount ELSE -s.amount END as delta
+        FROM (
+            SELECT member_id, loan_id, date, type, description, COALESCE(amount, 0) as amount, kind, source_id
+            FROM ({source}) src
+        ) s
+    ) lines
+    ORDER BY member_id, date, kind, source_id, loan_id
+"""
+
+def create_ledger_table(cursor):
+    """ledger_entries + its indexes; filled from loans/transactions the first time."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            member_id TEXT NOT NULL,
+            loan_id TEXT NOT NULL,
+            date TEXT,
+            type TEXT,
+            description TEXT,
+            amount REAL,
+            delta REAL,
+            loan_balance REAL,
+            balance REAL,
+            source_id INTEGER
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_ledger_entries_member_date ON ledger_entries (member_id, date, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_ledger_entries_loan ON ledger_entries (loan_id, id)')
+    cursor.execute('SELECT 1 FROM ledger_entries LIMIT 1')
+    if cursor.fetchone() is None:
+        rebuild_ledger(cursor)
+
+def rebuild_ledger(cursor):
+    """Recomputes ledger_entries for every member (first start, or after editing the DB by hand)."""
+    cursor.execute('DELETE FROM ledger_entries')
+    cursor.execute(LEDGER_INSERT_SQL.format(source=LEDGER_SOURCE_SQL.format(member_filter='')))
+
+def refresh_member_ledger(cursor, member_id):
+    """Recomputes one member's ledger lines; call in the same transaction as the write."""
+    if not member_id:
+        return
+    cursor.execute('DELETE FROM ledger_entries WHERE member_id = ?', (member_id,))
+    cursor.execute(LEDGER_INSERT_SQL.format(source=LEDGER_SOURCE_SQL.format(member_filter='AND l.member_id = ?')),
+                   (member_id, member_id))
+
+# ---------------------------------------------------------------------------
+# Member summary projection ("member 360"): one row per member with name/father/phone and the
+# current loan (the active one, else the latest) with EMI, paid, due, next due date and last
+# payment. Refreshed in the same transaction as every member/loan/payment write, so pages read
+# member + loan in one primary-key lookup. DPD moves with the calendar: the row keeps
+# next_due_date and readers turn it into days (member_summary_fields).
+# ---------------------------------------------------------------------------
+
+MEMBER_SUMMARY_COLUMNS = ('member_id', 'full_name', 'father_name', 'phone_number', 'phone_e164', 'loan_id',
+                          'loan_status', 'loan_date', 'loan_amount', 'emi', 'total_paid', 'due_amount',
+                          'next_due_date', 'last_payment_date', 'last_payment_amount', 'updated_at')
+
+MEMBER_SUMMARY_SOURCE_SQL = """
+    SELECT m.id as member_id, m.full_name, m.father_name, m.phone_number, m.phone_e164,
+           l.loan_id, l.status as loan_status, l.loan_date, l.amount as loan_amount, l.emi, l.total_paid,
+           l.due_amount, l.repayment_type, l.emi_start_date, l.tenure_months, l.tenure_days,
+           lp.pay_date as last_payment_date, lp.amount as last_payment_amount
+    FROM members m
+    LEFT JOIN loans l ON l.loan_id = (
+        SELECT cl.loan_id FROM loans cl WHERE cl.member_id = m.id
+        ORDER BY CASE WHEN cl.status = 'Active' THEN 0 ELSE 1 END, cl.loan_date DESC, cl.loan_id DESC
+        LIMIT 1
+    )
+    LEFT JOIN transactions lp ON lp.id = (
+        SELECT t.id FROM transactions t WHERE t.loan_id = l.loan_id AND t.type IN ('emi', 'advance')
+        ORDER BY t.pay_date DESC, t.id DESC
+        LIMIT 1
+    )
+    {member_filter}
+"""
+
+def create_member_summary_table(cursor):
+    """member_summary + its lookup indexes; filled from members/loans/transactions the first time."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS member_summary (
+            member_id TEXT PRIMARY KEY,
+            full_name TEXT,
+            father_name TEXT,
+            phone_number TEXT,
+            phone_e164 TEXT,
+            loan_id TEXT,
+            loan_status TEXT,
+            loan_date TEXT,
+            loan_amount REAL,
+            emi REAL,
+            total_paid REAL,
+            due_amount REAL,
+            next_due_date TEXT,
+            last_payment_date TEXT,
+            last_payment_amount REAL,
+            updated_at TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_member_summary_phone ON member_summary (phone_e164)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_member_summary_loan ON member_summary (loan_id)')
+    # The refresh picks the member's current loan and its last payment through these
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_loans_member_id ON loans (member_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_transactions_loan_date ON transactions (loan_id, pay_date)')
+    cursor.execute('SELECT 1 FROM member_summary LIMIT 1')
+    if cursor.fetchone() is None:
+        rebuild_member_summary(cursor)
+
+def _write_member_summary(cursor, rows):
+    updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    values = []
+    for row in rows:
+        summary = dict(row)
+        due = batch_documents.next_due_date(summary) if summary['loan_status'] == 'Active' else None
+        summary['next_due_date'] = due.isoformat() if due else None
+        summary['updated_at'] = updated_at
+        values.append(tuple(summary[col] for col in MEMBER_SUMMARY_COLUMNS))
+    if values:
+        cursor.executemany(f"INSERT INTO member_summary ({', '.join(MEMBER_SUMMARY_COLUMNS)}) "
+                           f"VALUES ({', '.join('?' * len(MEMBER_SUMMARY_COLUMNS))})", values)
+
+def rebuild_member_summary(cursor):
+    """Recomputes member_summary for every member (first start, or after editing the DB by hand)."""
+    cursor.execute('DELETE FROM member_summary')
+    cursor.execute(MEMBER_SUMMARY_SOURCE_SQL.format(member_filter=''))
+    _write_member_summary(cursor, cursor.fetchall())
+
+def refresh_member_summary(cursor, member_id):
+    """Recomputes one member's summary row (none left if the member is gone); call in the write's transaction."""
+    if not member_id:
+        return
+    cursor.execute('DELETE FROM member_summary WHERE member_id = ?', (member_id,))
+    cursor.execute(MEMBER_SUMMARY_SOURCE_SQL.format(member_filter='WHERE m.id = ?'), (member_id,))
+    _write_member_summary(cursor, cursor.fetchall())
+
 # Initialize DB on startup
 init_db()
+# Not in multiprocessing children: parallel_reports' spawned workers re-import the main script
+if __name__ != '__mp_main__':
+    if report_db is not None:
+        try:
+            report_db.start()
+        except db_backend.DatabaseError as e:
+            app.logger.warning("Report replica disabled: %s", e)
+            report_db = None
+    # Background report jobs (jobs.db); JOB_WORKER=external when `python job_queue.py worker` runs separately
+    job_queue.init_jobs_db()
+    if os.environ.get('JOB_WORKER', 'thread') == 'thread':
+        job_queue.start_worker_thread()
 # --- Utility Functions ---
-def get_next_member_id():
-    """Generates the next sequential ID in 'M0001' format using a transaction."""
+def _next_counter_value(cursor, name):
+    """Increments counters.<name> on the caller's cursor and returns the new value.
+
+    UPDATE first: the row lock it takes serializes concurrent allocations on PostgreSQL too.
+    """
+    cursor.execute('UPDATE counters SET last_id = last_id + 1 WHERE name = ?', (name,))
+    cursor.execute('SELECT last_id FROM counters WHERE name = ?', (name,))
+    result = cursor.fetchone()
+    return result[0] if result else 1
+def get_next_member_id(cursor=None):
+    """Generates the next sequential ID in 'M0001' format using a transaction.
+
+    Pass the cursor of an open write transaction to allocate the ID inside it.
+    """
+    if cursor is not None:
+        return f"M{_next_counter_value(cursor, 'members'):04d}"
     with LOCK: # Thread-safe
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT last_id FROM counters WHERE name = ?', ('members',))
-            result = cursor.fetchone()
-            last_id = result[0] if result else 0
-            new_id_num = last_id + 1
-            cursor.execute('UPDATE counters SET last_id = ? WHERE name = ?', (new_id_num, 'members'))
+            new_id_num = _next_counter_value(cursor, 'members')
             conn.commit()
             return f"M{new_id_num:04d}"
+def find_member_duplicate(cursor, phone_e164, aadhaar_norm, pan_norm, exclude_id=''):
+    """One indexed probe over the normalized columns.
+
+    Returns 'Phone Number', 'Aadhaar Number' or 'PAN Number' for the first clash, else None.
+    """
+    cursor.execute('''
+        SELECT phone_e164 = ? AS phone_dup, aadhaar_norm = ? AS aadhaar_dup, pan_norm = ? AS pan_dup
+        FROM members
+        WHERE (phone_e164 = ? OR aadhaar_norm = ? OR pan_norm = ?) AND id != ?
+        LIMIT 1
+    ''', (phone_e164, aadhaar_norm, pan_norm, phone_e164, aadhaar_norm, pan_norm, exclude_id))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    if row['phone_dup']:
+        return 'Phone Number'
+    if row['aadhaar_dup']:
+        return 'Aadhaar Number'
+    return 'PAN Number'
+def _duplicate_field_from_error(error):
+    """Maps a UNIQUE constraint failure on members to the field label (None for other errors)."""
+    message = str(error).lower() # SQLite: "UNIQUE constraint failed", Postgres: "violates unique constraint"
+    if 'unique' not in message:
+        return None
+    if 'phone' in message:
+        return 'Phone Number'
+    if 'aadhaar' in message:
+        return 'Aadhaar Number'
+    if 'pan' in message:
+        return 'PAN Number'
+    return 'Member ID'
 def get_next_loan_id():
     """Generates the next sequential ID in 'PL0001' format using a transaction."""
     with LOCK: # Thread-safe
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT last_id FROM counters WHERE name = ?', ('loans',))
-            result = cursor.fetchone()
-            last_id = result[0] if result else 0
-            new_id_num = last_id + 1
-            cursor.execute('UPDATE counters SET last_id = ? WHERE name = ?', (new_id_num, 'loans'))
+            new_id_num = _next_counter_value(cursor, 'loans')
             conn.commit()
             return f"PL{new_id_num:04d}"
 def calculate_age(dob_str):
@@ -393,7 +729,11 @@ def record_emi_payment(member_id, pay_date, payment_mode, emi_amount):
             """, (datetime.now().strftime('%Y-%m-%d'), loan_id))
             print(f"✅ Loan {loan_id} auto-closed")
         
+        refresh_member_ledger(cur, member_id)
+        refresh_member_summary(cur, member_id)
         conn.commit()
+        metrics.inc('mfi_emis_posted_total')
+        metrics.inc('mfi_emi_amount_rupees_total', emi_amount)
         
         return True, {
             'name': member_name,
@@ -402,7 +742,7 @@ def record_emi_payment(member_id, pay_date, payment_mode, emi_amount):
             'total_paid': round(new_total_paid, 2)
         }
         
-    except sqlite3.OperationalError as e:
+    except db_backend.OperationalError as e:
         conn.rollback()
         if 'database is locked' in str(e).lower():
             return False, 'Database locked. Please try again in a moment.'
@@ -467,7 +807,10 @@ def record_advance_payment(loan_id, pay_date, payment_mode, advance_amount):
             """, (loan_id,))
             data = cur.fetchone()
           
+            refresh_member_ledger(cur, member_id)
+            refresh_member_summary(cur, member_id)
             conn.commit()
+            metrics.inc('mfi_advance_payments_total')
             return True, dict(data)
         except Exception as e:
             conn.rollback()
@@ -481,9 +824,49 @@ def get_loan_by_id(loan_id):
         if row:
             return dict(row)
     return None
+def member_summary_fields(row, as_of=None):
+    """A member_summary row as a dict, with dpd (days past next_due_date) as of today."""
+    summary = dict(row)
+    as_of = as_of or datetime.now().date()
+    due = summary.get('next_due_date')
+    summary['dpd'] = max(0, (as_of - datetime.strptime(due, '%Y-%m-%d').date()).days) if due else 0
+    return summary
+def get_member_summary(cursor, member_id):
+    cursor.execute('SELECT * FROM member_summary WHERE member_id = ?', (member_id,))
+    row = cursor.fetchone()
+    return member_summary_fields(row) if row else None
+def get_loan_summary(loan_id, cursor=None):
+    """
+    get_loan_by_id plus the member's name, father name and phone (member_summary) in one read.
+    next_due_date / dpd / last payment come from the projection when this is the member's current
+    loan, else from the loan row itself.
+    """
+    if cursor is None:
+        with get_db_connection() as conn:
+            return get_loan_summary(loan_id, conn.cursor())
+    cursor.execute("""
+        SELECT l.*, s.full_name as member_name, s.father_name, s.phone_number as mobile,
+               s.loan_id as summary_loan_id, s.next_due_date, s.last_payment_date, s.last_payment_amount
+        FROM loans l
+        LEFT JOIN member_summary s ON s.member_id = l.member_id
+        WHERE l.loan_id = ?
+    """, (loan_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    loan = dict(row)
+    if loan.pop('summary_loan_id') != loan['loan_id']:
+        due = batch_documents.next_due_date(loan) if loan['status'] == 'Active' else None
+        loan['next_due_date'] = due.isoformat() if due else None
+        loan['last_payment_date'] = loan['last_payment_amount'] = None
+    return member_summary_fields(loan)
 def get_active_members_report(report_date_str):
     """Fetch active members EMI due report till given date"""
-    with get_db_connection() as conn:
+    return list(iter_active_members_report(report_date_str))
+
+def iter_active_members_report(report_date_str):
+    """EMI due rows one at a time, straight off the cursor (used by the streaming exports)"""
+    with get_report_connection() as conn:
         cursor = conn.cursor()
         report_date = datetime.strptime(report_date_str, '%Y-%m-%d').date()
       
@@ -495,10 +878,8 @@ def get_active_members_report(report_date_str):
             JOIN members m ON l.member_id = m.id
             WHERE l.status = 'Active' AND l.emi_start_date <= ?
         """, (report_date_str,))
-        rows = cursor.fetchall()
       
-        report_data = []
-        for row in rows:
+        for row in export_utils.iter_cursor(cursor):
             loan = dict(row)
             start_date = datetime.strptime(loan['emi_start_date'], '%Y-%m-%d').date()
           
@@ -521,7 +902,7 @@ def get_active_members_report(report_date_str):
             paid_emis_approx = (loan['total_paid'] or 0) / loan['emi_amount']
             due_emi_count = max(0, total_tenure - round(paid_emis_approx))
           
-            report_data.append({
+            yield {
                 'loan_id': loan['loan_id'],
                 'member_name': loan['member_name'],
                 'mobile_no': loan['mobile_no'] or 'N/A',
@@ -531,13 +912,11 @@ def get_active_members_report(report_date_str):
                 'due_till_date': round(due_till_date, 2),
                 'total_due': loan['total_due'] or 0,
                 'due_emi_count': due_emi_count # NEW COLUMN
-            })
-      
-        return report_data
+            }
   
 def get_loan_dispatch_report(from_date_str, to_date_str):
     """Fetch loans dispatched between dates"""
-    with get_db_connection() as conn:
+    with get_report_connection() as conn:
         cursor = conn.cursor()
         # Fixed query to match schema
         cursor.execute("""
@@ -574,62 +953,58 @@ def get_member_info(member_id):
     
 def fetch_member_ledger_data(member_id, from_date_str, to_date_str):
     """Fetch member's ledger transactions between dates - NOW INCLUDES PENALTY"""
+    return list(iter_member_ledger_data(member_id, from_date_str, to_date_str))
+
+def iter_member_ledger_data(member_id, from_date_str, to_date_str):
+    """Ledger rows one at a time, straight off the cursor (ledger_entries range scan)"""
     try:
-        with get_db_connection() as conn:
+        with get_report_connection() as conn:
+            cursor = conn.cursor()
+            yield from _iter_ledger_lines(cursor, member_id, from_date_str, to_date_str)
+    except Exception as e:
+        raise ValueError(f"Ledger fetch error: {str(e)}")
+
+def _iter_ledger_lines(cursor, member_id, from_date_str, to_date_str):
+    # Disbursals, EMI / advance payments and penalties, each with the member's outstanding after it
+    cursor.execute("""
+        SELECT date, type, description, amount, loan_id, balance
+        FROM ledger_entries
+        WHERE member_id = ? AND date BETWEEN ? AND ?
+        ORDER BY date, id
+    """, (member_id, from_date_str, to_date_str))
+    for row in export_utils.iter_cursor(cursor):
+        yield {
+            'date': row[0],
+            'type': row[1],
+            'description': row[2],
+            'amount': float(row[3] or 0),
+            'loan_id': row[4],
+            'balance': float(row[5] or 0)
+        }
+
+def get_member_statement(member_id, from_date_str, to_date_str):
+    """Opening balance, ledger lines and closing balance (outstanding on all the member's loans)."""
+    try:
+        with get_report_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                -- 1. Loan Disbursed Entry
-                SELECT
-                    l.loan_date as date,
-                    'loan_disbursed' as type,
-                    'Loan Sanctioned - Total Repayable' as description,
-                    CASE
-                        WHEN l.repayment_type = 'monthly' THEN l.emi * COALESCE(l.tenure_months, 0)
-                        WHEN l.repayment_type = 'daily' THEN l.emi * COALESCE(l.tenure_days, 120)
-                        ELSE l.amount
-                    END as amount
-                FROM loans l
-                WHERE l.member_id = ? AND l.loan_date BETWEEN ? AND ?
-
-                UNION ALL
-
-                -- 2. All Payments: EMI, Advance, and PENALTY
-                SELECT
-                    t.pay_date as date,
-                    t.type as type,
-                    CASE
-                        WHEN t.type = 'emi' THEN 'EMI Payment'
-                        WHEN t.type = 'advance' THEN 'Advance Payment'
-                        WHEN t.type = 'penalty' THEN 'Penalty Added'
-                        ELSE 'Other Payment'
-                    END as description,
-                    t.amount as amount
-                FROM transactions t
-                JOIN loans l ON t.loan_id = l.loan_id
-                WHERE l.member_id = ?
-                  AND t.type IN ('emi', 'advance', 'penalty')
-                  AND t.pay_date BETWEEN ? AND ?
-
-                ORDER BY date ASC
-            """, (
-                member_id, from_date_str, to_date_str,
-                member_id, from_date_str, to_date_str
-            ))
-            
-            rows = cursor.fetchall()
-         
-            ledger_data = []
-            for row in rows:
-                amount = float(row[3] or 0)
-                ledger_data.append({
-                    'date': row[0],
-                    'type': row[1],
-                    'description': row[2],
-                    'amount': amount
-                })
-            return ledger_data
+                SELECT balance FROM ledger_entries
+                WHERE member_id = ? AND date < ?
+                ORDER BY date DESC, id DESC LIMIT 1
+            """, (member_id, from_date_str))
+            row = cursor.fetchone()
+            opening_balance = float(row[0]) if row else 0.0
+            lines = list(_iter_ledger_lines(cursor, member_id, from_date_str, to_date_str))
     except Exception as e:
         raise ValueError(f"Ledger fetch error: {str(e)}")
+    return {
+        'member_id': member_id,
+        'from_date': from_date_str,
+        'to_date': to_date_str,
+        'opening_balance': opening_balance,
+        'lines': lines,
+        'closing_balance': lines[-1]['balance'] if lines else opening_balance
+    }
     
 def get_pnl_report_data(from_date_str, to_date_str):
     """Calculate P&L - FIXED: No interest_paid (always 0), add totals"""
@@ -639,7 +1014,7 @@ def get_pnl_report_data(from_date_str, to_date_str):
     except ValueError:
         raise ValueError("Invalid date format: Use YYYY-MM-DD")
  
-    with get_db_connection() as conn:
+    with get_report_connection() as conn:
         cursor = conn.cursor()
      
         # Interest income (from emi interest_amount - now correct)
@@ -672,7 +1047,7 @@ def get_pnl_report_data(from_date_str, to_date_str):
         net_profit = total_income - total_expenses
      
         # Debug
-        print(f"DEBUG P&L ({from_date_str} to {to_date_str}): Income={total_income}, Expenses={total_expenses}, Net={net_profit}")
+        app.logger.debug("P&L (%s to %s): Income=%s, Expenses=%s, Net=%s", from_date_str, to_date_str, total_income, total_expenses, net_profit)
      
         return {
             'interest_income': interest_income,
@@ -686,7 +1061,11 @@ def get_pnl_report_data(from_date_str, to_date_str):
       
 def fetch_loan_dispatch_report_data(from_date_str, to_date_str): # Renamed!
     """Fetch loans dispatched between dates"""
-    with get_db_connection() as conn:
+    return list(iter_loan_dispatch_report_data(from_date_str, to_date_str))
+
+def iter_loan_dispatch_report_data(from_date_str, to_date_str):
+    """Dispatch report rows one at a time, straight off the cursor"""
+    with get_report_connection() as conn:
         cursor = conn.cursor()
         # Fixed query to match schema
         cursor.execute("""
@@ -697,17 +1076,14 @@ def fetch_loan_dispatch_report_data(from_date_str, to_date_str): # Renamed!
             WHERE l.loan_date BETWEEN ? AND ?
             ORDER BY l.loan_date
         """, (from_date_str, to_date_str))
-        rows = cursor.fetchall()
         # Removed conn.close() - with statement handles it
       
-        report_data = []
-        for row in rows:
-            report_data.append({
+        for row in export_utils.iter_cursor(cursor):
+            yield {
                 'loan_id': row['loan_id'], 'member_name': row['member_name'], 'mobile_no': row['mobile_no'] or 'N/A',
                 'loan_amount': row['loan_amount'], 'loan_date': row['loan_date'], 'loan_closed_date': row['loan_closed_date'] or '',
                 'total_paid': row['total_paid'] or 0
-            })
-        return report_data
+            }
 def _format_currency(amount: float) -> str:
     return f"₹{amount:,.2f}"
 def _parse_loan_id(loan_id_str: str) -> int:
@@ -725,7 +1101,7 @@ def _parse_loan_id(loan_id_str: str) -> int:
         raise ValueError(f"Invalid loan ID format: '{loan_id_str}'. Expected PLXXXX.")
 def get_bank_report_data(report_date_str):
     """Calculate updated cash in hand and bank balance up to date - FIXED: Include advance/penalty in cash inflows"""
-    with get_db_connection() as conn:
+    with get_report_connection() as conn:
         cursor = conn.cursor()
      
         # FIXED: Cash Inflows - EMI + Advance + Penalty (all positive cash payments)
@@ -779,19 +1155,19 @@ def get_bank_report_data(report_date_str):
         bank_balance = max(0, bank_balance)
      
         # Debug log
-        print(f"DEBUG Bank Report ({report_date_str}): Cash Inflows=₹{cash_inflows}, Loan Cash Out=₹{loan_cash}, Deposited=₹{cash_deposited}, Cash in Hand=₹{cash_in_hand}")
-        print(f"Bank: UPI Inflows=₹{upi_inflows}, Investments=₹{total_investments}, Bank Loans=₹{loan_neft_imps}, Balance=₹{bank_balance}")
+        app.logger.debug("Bank Report (%s): Cash Inflows=₹%s, Loan Cash Out=₹%s, Deposited=₹%s, Cash in Hand=₹%s", report_date_str, cash_inflows, loan_cash, cash_deposited, cash_in_hand)
+        app.logger.debug("Bank (%s): UPI Inflows=₹%s, Investments=₹%s, Bank Loans=₹%s, Balance=₹%s", report_date_str, upi_inflows, total_investments, loan_neft_imps, bank_balance)
      
         return {'cash_in_hand': cash_in_hand, 'bank_balance': bank_balance}
       
 def add_payment_mode_column():
-    conn = sqlite3.connect('finvestacore.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("ALTER TABLE investments ADD COLUMN payment_mode TEXT DEFAULT 'UPI'")
         conn.commit()
         print("Payment_mode column added successfully!")
-    except sqlite3.OperationalError as e:
+    except db_backend.OperationalError as e:
         if "duplicate column name" in str(e):
             print("Column already exists!")
         else:
@@ -853,7 +1229,10 @@ def add_penalty_to_loan(loan_id, penalty_amount, penalty_date, description, paym
             """, (loan_id,))
             data = cur.fetchone()
 
+            refresh_member_ledger(cur, member_id)
+            refresh_member_summary(cur, member_id)
             conn.commit()
+            metrics.inc('mfi_penalties_added_total')
             return True, dict(data)
 
         except Exception as e:
@@ -906,31 +1285,23 @@ def dashboard():
         cursor.execute('SELECT COUNT(*) FROM members')
         member_count = cursor.fetchone()[0]
       
-        cursor.execute('SELECT COALESCE(SUM(amount), 0) FROM loans WHERE status = "Active"')
+        cursor.execute("SELECT COALESCE(SUM(amount), 0) FROM loans WHERE status = 'Active'")
         active_loans = cursor.fetchone()[0] or 0
       
         today = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute('SELECT COALESCE(SUM(amount), 0) FROM payments WHERE type="emi" AND pay_date = ?', (today,))
+        cursor.execute("SELECT COALESCE(SUM(amount), 0) FROM payments WHERE type = 'emi' AND pay_date = ?", (today,))
         todays_collection = cursor.fetchone()[0] or 0
       
-        # Simple monthly growth
-        cursor.execute("""
-            SELECT
-                CASE
-                    WHEN prev.count > 0 THEN (curr.count - prev.count) * 100.0 / prev.count
-                    ELSE 0
-                END as growth_pct
-            FROM (
-                SELECT COUNT(*) as count FROM members
-                WHERE strftime('%Y-%m', date_joined) = strftime('%Y-%m', date('now'))
-            ) curr
-            LEFT JOIN (
-                SELECT COUNT(*) as count FROM members
-                WHERE strftime('%Y-%m', date_joined) = strftime('%Y-%m', date('now', '-1 month'))
-            ) prev
-        """)
-        result = cursor.fetchone()
-        monthly_growth = result[0] if result and result[0] is not None else 0
+        # Simple monthly growth (month bounds computed here: date_joined is 'YYYY-MM-DD' text on both backends)
+        month_start = datetime.now().replace(day=1)
+        prev_month_start = (month_start - timedelta(days=1)).replace(day=1)
+        next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+        joined_in_month = 'SELECT COUNT(*) FROM members WHERE date_joined >= ? AND date_joined < ?'
+        cursor.execute(joined_in_month, (month_start.strftime('%Y-%m-%d'), next_month_start.strftime('%Y-%m-%d')))
+        curr_count = cursor.fetchone()[0]
+        cursor.execute(joined_in_month, (prev_month_start.strftime('%Y-%m-%d'), month_start.strftime('%Y-%m-%d')))
+        prev_count = cursor.fetchone()[0]
+        monthly_growth = (curr_count - prev_count) * 100.0 / prev_count if prev_count > 0 else 0
   
     return render_template('index.html',
                           member_count=member_count,
@@ -1002,27 +1373,13 @@ def add_member():
             # REMOVED: Guarantor Relation validation - now optional
             # Compute nominee_age
             nominee_age = calculate_age(nominee_dob)
-            # --- 3. Check for duplicates ---
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT 1 FROM members WHERE phone_number = ? AND id != ?', (phone_number, ''))
-                if cursor.fetchone():
-                    raise ValueError("Error: A member with this **Phone Number** already exists.")
-                if aadhaar:
-                    cursor.execute('SELECT 1 FROM members WHERE aadhaar = ? AND id != ?', (aadhaar, ''))
-                    if cursor.fetchone():
-                        raise ValueError("Error: A member with this **Aadhaar Number** already exists.")
-                if pan:
-                    cursor.execute('SELECT 1 FROM members WHERE pan = ? AND id != ?', (pan, ''))
-                    if cursor.fetchone():
-                        raise ValueError("Error: A member with this **PAN Number** already exists.")
+            phone_e164 = normalize_phone(phone_number)
+            aadhaar_norm = normalize_aadhaar(aadhaar)
+            pan_norm = normalize_pan(pan)
           
-            # Generate next ID
-            new_member_id = get_next_member_id()
-          
-            # Prepare data
+            # Prepare data (id is allocated inside the insert transaction below)
             data = {
-                'id': new_member_id,
+                'id': None,
                 'date_joined': datetime.now().strftime('%Y-%m-%d'),
                 'full_name': full_name,
                 'father_name': father_name,
@@ -1050,20 +1407,38 @@ def add_member():
                 'nominee_dob': nominee_dob,
                 'nominee_age': nominee_age,
                 'nominee_relation': nominee_relation,
-                'guarantor_relation': guarantor_relation
+                'guarantor_relation': guarantor_relation,
+                'phone_e164': phone_e164,
+                'aadhaar_norm': aadhaar_norm,
+                'pan_norm': pan_norm
             }
           
-            # Insert
+            # --- 3. Duplicate check + ID + insert in one write transaction ---
             with get_db_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO members
-                    (id, date_joined, full_name, father_name, gender, dob, marital_status, spouse_name,
-                     phone_number, address, pincode, district, state, aadhaar, pan, ifsc, account_number,
-                     bank_branch, bank_address, guarantor_name, guarantor_mobile, guarantor_address,
-                     education, occupation, nominee_name, nominee_dob, nominee_age, nominee_relation, guarantor_relation)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', tuple(data.values()))
+                cursor.execute("BEGIN IMMEDIATE")
+                duplicate = find_member_duplicate(cursor, phone_e164, aadhaar_norm, pan_norm)
+                if duplicate:
+                    raise ValueError(f"Error: A member with this **{duplicate}** already exists.")
+                new_member_id = get_next_member_id(cursor)
+                data['id'] = new_member_id
+                try:
+                    cursor.execute('''
+                        INSERT INTO members
+                        (id, date_joined, full_name, father_name, gender, dob, marital_status, spouse_name,
+                         phone_number, address, pincode, district, state, aadhaar, pan, ifsc, account_number,
+                         bank_branch, bank_address, guarantor_name, guarantor_mobile, guarantor_address,
+                         education, occupation, nominee_name, nominee_dob, nominee_age, nominee_relation, guarantor_relation,
+                         phone_e164, aadhaar_norm, pan_norm)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', tuple(data.values()))
+                except db_backend.IntegrityError as e:
+                    # Raw-column UNIQUE constraints (phone_number/aadhaar/pan) still apply
+                    field = _duplicate_field_from_error(e)
+                    if not field:
+                        raise
+                    raise ValueError(f"Error: A member with this **{field}** already exists.")
+                refresh_member_summary(cursor, new_member_id)
                 conn.commit()
           
             flash(f'Member **{full_name}** added successfully with ID: **{new_member_id}**', 'success')
@@ -1134,36 +1509,37 @@ def edit_member(id):
             # REMOVED: Guarantor Relation validation - now optional
             # Compute nominee_age
             nominee_age = calculate_age(nominee_dob)
-            # Duplicates check (exclude id)
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT 1 FROM members WHERE phone_number = ? AND id != ?', (phone_number, id))
-                if cursor.fetchone():
-                    raise ValueError("Phone Number already exists.")
-                if aadhaar:
-                    cursor.execute('SELECT 1 FROM members WHERE aadhaar = ? AND id != ?', (aadhaar, id))
-                    if cursor.fetchone():
-                        raise ValueError("Aadhaar already exists.")
-                if pan:
-                    cursor.execute('SELECT 1 FROM members WHERE pan = ? AND id != ?', (pan, id))
-                    if cursor.fetchone():
-                        raise ValueError("PAN already exists.")
-            # Update
+            phone_e164 = normalize_phone(phone_number)
+            aadhaar_norm = normalize_aadhaar(aadhaar)
+            pan_norm = normalize_pan(pan)
+            # Duplicates check (exclude id) + update in one write transaction
             with get_db_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE members SET full_name=?, father_name=?, gender=?, dob=?, marital_status=?, spouse_name=?,
-                    phone_number=?, address=?, pincode=?, district=?, state=?, aadhaar=?, pan=?, ifsc=?, account_number=?,
-                    bank_branch=?, bank_address=?, guarantor_name=?, guarantor_mobile=?, guarantor_address=?,
-                    education=?, occupation=?, nominee_name=?, nominee_dob=?, nominee_age=?, nominee_relation=?, guarantor_relation=?
-                    WHERE id=?
-                ''', (full_name, father_name, gender, dob, marital_status, spouse_name, phone_number, address, pincode,
-                      district, state, aadhaar, pan, ifsc, account_number, bank_branch, bank_address, guarantor_name,
-                      guarantor_mobile, guarantor_address, education, occupation, nominee_name, nominee_dob, nominee_age,
-                      nominee_relation, guarantor_relation, id))
-                conn.commit()
+                cursor.execute("BEGIN IMMEDIATE")
+                duplicate = find_member_duplicate(cursor, phone_e164, aadhaar_norm, pan_norm, exclude_id=id)
+                if duplicate:
+                    raise ValueError(f"{duplicate} already exists.")
+                try:
+                    cursor.execute('''
+                        UPDATE members SET full_name=?, father_name=?, gender=?, dob=?, marital_status=?, spouse_name=?,
+                        phone_number=?, address=?, pincode=?, district=?, state=?, aadhaar=?, pan=?, ifsc=?, account_number=?,
+                        bank_branch=?, bank_address=?, guarantor_name=?, guarantor_mobile=?, guarantor_address=?,
+                        education=?, occupation=?, nominee_name=?, nominee_dob=?, nominee_age=?, nominee_relation=?, guarantor_relation=?,
+                        phone_e164=?, aadhaar_norm=?, pan_norm=?
+                        WHERE id=?
+                    ''', (full_name, father_name, gender, dob, marital_status, spouse_name, phone_number, address, pincode,
+                          district, state, aadhaar, pan, ifsc, account_number, bank_branch, bank_address, guarantor_name,
+                          guarantor_mobile, guarantor_address, education, occupation, nominee_name, nominee_dob, nominee_age,
+                          nominee_relation, guarantor_relation, phone_e164, aadhaar_norm, pan_norm, id))
+                except db_backend.IntegrityError as e:
+                    field = _duplicate_field_from_error(e)
+                    if not field:
+                        raise
+                    raise ValueError(f"{field} already exists.")
                 if cursor.rowcount == 0:
                     raise ValueError("Member not found.")
+                refresh_member_summary(cursor, id)
+                conn.commit()
             flash(f'Member **{full_name}** updated successfully!', 'success')
             return redirect(url_for('member_details'))
         except ValueError as e:
@@ -1211,8 +1587,10 @@ def delete_member(id):
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM members WHERE id = ?', (id,))
+            deleted = cursor.rowcount
+            refresh_member_summary(cursor, id)
             conn.commit()
-            if cursor.rowcount > 0:
+            if deleted > 0:
                 flash(f'Member {id} deleted.', 'success')
             else:
                 flash(f'Member {id} not found.', 'error')
@@ -1332,8 +1710,12 @@ def add_loan():
                 INSERT INTO payments (member_id, loan_id, type, amount, pay_date, payment_mode)
                 VALUES (?, ?, 'loan_disbursed', -?, ?, ?)
             """, (member_id, loan_id, amount, loan_date, payment_mode)) # Negative amount for outflow
+            refresh_member_ledger(cursor, member_id)
+            refresh_member_summary(cursor, member_id)
           
             conn.commit()
+        metrics.inc('mfi_loans_disbursed_total', via='add_loan')
+        metrics.inc('mfi_loan_disbursed_amount_rupees_total', amount)
         current_app.logger.info(f"Loan {loan_id} added successfully. EMI: {emi}, Due: {total_due}")
         return jsonify({'success': True, 'loan_id': loan_id})
     except ValueError as ve:
@@ -1362,7 +1744,7 @@ def complete_loan():
             return redirect(url_for('loan_list')) # FIXED: Consistent redirect
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT repayment_type, tenure_months, tenure_days, member_id, amount, emi FROM loans WHERE loan_id = ? AND status = "Pending"', (loan_id,))
+            cursor.execute("SELECT repayment_type, tenure_months, tenure_days, member_id, amount, emi FROM loans WHERE loan_id = ? AND status = 'Pending'", (loan_id,))
             row = cursor.fetchone()
             if not row:
                 flash('Invalid loan or already completed', 'error')
@@ -1385,7 +1767,11 @@ def complete_loan():
                 INSERT INTO payments (member_id, loan_id, type, amount, pay_date, payment_mode)
                 VALUES (?, ?, 'loan_disbursed', -?, ?, ?)
             """, (member_id, loan_id, amount, loan_date, payment_mode))
+            refresh_member_ledger(cursor, member_id)
+            refresh_member_summary(cursor, member_id)
             conn.commit()
+        metrics.inc('mfi_loans_disbursed_total', via='complete_loan')
+        metrics.inc('mfi_loan_disbursed_amount_rupees_total', float(amount or 0))
         flash(f'Loan **{loan_id}** activated successfully! Amount: ₹{amount}, Due: ₹{total_due}', 'success')
         return redirect(url_for('loan_list'))
     except Exception as e:
@@ -1418,6 +1804,14 @@ def get_member_details(member_id):
     if details:
         return jsonify(details)
     return jsonify({'error': 'Member not found'})
+@app.route('/api/members/<member_id>/summary')
+def member_summary_api(member_id):
+    """Member 360: name, father name, phone, current loan, EMI, paid, due, DPD, last payment (one PK read)."""
+    with get_db_connection() as conn:
+        summary = get_member_summary(conn.cursor(), member_id)
+    if not summary:
+        return jsonify({'error': 'Member not found'}), 404
+    return jsonify(summary)
 @app.route('/get_member_payments/<member_id>')
 def get_member_payments(member_id):
     """Fetch all EMI payments for a member to display in table."""
@@ -1471,6 +1865,8 @@ def delete_emi(payment_id):
             """, (emi_amount, emi_amount, loan_id))
             # If loan was closed, reopen if due_amount > 0 now
             cursor.execute("UPDATE loans SET status = 'Active' WHERE loan_id = ? AND due_amount > 0 AND status = 'Closed'", (loan_id,))
+            refresh_member_ledger(cursor, member_id)
+            refresh_member_summary(cursor, member_id)
             conn.commit()
             return jsonify({'success': True, 'message': f'EMI of ₹{emi_amount:.2f} reverted successfully.'})
     except Exception as e:
@@ -1528,17 +1924,11 @@ def pay_advance():
             flash('Loan ID required', 'error')
             return render_template('pay_advance.html', error="Loan ID not found!")
       
-        loan_data = get_loan_by_id(loan_id)
+        loan_data = get_loan_summary(loan_id)  # loan + member name in one read
         if not loan_data:
             flash('Loan not found', 'error')
             return render_template('pay_advance.html', error="Loan ID not found!")
-      
-        # Fetch member name
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT full_name FROM members WHERE id = ?', (loan_data['member_id'],))
-            member = cursor.fetchone()
-            loan_data['member_name'] = member[0] if member else 'N/A'
+        loan_data['member_name'] = loan_data['member_name'] or 'N/A'
       
         # ENHANCED: Add EMI and due_amount to template context for display
         loan_data['display_emi'] = loan_data.get('emi', 0)
@@ -1554,13 +1944,70 @@ def emi_due_report():
         # Handle form if needed
         pass
     return render_template('emi_due_report.html', current_date=current_date)
+def _export_format():
+    """'csv' / 'xlsx' / 'ndjson' when a report is requested as a download (?format=...), else None"""
+    fmt = (request.args.get('format') or '').lower()
+    return fmt if fmt in export_utils.EXPORT_FORMATS else None
+def _job_accepted(job_id):
+    return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': url_for('job_status', job_id=job_id)}), 202
+def _queue_report(report, **params):
+    """?async=1: run the report on the job worker and answer with the job instead of the data"""
+    if request.args.get('async') != '1':
+        return None
+    try:
+        job_id = job_queue.submit(report, params, _export_format() or 'csv')
+    except job_queue.JobError as e:
+        return jsonify({'error': str(e)}), 400
+    return _job_accepted(job_id)
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    payload = request.get_json(silent=True) or {}
+    try:
+        job_id = job_queue.submit(payload.get('report'), payload.get('params') or {}, payload.get('format') or 'csv')
+    except job_queue.JobError as e:
+        return jsonify({'error': str(e)}), 400
+    return _job_accepted(job_id)
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['download']:
+        job['download_url'] = url_for('job_download', job_id=job_id)
+    return jsonify(job)
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    job = job_queue.get_job(job_id)
+    path = job_queue.artifact_path(job_id)
+    if job is None or path is None:
+        return jsonify({'error': 'Job not finished, failed or expired'}), 404
+    return send_file(os.path.abspath(path), as_attachment=True,
+                     download_name=f"{job['report']}_{job_id[:8]}.{job['format']}")
+@app.route('/documents/batch', methods=['POST'])
+def batch_documents_route():
+    """NOCs / stamps / legal notices / EMI due lists for a whole filter, built on the job worker"""
+    payload = request.get_json(silent=True) or request.form.to_dict()
+    params = {k: payload[k] for k in ('kind', 'filter', 'as_of', 'min_dpd') if payload.get(k) not in (None, '')}
+    params['base_url'] = request.host_url  # logo link in the merged html
+    try:
+        batch_documents.check_batch(params.get('kind'), params.get('filter'))
+        job_id = job_queue.submit('documents', params, payload.get('format') or 'zip')
+    except (batch_documents.BatchError, job_queue.JobError) as e:
+        return jsonify({'error': str(e)}), 400
+    return _job_accepted(job_id)
 @app.route('/get_emi_due_report')
 def get_emi_due_report():
     report_date = request.args.get('date')
     if not report_date:
         return jsonify({'error': 'Date required'})
   
+    queued = _queue_report('emi_due', date=report_date)
+    if queued:
+        return queued
     try:
+        fmt = _export_format()
+        if fmt:
+            return export_utils.stream_response(fmt, f"emi_due_{report_date}", iter_active_members_report(report_date))
         data = get_active_members_report(report_date) # Your function
         return jsonify(data)
     except Exception as e:
@@ -1575,7 +2022,14 @@ def get_loan_dispatch_report(): # Route name unchanged
     if not from_date or not to_date:
         return jsonify({'error': 'Dates required'})
   
+    queued = _queue_report('loan_dispatch', from_date=from_date, to_date=to_date)
+    if queued:
+        return queued
     try:
+        fmt = _export_format()
+        if fmt:
+            return export_utils.stream_response(fmt, f"loan_dispatch_{from_date}_{to_date}",
+                                                iter_loan_dispatch_report_data(from_date, to_date))
         data = fetch_loan_dispatch_report_data(from_date, to_date) # Updated call!
         return jsonify(data)
     except Exception as e:
@@ -1592,8 +2046,14 @@ def get_bank_report():
     if not report_date:
         return jsonify({'error': 'Date required'})
   
+    queued = _queue_report('bank', date=report_date)
+    if queued:
+        return queued
     try:
         data = get_bank_report_data(report_date)
+        fmt = _export_format()
+        if fmt:
+            return export_utils.stream_response(fmt, f"bank_report_{report_date}", [data])
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)})
@@ -1620,12 +2080,31 @@ def get_member_ledger_route(): # Renamed route for clarity, but URL unchanged
     if not all([member_id, from_date, to_date]):
         return jsonify({'error': 'Member ID and dates required'})
   
+    queued = _queue_report('member_ledger', member_id=member_id, from_date=from_date, to_date=to_date)
+    if queued:
+        return queued
     try:
+        fmt = _export_format()
+        if fmt:
+            return export_utils.stream_response(fmt, f"ledger_{member_id}_{from_date}_{to_date}",
+                                                iter_member_ledger_data(member_id, from_date, to_date))
         data = fetch_member_ledger_data(member_id, from_date, to_date) # Updated call!
         return jsonify(data)
     except Exception as e:
         current_app.logger.error(f"Ledger error: {e}")
         return jsonify({'error': str(e)})
+@app.route('/get_member_statement')
+def get_member_statement_route():
+    member_id = request.args.get('member_id')
+    from_date = request.args.get('from_date')
+    to_date = request.args.get('to_date')
+    if not all([member_id, from_date, to_date]):
+        return jsonify({'error': 'Member ID and dates required'})
+    try:
+        return jsonify(get_member_statement(member_id, from_date, to_date))
+    except Exception as e:
+        current_app.logger.error(f"Statement error: {e}")
+        return jsonify({'error': str(e)})
   
 @app.route('/profit_loss_report', methods=['GET'])
 def profit_loss_report():
@@ -1637,8 +2116,14 @@ def get_pnl_report():
     if not from_date or not to_date:
         return jsonify({'error': 'Dates required'})
   
+    queued = _queue_report('pnl', from_date=from_date, to_date=to_date)
+    if queued:
+        return queued
     try:
         data = get_pnl_report_data(from_date, to_date)
+        fmt = _export_format()
+        if fmt:
+            return export_utils.stream_response(fmt, f"pnl_{from_date}_{to_date}", [data])
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)})
@@ -1652,7 +2137,7 @@ def get_balance_sheet_data(balance_date_str):
     except ValueError:
         raise ValueError("Invalid date format: Use YYYY-MM-DD")
   
-    with get_db_connection() as conn:
+    with get_report_connection() as conn:
         cursor = conn.cursor()
       
         # FIXED Cash in Hand calculation - Ensure correct rounding and max(0)
@@ -1735,7 +2220,7 @@ def get_balance_sheet_data(balance_date_str):
         # Total Liabilities & Equity
         total_liabilities_equity = round(borrowings + capital + retained_earnings, 2)
       
-        print(f"DEBUG BS ({balance_date_str}): Cash in Hand=₹{cash_in_hand}, Bank=₹{bank_balance}, Capital=₹{capital}, Retained=₹{retained_earnings}, Total Assets=₹{total_assets}")
+        app.logger.debug("BS (%s): Cash in Hand=₹%s, Bank=₹%s, Capital=₹%s, Retained=₹%s, Total Assets=₹%s", balance_date_str, cash_in_hand, bank_balance, capital, retained_earnings, total_assets)
       
         return {
             'cash_in_hand': cash_in_hand,
@@ -1816,10 +2301,30 @@ def not_found(error):
 def internal_error(error):
     return jsonify({'error': 'Server error - check logs'}), 500
 # Updated route with fixes: better error handling, safe date sorting, no double close
+def iter_invest_expense_rows():
+    """Investments and expenses as one stream, newest first (sorted by the DB, not in memory)"""
+    with get_report_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT date, 'investment' as type, type as invest_type, NULL as expense_category, description, amount
+            FROM investments
+            UNION ALL
+            SELECT date, 'expense' as type, NULL as invest_type, category as expense_category, description, amount
+            FROM expenses
+            ORDER BY date DESC
+        """)
+        for row in export_utils.iter_cursor(cursor):
+            yield dict(row)
 @app.route('/get_invest_expense_report')
 def get_invest_expense_report():
+    queued = _queue_report('invest_expense')
+    if queued:
+        return queued
     try:
-        with get_db_connection() as conn:
+        fmt = _export_format()
+        if fmt:
+            return export_utils.stream_response(fmt, 'investments_expenses', iter_invest_expense_rows())
+        with get_report_connection() as conn:
             cursor = conn.cursor()
           
             # Fetch investments
@@ -1859,16 +2364,11 @@ def get_invest_expense_report():
   
 @app.route('/loan/view/<loan_id>')
 def view_loan(loan_id):
-    loan = get_loan_by_id(loan_id)
+    loan = get_loan_summary(loan_id)  # loan + member name in one read
     if not loan:
         flash('Loan not found.', 'error')
         return redirect(url_for('loan_list'))
-    # Fetch member details too
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT full_name FROM members WHERE id = ?', (loan['member_id'],))
-        member = cursor.fetchone()
-        loan['member_name'] = member[0] if member else 'N/A'
+    loan['member_name'] = loan['member_name'] or 'N/A'
     return render_template('view_loan.html', loan=loan) # You'll need view_loan.html later
 @app.route('/loan/edit/<loan_id>', methods=['GET', 'POST'])
 def edit_loan(loan_id):
@@ -1911,20 +2411,21 @@ def edit_loan(loan_id):
             if not all([member_id, loan_type, repayment_type]):
                 raise ValueError('Member ID, Loan Type, and Repayment Type required.')
             
-            # Validate member exists
+            # Optional fields
+            purpose = clean_input('purpose')
+            guarantor_id = clean_input('guarantor_id')
+            
+            # Validate member (and guarantor) exist
+            # FIXED: guarantor check used the cursor after its connection was closed
             with get_db_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('SELECT 1 FROM members WHERE id = ?', (member_id,))
                 if not cursor.fetchone():
                     raise ValueError("Member not found.")
-            
-            # Optional fields
-            purpose = clean_input('purpose')
-            guarantor_id = clean_input('guarantor_id')
-            if guarantor_id:
-                cursor.execute('SELECT 1 FROM members WHERE id = ?', (guarantor_id,))
-                if not cursor.fetchone():
-                    raise ValueError("Guarantor not found.")
+                if guarantor_id:
+                    cursor.execute('SELECT 1 FROM members WHERE id = ?', (guarantor_id,))
+                    if not cursor.fetchone():
+                        raise ValueError("Guarantor not found.")
             
             # Amount/EMI recalc
             amount = None
@@ -1999,9 +2500,14 @@ def edit_loan(loan_id):
                 ''', (member_id, loan_type, amount, purpose, tenure_months, tenure_days, interest_rate, emi,
                       emi_type, repayment_type, guarantor_id, loan_date, payment_mode, ref_id, emi_start_date,
                       emi_end_date, new_due_amount, loan_id))
-                conn.commit()
                 if cursor.rowcount == 0:
                     raise ValueError("Loan not found for update.")
+                refresh_member_ledger(cursor, member_id)
+                refresh_member_summary(cursor, member_id)
+                if loan['member_id'] != member_id:
+                    refresh_member_ledger(cursor, loan['member_id'])  # loan moved to another member
+                    refresh_member_summary(cursor, loan['member_id'])
+                conn.commit()
             
             flash(f'Loan **{loan_id}** updated successfully! New EMI: ₹{emi:.2f}, Due: ₹{new_due_amount:.2f}', 'success')
             return redirect(url_for('loan_list'))
@@ -2023,9 +2529,14 @@ def delete_loan(loan_id):
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute('SELECT member_id FROM loans WHERE loan_id = ?', (loan_id,))
+            owner = cursor.fetchone()
             cursor.execute('DELETE FROM loans WHERE loan_id = ?', (loan_id,))
+            if owner:
+                refresh_member_ledger(cursor, owner['member_id'])
+                refresh_member_summary(cursor, owner['member_id'])
             conn.commit()
-            if cursor.rowcount > 0:
+            if owner:
                 flash(f'Loan {loan_id} deleted.', 'success')
             else:
                 flash('Loan not found.', 'error')
@@ -2107,18 +2618,12 @@ def print_loan():
     return render_template('print_loan.html', loan=loan, error=error, current_date=current_date, schedule=schedule)
 @app.route('/get_loan_details/<loan_id>')
 def get_loan_details_route(loan_id):
-    loan = get_loan_by_id(loan_id)
+    loan = get_loan_summary(loan_id)  # member name, father name, mobile (for WhatsApp) in the same read
     if not loan:
         return jsonify({'error': 'Loan not found'})
-  
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        # Fetch member details including mobile for WhatsApp
-        cursor.execute('SELECT full_name as member_name, father_name, phone_number as mobile FROM members WHERE id = ?', (loan['member_id'],))
-        member = cursor.fetchone()
-        loan['member_name'] = member['member_name'] if member else 'N/A'
-        loan['father_name'] = member['father_name'] if member else 'N/A'
-        loan['mobile'] = member['mobile'] if member else '7253946012' # Fallback
+    if loan['member_name'] is None:
+        loan['member_name'] = loan['father_name'] = 'N/A'
+        loan['mobile'] = '7253946012' # Fallback
   
     # Add computed fields (discount assume 0, remaining = due - paid)
     loan['discount_amount'] = 0 # Or add DB field if needed
@@ -2151,7 +2656,7 @@ def get_balance_sheet_data(balance_date_str):
     except ValueError:
         raise ValueError("Invalid date format: Use YYYY-MM-DD")
   
-    with get_db_connection() as conn:
+    with get_report_connection() as conn:
         cursor = conn.cursor()
       
         # NEW: Initial Investments as Cash Inflow (your model: investments fund cash pool)
@@ -2237,7 +2742,7 @@ def get_balance_sheet_data(balance_date_str):
         total_liabilities_equity = round(borrowings + capital + retained_earnings, 2)
       
         # LOG for debugging (remove later)
-        print(f"DEBUG Balance Sheet ({balance_date_str}): Total Assets=₹{total_assets}, Borrowings=₹{borrowings}, Retained=₹{retained_earnings}, Computed Capital=₹{capital}")
+        app.logger.debug("Balance Sheet (%s): Total Assets=₹%s, Borrowings=₹%s, Retained=₹%s, Computed Capital=₹%s", balance_date_str, total_assets, borrowings, retained_earnings, capital)
       
         return {
             'cash_in_hand': max(0, cash_in_hand),
@@ -2257,10 +2762,16 @@ def get_balance_sheet():
     if not balance_date:
         return jsonify({'error': 'Date required (YYYY-MM-DD)'}), 400
   
+    queued = _queue_report('balance_sheet', date=balance_date)
+    if queued:
+        return queued
     try:
         data = get_balance_sheet_data(balance_date)
         # Add date to response for display
         data['as_on_date'] = balance_date
+        fmt = _export_format()
+        if fmt:
+            return export_utils.stream_response(fmt, f"balance_sheet_{balance_date}", [data])
         return jsonify(data)
     except ValueError as ve:
         return jsonify({'error': str(ve)}), 400
@@ -2318,42 +2829,26 @@ def cash_deposit():
     return render_template('cash_deposit.html', deposits=deposits, total_deposited=total_deposited)
 # Add this function after existing utility functions in app.py (e.g., after get_loan_by_id)
 def get_loan_notice_details(loan_id):
-    """Fetch details for legal notice: due amount, last EMI date, member info."""
+    """Fetch details for legal notice: due amount, last EMI date, member info (one query)."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
       
-        # FIXED: JOIN on m.id (not m.member_id)
-        cursor.execute("""
-            SELECT l.loan_id, l.member_id, l.amount, l.emi, l.due_amount, l.loan_date, l.emi_start_date,
-                   l.status, m.full_name, m.father_name, m.address, m.phone_number, m.pincode
+        # FIXED: JOIN on m.id (not m.member_id); last EMI date in the same query
+        cursor.execute(f"""
+            SELECT {batch_documents.LOAN_FIELDS},
+                   (SELECT MAX(t.pay_date) FROM transactions t
+                    WHERE t.loan_id = l.loan_id AND t.type = 'emi') as last_emi_date
             FROM loans l
-            JOIN members m ON l.member_id = m.id -- <-- Key Fix Here
+            JOIN members m ON l.member_id = m.id
             WHERE l.loan_id = ? AND l.status = 'Active'
         """, (loan_id,))
         loan = cursor.fetchone()
         if not loan:
             return None
       
-        loan_dict = dict(loan)
-      
-        # Get last EMI payment date
-        cursor.execute("""
-            SELECT MAX(pay_date) as last_emi_date
-            FROM transactions
-            WHERE loan_id = ? AND type = 'emi'
-        """, (loan_id,))
-        last_payment = cursor.fetchone()
-        loan_dict['last_emi_date'] = last_payment['last_emi_date'] or loan['loan_date'] # Fallback to loan_date if no payments
-      
-        # Format dates
-        loan_dict['loan_date_formatted'] = datetime.strptime(loan_dict['loan_date'], '%Y-%m-%d').strftime('%d/%m/%Y')
-        loan_dict['last_emi_date_formatted'] = datetime.strptime(loan_dict['last_emi_date'], '%Y-%m-%d').strftime('%d/%m/%Y') if loan_dict['last_emi_date'] else 'No payments yet'
-        loan_dict['emi_start_formatted'] = datetime.strptime(loan_dict['emi_start_date'], '%Y-%m-%d').strftime('%d/%m/%Y')
-      
-        # Due amount (use stored or compute if needed)
-        loan_dict['due_amount_formatted'] = f"₹{loan_dict['due_amount']:.2f}"
-      
-        return loan_dict
+        # Same fields (formatted dates, due amount, DPD) as the bulk notices in batch_documents
+        today = datetime.now().date()
+        return batch_documents.document_fields(loan, today, today.strftime('%d %B %Y'))
   
 # Add this route after other routes (e.g., after /cash_deposit)
 @app.route('/legal_notice', methods=['GET', 'POST'])
@@ -2371,6 +2866,17 @@ def legal_notice():
                 error = f'Loan ID "{loan_id}" not found or not active.'
   
     return render_template('legal_notice.html', notice_data=notice_data, error=error)
+@app.route('/legal_notice/bulk', methods=['POST'])
+def legal_notice_bulk():
+    """Legal notices for every overdue loan in one job; included loans go to legal_notice_log"""
+    payload = request.get_json(silent=True) or request.form.to_dict()
+    params = {k: payload[k] for k in ('as_of', 'min_dpd', 'repeat_days') if payload.get(k) not in (None, '')}
+    params['base_url'] = request.host_url  # logo link in the merged html
+    try:
+        job_id = job_queue.submit('legal_notices', params, payload.get('format') or 'zip')
+    except job_queue.JobError as e:
+        return jsonify({'error': str(e)}), 400
+    return _job_accepted(job_id)
 @app.route('/loan_settlement')
 def loan_settlement():
     """Render active loans for settlement (due_amount > 0 and status='Active')."""
@@ -2408,6 +2914,7 @@ def settle_loan(loan_id):
                 SET due_amount = 0, status = 'Closed', loan_closed_date = ?
                 WHERE loan_id = ?
             """, (datetime.now().strftime('%Y-%m-%d'), loan_id))
+            refresh_member_summary(cursor, loan['member_id'])
             conn.commit()
           
             # Get member name for flash
@@ -2424,17 +2931,11 @@ def settle_loan(loan_id):
 
 @app.route('/add_penalty/<loan_id>', methods=['GET', 'POST'])
 def add_penalty(loan_id):
-    loan = get_loan_by_id(loan_id)
+    loan = get_loan_summary(loan_id)  # loan + member name in one read
     if not loan:
         flash('Loan not found.', 'error')
         return redirect(url_for('loan_list'))
-
-    # Fetch member name
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT full_name FROM members WHERE id = ?', (loan['member_id'],))
-        member = cursor.fetchone()
-        loan['member_name'] = member['full_name'] if member else 'N/A'
+    loan['member_name'] = loan['member_name'] or 'N/A'
 
     if request.method == 'POST':
         try:
@@ -2495,6 +2996,16 @@ def print_noc(loan_id):
 
 import re  # Already there, but confirm
 
+def get_loan_ledger(cursor, loan_id):
+    """One loan's ledger lines from ledger_entries: charges negative, payments positive, outstanding after each."""
+    cursor.execute("""
+        SELECT date, type, description, -delta as amount, loan_balance as balance
+        FROM ledger_entries
+        WHERE loan_id = ?
+        ORDER BY date, id
+    """, (loan_id,))
+    return [dict(row) for row in cursor.fetchall()]
+
 @app.route('/borrower_status', methods=['GET', 'POST'])
 def borrower_status():
     if request.method == 'GET':
@@ -2530,30 +3041,16 @@ def borrower_status():
             else:
                 search_value_normalized = search_value_upper
 
-            cursor.execute("""
-                SELECT l.loan_id, m.full_name as name, l.amount as loan_amount, l.total_paid, l.due_amount as remaining,
-                       l.loan_date, l.status, l.emi
-                FROM loans l JOIN members m ON l.member_id = m.id
-                WHERE l.loan_id = ? AND l.status = 'Active'
-            """, (search_value_normalized,))
-            result = cursor.fetchone()
+            loan = get_loan_summary(search_value_normalized, cursor)
+            if loan and loan['status'] == 'Active' and loan['member_name'] is not None:
+                result = dict(loan, name=loan['member_name'], loan_amount=loan['amount'], remaining=loan['due_amount'])
 
             if result:
                 loan_id = result['loan_id']
                 # Calculate pending EMIs
                 pending_emis_count = math.ceil(result['remaining'] / result['emi']) if result['emi'] and result['remaining'] > 0 else 0
                 # Ledger query
-                cursor.execute("""
-                    SELECT pay_date as date, type, description, amount
-                    FROM (
-                        SELECT l.loan_date as pay_date, 'loan_disbursed' as type, 'Loan Sanctioned' as description, -l.amount as amount FROM loans l WHERE l.loan_id = ?
-                        UNION ALL
-                        SELECT t.pay_date, t.type, 'EMI Payment' as description, t.amount FROM transactions t WHERE t.loan_id = ? AND t.type = 'emi'
-                        UNION ALL
-                        SELECT t.pay_date, t.type, 'Advance Payment' as description, t.amount FROM transactions t WHERE t.loan_id = ? AND t.type = 'advance'
-                    ) ledger ORDER BY pay_date
-                """, (loan_id, loan_id, loan_id))
-                ledger_data = [dict(row) for row in cursor.fetchall()]
+                ledger_data = get_loan_ledger(cursor, loan_id)
 
         elif search_type == 'mobile_no':
             # FIXED: Clean mobile - remove non-digits (e.g., +91, spaces)
@@ -2562,29 +3059,21 @@ def borrower_status():
                 flash('Invalid Mobile No! Enter 10-digit number (e.g., 9876543210).', 'error')
                 return render_template('borrower_status.html')
 
+            # member_summary keeps the member's active loan (if any) on its row
             cursor.execute("""
-                SELECT m.full_name as name, l.loan_id, l.amount as loan_amount, l.total_paid, l.due_amount as remaining,
-                       l.loan_date, l.status, l.emi
-                FROM members m LEFT JOIN loans l ON m.id = l.member_id
-                WHERE m.phone_number = ? AND l.status = 'Active'
-            """, (search_value_clean,))
-            result = cursor.fetchone()
+                SELECT full_name as name, loan_id, loan_amount, total_paid, due_amount as remaining,
+                       loan_date, loan_status as status, emi, next_due_date
+                FROM member_summary
+                WHERE phone_e164 = ? AND loan_status = 'Active'
+            """, (normalize_phone(search_value_clean),))
+            row = cursor.fetchone()
+            result = member_summary_fields(row) if row else None
 
             if result:
                 loan_id = result['loan_id']
                 pending_emis_count = math.ceil(result['remaining'] / result['emi']) if result['emi'] and result['remaining'] > 0 else 0
                 # Ledger same as above
-                cursor.execute("""
-                    SELECT pay_date as date, type, description, amount
-                    FROM (
-                        SELECT l.loan_date as pay_date, 'loan_disbursed' as type, 'Loan Sanctioned' as description, -l.amount as amount FROM loans l WHERE l.loan_id = ?
-                        UNION ALL
-                        SELECT t.pay_date, t.type, 'EMI Payment' as description, t.amount FROM transactions t WHERE t.loan_id = ? AND t.type = 'emi'
-                        UNION ALL
-                        SELECT t.pay_date, t.type, 'Advance Payment' as description, t.amount FROM transactions t WHERE t.loan_id = ? AND t.type = 'advance'
-                    ) ledger ORDER BY pay_date
-                """, (loan_id, loan_id, loan_id))
-                ledger_data = [dict(row) for row in cursor.fetchall()]
+                ledger_data = get_loan_ledger(cursor, loan_id)
 
         else:
             flash('Select Loan ID or Mobile No!', 'error')
@@ -0,0 +1,661 @@
+# backup_db.py
+# Online backups of finvestacore.db (replaces dump_db.py's plaintext iterdump() dump).
+#
+#   python backup_db.py backup                        # compressed snapshot into ./backups, keep 14
+#   python backup_db.py backup --keep 30 --pages 512 --sleep 0.01
+#   python backup_db.py archive-wal --interval 30     # keep running: ships WAL segments (point-in-time restore)
+#   python backup_db.py verify                        # decompress every snapshot + PRAGMA integrity_check
+#   python backup_db.py restore --to restored.db --at "2026-10-19 14:30"
+#
+# Snapshots use sqlite3's online backup API: pages are copied --pages at a time with --sleep between
+# steps, so the app keeps reading and writing while a backup runs. Files are zstd-compressed when the
+# optional `zstandard` package is installed, gzip otherwise. Each snapshot has a .json manifest
+# (sha256 of the database, page count, WAL position).
+#
+# WAL archiving (needs journal_mode=WAL, which archive-wal switches on):
+#   - archive-wal holds a read transaction open between passes, so SQLite can't checkpoint past it and
+#     restart the -wal file before its frames were copied out.
+#   - Every --interval seconds it briefly takes the write lock, copies the new committed frames into
+#     backups/wal/<generation>/ and, when the WAL is over --checkpoint-mb, checkpoints it itself.
+#   - If the chain was broken (archiver was stopped, WAL restarted meanwhile) it takes a new snapshot.
+#   restore = newest snapshot at or before --at + the archived frames up to --at, replayed by SQLite.
+#
+# Layout:
+#   backups/snapshots/finvestacore-20261019-143000.db.gz  (+ .json)
+#   backups/wal/<ckpt_seq>-<salt1>-<salt2>/generation.json, segments.jsonl, <start>-<end>.wal.gz
+
+import argparse
+import datetime as dt
+import glob
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is used instead
+    zstandard = None
+
+DB_PATH = 'finvestacore.db'
+BACKUP_DIR = 'backups'
+DEFAULT_KEEP = 14
+DEFAULT_PAGES = 256          # pages copied per backup step
+DEFAULT_SLEEP = 0.005        # seconds between steps (lets writers in)
+BUSY_TIMEOUT = 30            # seconds to wait for the write lock during a WAL pass
+
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+WAL_MAGIC = (0x377f0682, 0x377f0683)
+
+
+# =====================================================================
+# COMPRESSION
+# =====================================================================
+
+def default_compression():
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def compressed_open(path, mode):
+    """Opens .zst / .gz / plain files for binary reading or writing."""
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd-compressed; pip install zstandard")
+        return zstandard.open(path, mode)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, compresslevel=6)
+    return open(path, mode)
+
+
+def suffix_for(compression):
+    return {'zstd': '.zst', 'gzip': '.gz', 'none': ''}[compression]
+
+
+def partial_path(path):
+    """Temp name for a file being written; keeps the extension so compressed_open() picks the format."""
+    return os.path.join(os.path.dirname(path), '.partial-' + os.path.basename(path))
+
+
+def write_compressed(src_path, dst_path):
+    """Streams src into dst (compressing by extension) and returns the sha256 of the raw bytes."""
+    digest = hashlib.sha256()
+    tmp_path = partial_path(dst_path)
+    with open(src_path, 'rb') as src, compressed_open(tmp_path, 'wb') as dst:
+        while True:
+            chunk = src.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dst.write(chunk)
+    os.replace(tmp_path, dst_path)  # never leave a half-written backup under the final name
+    return digest.hexdigest()
+
+
+def read_compressed(src_path, dst_path):
+    digest = hashlib.sha256()
+    with compressed_open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        while True:
+            chunk = src.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dst.write(chunk)
+    return digest.hexdigest()
+
+
+# =====================================================================
+# WAL FILE FORMAT
+# =====================================================================
+
+def read_wal_header(wal_path):
+    """Returns (page_size, ckpt_seq, salt1, salt2) of the current -wal file, or None if it has none yet."""
+    try:
+        with open(wal_path, 'rb') as f:
+            header = f.read(WAL_HEADER_SIZE)
+    except FileNotFoundError:
+        return None
+    if len(header) < WAL_HEADER_SIZE:
+        return None
+    magic, _version, page_size, ckpt_seq, salt1, salt2, _c1, _c2 = struct.unpack('>8I', header)
+    if magic not in WAL_MAGIC:
+        return None
+    return page_size, ckpt_seq, salt1, salt2
+
+
+def generation_key(header):
+    _page_size, ckpt_seq, salt1, salt2 = header
+    return f"{ckpt_seq:08d}-{salt1:08x}-{salt2:08x}"
+
+
+def last_commit_offset(wal_path, header, start):
+    """End offset of the last committed frame of this WAL generation (frames from older ones are skipped)."""
+    page_size, _ckpt_seq, salt1, salt2 = header
+    frame_size = WAL_FRAME_HEADER_SIZE + page_size
+    pos = max(start, WAL_HEADER_SIZE)
+    end = start if start >= WAL_HEADER_SIZE else WAL_HEADER_SIZE
+    with open(wal_path, 'rb') as f:
+        f.seek(pos)
+        while True:
+            frame_header = f.read(WAL_FRAME_HEADER_SIZE)
+            if len(frame_header) < WAL_FRAME_HEADER_SIZE:
+                break
+            page_no, commit_size, frame_salt1, frame_salt2 = struct.unpack('>4I', frame_header[:16])
+            if page_no == 0 or (frame_salt1, frame_salt2) != (salt1, salt2):
+                break  # leftover frame of a previous generation
+            pos += frame_size
+            if commit_size:
+                end = pos
+            f.seek(pos)
+    return end
+
+
+# =====================================================================
+# SNAPSHOTS
+# =====================================================================
+
+def snapshot_dir(backup_dir):
+    return os.path.join(backup_dir, 'snapshots')
+
+
+def list_snapshots(backup_dir):
+    """Snapshot manifests, oldest first."""
+    manifests = []
+    for path in sorted(glob.glob(os.path.join(snapshot_dir(backup_dir), '*.json'))):
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest['manifest_path'] = path
+        manifest['path'] = os.path.join(snapshot_dir(backup_dir), manifest['file'])
+        manifests.append(manifest)
+    return manifests
+
+
+def pin_read_snapshot(conn):
+    """Opens a read transaction; in WAL mode it keeps this view and stops checkpoints passing it."""
+    conn.execute('BEGIN')
+    conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+
+def unpin_read_snapshot(conn):
+    if conn.in_transaction:
+        conn.execute('COMMIT')
+
+
+def copy_database(src, dst_path, pages, sleep):
+    """Stepped online backup of an open connection into a new file. Returns the page count."""
+    progress = {'pages': 0}
+
+    def report(status, remaining, total):
+        progress['pages'] = total
+
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst, pages=pages, progress=report, sleep=sleep)
+        # The copy is a standalone file; the WAL belongs to the live database
+        dst.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        dst.close()
+    return progress['pages']
+
+
+def take_snapshot(db_path, backup_dir, compression, pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP,
+                  reader=None, wal_position=None):
+    """
+    Writes one compressed, timestamped snapshot and its manifest.
+    In WAL mode pass a reader pinned with pin_read_snapshot() and the WAL position it sees, so the
+    snapshot can be rolled forward with archived frames on restore.
+    """
+    os.makedirs(snapshot_dir(backup_dir), exist_ok=True)
+    taken_at = dt.datetime.now()
+    name = f"{os.path.splitext(os.path.basename(db_path))[0]}-{taken_at:%Y%m%d-%H%M%S}"
+    while os.path.exists(os.path.join(snapshot_dir(backup_dir), name + '.json')):
+        taken_at += dt.timedelta(seconds=1)
+        name = f"{os.path.splitext(os.path.basename(db_path))[0]}-{taken_at:%Y%m%d-%H%M%S}"
+    file_name = name + '.db' + suffix_for(compression)
+
+    started = time.perf_counter()
+    fd, tmp_path = tempfile.mkstemp(prefix='snapshot_', suffix='.db', dir=backup_dir)
+    os.close(fd)
+    own_reader = reader is None
+    try:
+        src = reader or sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+        try:
+            page_count = copy_database(src, tmp_path, pages, sleep)
+        finally:
+            if own_reader:
+                src.close()
+        size = os.path.getsize(tmp_path)
+        sha256 = write_compressed(tmp_path, os.path.join(snapshot_dir(backup_dir), file_name))
+    finally:
+        os.remove(tmp_path)
+
+    manifest = {
+        'file': file_name,
+        'source': os.path.abspath(db_path),
+        'taken_at': taken_at.isoformat(timespec='seconds'),
+        'pages': page_count,
+        'size': size,
+        'sha256': sha256,
+        'compression': compression,
+        'wal': wal_position,  # {'generation': ..., 'offset': ...} or None
+    }
+    with open(os.path.join(snapshot_dir(backup_dir), name + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    compressed = os.path.getsize(os.path.join(snapshot_dir(backup_dir), file_name))
+    print(f"✅ Snapshot {file_name}: {page_count} pages, {size / 1e6:.1f} MB -> {compressed / 1e6:.1f} MB "
+          f"in {time.perf_counter() - started:.1f}s")
+    return manifest
+
+
+def backup(db_path, backup_dir, compression, pages, sleep, keep):
+    if not os.path.exists(db_path):
+        print(f"Error: {db_path} not found!")
+        return 1
+    reader = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    try:
+        journal_mode = reader.execute('PRAGMA journal_mode').fetchone()[0]
+        if journal_mode.lower() == 'wal':
+            # Pin the reader while nobody can commit, so the snapshot's WAL position is exact;
+            # the (slow) page copy then runs from the pinned view without blocking writers
+            writer = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            try:
+                writer.execute('BEGIN IMMEDIATE')
+                position = current_wal_position(db_path)
+                pin_read_snapshot(reader)
+                writer.execute('ROLLBACK')
+            finally:
+                writer.close()
+            take_snapshot(db_path, backup_dir, compression, pages, sleep, reader=reader, wal_position=position)
+            unpin_read_snapshot(reader)
+        else:
+            # Rollback journal: holding a read transaction would block writers, so copy in short steps
+            take_snapshot(db_path, backup_dir, compression, pages, sleep, reader=reader)
+    finally:
+        reader.close()
+    prune(backup_dir, keep)
+    return 0
+
+
+def current_wal_position(db_path):
+    header = read_wal_header(db_path + '-wal')
+    if header is None:
+        return None
+    return {'generation': generation_key(header), 'offset': last_commit_offset(db_path + '-wal', header, 0)}
+
+
+# =====================================================================
+# WAL ARCHIVING
+# =====================================================================
+
+def wal_dir(backup_dir):
+    return os.path.join(backup_dir, 'wal')
+
+
+def load_generation(backup_dir, key):
+    path = os.path.join(wal_dir(backup_dir), key, 'generation.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_segments(backup_dir, key):
+    path = os.path.join(wal_dir(backup_dir), key, 'segments.jsonl')
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class WalArchiver:
+    """Copies committed WAL frames into backups/wal/ before SQLite can checkpoint them away."""
+
+    def __init__(self, db_path, backup_dir, compression, pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP,
+                 checkpoint_bytes=16 * 1024 * 1024):
+        self.db_path = db_path
+        self.wal_path = db_path + '-wal'
+        self.backup_dir = backup_dir
+        self.compression = compression
+        self.pages = pages
+        self.sleep = sleep
+        self.checkpoint_bytes = checkpoint_bytes
+        self.state_path = os.path.join(wal_dir(backup_dir), 'state.json')
+        self.state = None  # {'generation', 'offset', 'ckpt_seq', 'closed'}
+        self.reader = None
+        self.writer = None
+
+    def start(self):
+        os.makedirs(wal_dir(self.backup_dir), exist_ok=True)
+        self.reader = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.writer = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        if self.reader.execute('PRAGMA journal_mode=WAL').fetchone()[0].lower() != 'wal':
+            raise RuntimeError(f"could not switch {self.db_path} to WAL mode (is it in use by another program?)")
+        # A previous run's state can't be trusted: the WAL may have been restarted since. Start a new chain.
+        self.state = None
+        self.archive_pass()
+
+    def close(self):
+        if self.reader is not None:
+            self.archive_pass(checkpoint=False)
+            unpin_read_snapshot(self.reader)
+            self.reader.close()
+            self.writer.close()
+            self.reader = self.writer = None
+
+    def archive_pass(self, checkpoint=None):
+        """One pass: copy new frames (under the write lock), optionally checkpoint, re-pin the reader."""
+        self.writer.execute('BEGIN IMMEDIATE')
+        try:
+            header = read_wal_header(self.wal_path)
+            copied = end = 0
+            snapshot_needed = False
+            key = self.state['generation'] if self.state else None
+            if header is None:
+                if self.state is None:
+                    # Nothing written since the WAL was (re)created: the chain starts from an empty WAL
+                    key = f"empty-{dt.datetime.now():%Y%m%d-%H%M%S}"
+                    self._begin_generation(key, None, None)
+                    snapshot_needed = True
+            else:
+                key = generation_key(header)
+                if self.state is None or self.state['generation'] != key:
+                    continues = (self.state is not None and self.state['closed']
+                                 and (self.state['ckpt_seq'] is None or header[1] == self.state['ckpt_seq'] + 1))
+                    self._begin_generation(key, header, self.state['generation'] if continues else None)
+                    snapshot_needed = not continues
+
+                end = last_commit_offset(self.wal_path, header, self.state['offset'])
+                copied = self._copy_segment(key, self.state['offset'], end)
+                self.state['offset'] = end
+
+            unpin_read_snapshot(self.reader)
+            if checkpoint is None:
+                checkpoint = end >= self.checkpoint_bytes
+            if checkpoint and header is not None:
+                # PASSIVE doesn't need the write lock we hold; nobody can append while we hold it
+                _busy, log_frames, done_frames = self.reader.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+                # Fully checkpointed: the next writer restarts the WAL as generation ckpt_seq + 1
+                self.state['closed'] = log_frames >= 0 and done_frames == log_frames
+            pin_read_snapshot(self.reader)
+            self._save_state()
+        finally:
+            self.writer.execute('ROLLBACK')
+
+        if snapshot_needed:
+            print(f"WAL chain starts at generation {key}; taking a base snapshot")
+            # Reader is pinned exactly at `end` (the write lock was held while pinning)
+            take_snapshot(self.db_path, self.backup_dir, self.compression, self.pages, self.sleep,
+                          reader=self.reader, wal_position={'generation': key, 'offset': end})
+            unpin_read_snapshot(self.reader)
+            pin_read_snapshot(self.reader)
+        return copied
+
+    def _begin_generation(self, key, header, previous):
+        os.makedirs(os.path.join(wal_dir(self.backup_dir), key), exist_ok=True)
+        generation = {
+            'generation': key,
+            'page_size': header[0] if header else None,
+            'ckpt_seq': header[1] if header else None,
+            'previous': previous,  # generation this one continues without a gap, or None
+            'started_at': dt.datetime.now().isoformat(timespec='seconds'),
+        }
+        with open(os.path.join(wal_dir(self.backup_dir), key, 'generation.json'), 'w', encoding='utf-8') as f:
+            json.dump(generation, f, indent=2)
+        # An empty WAL is "closed": whatever generation appears next continues it
+        self.state = {'generation': key, 'offset': 0, 'ckpt_seq': header[1] if header else None,
+                      'closed': header is None}
+
+    def _copy_segment(self, key, start, end):
+        if end <= start:
+            return 0
+        file_name = f"{start:012d}-{end:012d}.wal" + suffix_for(self.compression)
+        path = os.path.join(wal_dir(self.backup_dir), key, file_name)
+        with open(self.wal_path, 'rb') as src, compressed_open(partial_path(path), 'wb') as dst:
+            src.seek(start)
+            dst.write(src.read(end - start))
+        os.replace(partial_path(path), path)
+        segment = {'start': start, 'end': end, 'file': file_name,
+                   'archived_at': dt.datetime.now().isoformat(timespec='seconds')}
+        with open(os.path.join(wal_dir(self.backup_dir), key, 'segments.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(segment) + '\n')
+        return end - start
+
+    def _save_state(self):
+        with open(partial_path(self.state_path), 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(partial_path(self.state_path), self.state_path)
+
+
+def archive_wal(db_path, backup_dir, compression, interval, checkpoint_mb, keep, pages, sleep):
+    if not os.path.exists(db_path):
+        print(f"Error: {db_path} not found!")
+        return 1
+    archiver = WalArchiver(db_path, backup_dir, compression, pages, sleep, checkpoint_mb * 1024 * 1024)
+    archiver.start()
+    print(f"Archiving WAL of {db_path} into {wal_dir(backup_dir)} every {interval}s (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(interval)
+            copied = archiver.archive_pass()
+            if copied:
+                print(f"{dt.datetime.now():%H:%M:%S} archived {copied / 1024:.0f} KB of WAL")
+                prune(backup_dir, keep)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        archiver.close()
+    return 0
+
+
+# =====================================================================
+# RETENTION
+# =====================================================================
+
+def prune(backup_dir, keep):
+    """Keeps the newest `keep` snapshots and the WAL generations they can be rolled forward with."""
+    snapshots = list_snapshots(backup_dir)
+    for manifest in snapshots[:-keep] if keep > 0 else []:
+        for path in (manifest['path'], manifest['manifest_path']):
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"Removed old snapshot {manifest['file']}")
+
+    if not os.path.isdir(wal_dir(backup_dir)):
+        return
+    generations = {}
+    for key in os.listdir(wal_dir(backup_dir)):
+        generation = load_generation(backup_dir, key)
+        if generation is not None:
+            generations[key] = generation
+    successors = {g['previous']: key for key, g in generations.items() if g['previous']}
+    needed = set()
+    for manifest in list_snapshots(backup_dir):
+        key = (manifest.get('wal') or {}).get('generation')
+        while key is not None and key not in needed:
+            needed.add(key)
+            key = successors.get(key)
+    current = None
+    state_path = os.path.join(wal_dir(backup_dir), 'state.json')
+    if os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as f:
+            current = json.load(f).get('generation')
+    for key in generations:
+        if key not in needed and key != current:
+            shutil.rmtree(os.path.join(wal_dir(backup_dir), key))
+
+
+# =====================================================================
+# VERIFY / RESTORE
+# =====================================================================
+
+def integrity_check(path):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+        tables = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+    finally:
+        conn.close()
+    return result == ['ok'], result, tables
+
+
+def verify(backup_dir, latest_only=False):
+    snapshots = list_snapshots(backup_dir)
+    if latest_only:
+        snapshots = snapshots[-1:]
+    if not snapshots:
+        print(f"No snapshots in {snapshot_dir(backup_dir)}")
+        return 1
+    failed = 0
+    for manifest in snapshots:
+        fd, tmp_path = tempfile.mkstemp(prefix='verify_', suffix='.db')
+        os.close(fd)
+        try:
+            sha256 = read_compressed(manifest['path'], tmp_path)
+            if sha256 != manifest['sha256']:
+                print(f"❌ {manifest['file']}: checksum mismatch")
+                failed += 1
+                continue
+            ok, result, tables = integrity_check(tmp_path)
+            if ok:
+                print(f"✅ {manifest['file']}: integrity ok, {tables} tables, {manifest['pages']} pages")
+            else:
+                print(f"❌ {manifest['file']}: {'; '.join(result[:5])}")
+                failed += 1
+        except (OSError, EOFError, sqlite3.DatabaseError) as e:
+            print(f"❌ {manifest['file']}: {e}")
+            failed += 1
+        finally:
+            os.remove(tmp_path)
+    print(f"{len(snapshots) - failed}/{len(snapshots)} snapshots verified")
+    return 1 if failed else 0
+
+
+def wal_bytes_until(backup_dir, key, until):
+    """Archived WAL of one generation from offset 0, up to the last segment archived at or before `until`."""
+    data = bytearray()
+    for segment in sorted(load_segments(backup_dir, key), key=lambda s: s['start']):
+        if until is not None and dt.datetime.fromisoformat(segment['archived_at']) > until:
+            break
+        if segment['start'] != len(data):
+            break  # gap: stop at the last contiguous commit
+        with compressed_open(os.path.join(wal_dir(backup_dir), key, segment['file']), 'rb') as f:
+            data += f.read()
+    return bytes(data)
+
+
+def apply_wal(db_path, wal_data):
+    """Lets SQLite recover the frames (checksums are validated) and checkpoint them into the file."""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.close()  # last connection: WAL is checkpointed and removed
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    with open(db_path + '-wal', 'wb') as f:
+        f.write(wal_data)
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.close()
+
+
+def restore(backup_dir, target, at=None):
+    if os.path.exists(target):
+        print(f"Error: {target} already exists; restore into a new file")
+        return 1
+    snapshots = list_snapshots(backup_dir)
+    if at is not None:
+        snapshots = [m for m in snapshots if dt.datetime.fromisoformat(m['taken_at']) <= at]
+    if not snapshots:
+        print("No snapshot taken at or before that time")
+        return 1
+    manifest = snapshots[-1]
+    sha256 = read_compressed(manifest['path'], target)
+    if sha256 != manifest['sha256']:
+        os.remove(target)
+        print(f"❌ {manifest['file']}: checksum mismatch")
+        return 1
+    print(f"Restored snapshot {manifest['file']} ({manifest['taken_at']})")
+
+    # Roll forward: snapshot's own generation, then every generation that continues it without a gap
+    key = (manifest.get('wal') or {}).get('generation')
+    offset = (manifest.get('wal') or {}).get('offset', 0)
+    successors = {}
+    if os.path.isdir(wal_dir(backup_dir)):
+        for other in os.listdir(wal_dir(backup_dir)):
+            generation = load_generation(backup_dir, other)
+            if generation is not None and generation['previous']:
+                successors[generation['previous']] = other
+    applied = 0
+    while key is not None and load_generation(backup_dir, key) is not None:
+        wal_data = wal_bytes_until(backup_dir, key, at)
+        if len(wal_data) > offset:
+            apply_wal(target, wal_data)
+            applied += len(wal_data) - max(offset, WAL_HEADER_SIZE)
+            print(f"  + WAL generation {key} up to offset {len(wal_data)}")
+        segments = load_segments(backup_dir, key)
+        archived_all = len(wal_data) == max((s['end'] for s in segments), default=0)
+        key, offset = (successors.get(key), 0) if archived_all else (None, 0)
+
+    ok, result, tables = integrity_check(target)
+    if not ok:
+        print(f"❌ Restored database failed integrity_check: {'; '.join(result[:5])}")
+        return 1
+    print(f"✅ {target}: integrity ok, {tables} tables ({applied / 1024:.0f} KB of WAL replayed)")
+    return 0
+
+
+# =====================================================================
+# CLI
+# =====================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Online compressed backups of the MFI SQLite database.")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--dir', default=BACKUP_DIR, help="Backup folder (default: ./backups)")
+    parser.add_argument('--compression', choices=['zstd', 'gzip', 'none'], default=default_compression())
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('backup', help="Take one snapshot and apply retention")
+    p.add_argument('--keep', type=int, default=DEFAULT_KEEP, help="Snapshots to keep (0 = all)")
+    p.add_argument('--pages', type=int, default=DEFAULT_PAGES, help="Pages copied per step")
+    p.add_argument('--sleep', type=float, default=DEFAULT_SLEEP, help="Seconds between steps")
+
+    p = sub.add_parser('archive-wal', help="Keep archiving WAL segments (run next to the app)")
+    p.add_argument('--interval', type=float, default=30)
+    p.add_argument('--checkpoint-mb', type=int, default=16, help="Checkpoint once the WAL is this big")
+    p.add_argument('--keep', type=int, default=DEFAULT_KEEP)
+    p.add_argument('--pages', type=int, default=DEFAULT_PAGES)
+    p.add_argument('--sleep', type=float, default=DEFAULT_SLEEP)
+
+    p = sub.add_parser('verify', help="Decompress snapshots and run PRAGMA integrity_check")
+    p.add_argument('--latest', action='store_true', help="Only the newest snapshot")
+
+    p = sub.add_parser('restore', help="Restore a snapshot (+ archived WAL) into a new file")
+    p.add_argument('--to', required=True, help="Target database file (must not exist)")
+    p.add_argument('--at', help="Point in time, e.g. '2026-10-19 14:30' (default: latest)")
+
+    args = parser.parse_args()
+    if args.compression == 'zstd' and zstandard is None:
+        parser.error("zstd needs the zstandard package (pip install zstandard)")
+
+    if args.command == 'backup':
+        return backup(args.db, args.dir, args.compression, args.pages, args.sleep, args.keep)
+    if args.command == 'archive-wal':
+        return archive_wal(args.db, args.dir, args.compression, args.interval, args.checkpoint_mb,
+                           args.keep, args.pages, args.sleep)
+    if args.command == 'verify':
+        return verify(args.dir, args.latest)
+    at = dt.datetime.fromisoformat(args.at) if args.at else None
+    return restore(args.dir, args.to, at)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
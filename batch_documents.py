@@ -0,0 +1,420 @@
+# batch_documents.py
+# Print documents for many loans at once: NOCs, stamp papers, legal notices and EMI due lists.
+#
+#   POST /documents/batch {"kind": "noc", "filter": "closed_this_month"}          -> 202 + job id
+#   POST /documents/batch {"kind": "legal_notice", "filter": "dpd", "min_dpd": 30, "format": "html"}
+#
+#   python batch_documents.py noc closed_this_month --out nocs.zip
+#   python batch_documents.py emi_due dpd --min-dpd 30 --format html --out due_list.html
+#   python batch_documents.py legal_notices --min-dpd 30      # + legal_notice_log (POST /legal_notice/bulk)
+#
+# Loans, members and the last EMI date per loan come from one joined query, instead of a loan query
+# plus a member query per document. Documents are rendered from the same templates as the single-loan
+# routes (print_noc.html, print_stamp.html, legal_notice.html, emi_due_report_pdf.html) in worker
+# processes that have their own Jinja environment - no Flask app, no request. Through the app the
+# batch runs as a job_queue job ('documents'), so the request returns at once.
+#
+# Output: a zip (one HTML file per loan + static/fin.jpg + index.csv) or one merged HTML file with a
+# page break between documents. Both print to PDF from the browser with the templates' A4 @page rules.
+
+import argparse
+import calendar
+import csv
+import datetime as dt
+import io
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import db_backend
+from parallel_reports import DEFAULT_SOURCE, DEFAULT_WORKERS
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
+LOGO_PATH = os.path.join(BASE_DIR, 'static', 'fin.jpg')
+FORMATS = ('zip', 'html')
+RENDER_CHUNK = 20  # documents per task handed to a worker process
+DEFAULT_MIN_DPD = 30
+
+# kind -> template, the variable the template expects for one loan (None: one list document for the
+# whole batch) and the loan status the single-loan route insists on
+DOCUMENTS = {
+    'noc': {'template': 'print_noc.html', 'var': 'loan', 'status': 'Closed'},
+    'stamp': {'template': 'print_stamp.html', 'var': 'loan', 'status': None},
+    'legal_notice': {'template': 'legal_notice.html', 'var': 'notice_data', 'status': 'Active'},
+    'emi_due': {'template': 'emi_due_report_pdf.html', 'var': None, 'status': 'Active'},
+}
+
+# filter -> loan status it selects
+FILTERS = {
+    'closed_this_month': 'Closed',  # loan_closed_date in the month of as_of
+    'dpd': 'Active',                # active loans at least min_dpd days past due
+    'active': 'Active',
+}
+
+TITLES = {
+    'closed_this_month': 'Loans Closed This Month',
+    'dpd': 'Overdue Loans ({min_dpd}+ Days Past Due)',
+    'active': 'Active Loans',
+}
+
+
+class BatchError(ValueError):
+    """Unknown document kind / filter, or a filter that doesn't fit the document."""
+
+
+def check_batch(kind, filter_name):
+    if kind not in DOCUMENTS:
+        raise BatchError(f"Unknown document '{kind}'. Available: {', '.join(DOCUMENTS)}")
+    if filter_name not in FILTERS:
+        raise BatchError(f"Unknown filter '{filter_name}'. Available: {', '.join(FILTERS)}")
+    status = DOCUMENTS[kind]['status']
+    if status and FILTERS[filter_name] != status:
+        raise BatchError(f"'{kind}' is only for {status.lower()} loans; filter '{filter_name}' selects "
+                         f"{FILTERS[filter_name].lower()} loans")
+
+
+# =====================================================================
+# DATA (one query per batch)
+# =====================================================================
+
+# Columns document_fields() needs (app.get_loan_notice_details selects the same for one loan)
+LOAN_FIELDS = """l.loan_id, l.member_id, l.amount, l.emi, l.due_amount, l.total_paid, l.status, l.loan_date,
+           l.loan_closed_date, l.emi_start_date, l.emi_end_date, l.repayment_type, l.tenure_months, l.tenure_days,
+           m.full_name, m.father_name, m.address, m.pincode, m.phone_number, m.date_joined"""
+
+_SELECT = """
+    SELECT """ + LOAN_FIELDS + """,
+           le.last_emi_date
+    FROM loans l
+    JOIN members m ON l.member_id = m.id
+    LEFT JOIN (SELECT loan_id, MAX(pay_date) AS last_emi_date FROM transactions
+               WHERE type = 'emi' GROUP BY loan_id) le ON le.loan_id = l.loan_id
+    WHERE {where}
+    ORDER BY l.loan_id
+"""
+
+_WHERE = {
+    'closed_this_month': "l.status = 'Closed' AND l.loan_closed_date BETWEEN ? AND ?",
+    'dpd': "l.status = 'Active' AND l.emi_start_date <= ?",
+    'active': "l.status = 'Active'",
+}
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def next_due_date(loan):
+    """Due date of the first installment total_paid doesn't cover (None when fully paid or no schedule)."""
+    emi = loan['emi'] or 0
+    if emi <= 0 or not loan['emi_start_date']:
+        return None
+    monthly = loan['repayment_type'] == 'monthly'
+    tenure = (loan['tenure_months'] or 12) if monthly else (loan['tenure_days'] or 120)
+    paid_emis = int((loan['total_paid'] or 0) // emi)
+    if paid_emis >= tenure:
+        return None
+    start = dt.date.fromisoformat(str(loan['emi_start_date'])[:10])
+    return _add_months(start, paid_emis) if monthly else start + dt.timedelta(days=paid_emis)
+
+
+def days_past_due(loan, as_of):
+    """Days since the first installment total_paid doesn't cover (0 when up to date or fully paid)."""
+    due = next_due_date(loan)
+    return max(0, (as_of - due).days) if due else 0
+
+
+def _dmy(value, default='N/A'):
+    """'YYYY-MM-DD...' -> 'DD/MM/YYYY' by slicing (no strptime per field)."""
+    if not value:
+        return default
+    value = str(value)
+    return f"{value[8:10]}/{value[5:7]}/{value[:4]}"
+
+
+def document_fields(row, as_of, notice_date):
+    """Every field the four templates use, the way the single-loan routes fill them."""
+    loan = dict(row)
+    for key in ('amount', 'emi', 'due_amount', 'total_paid'):
+        loan[key] = float(loan[key] or 0)
+    loan['member_name'] = loan['full_name']
+    loan['phone'] = loan['phone_number']
+    loan['joined_date'] = loan['date_joined']
+    loan['last_emi_date'] = loan['last_emi_date'] or loan['loan_date']  # no EMI yet: from the loan date
+    loan['loan_date_formatted'] = _dmy(loan['loan_date'])
+    loan['closed_date_formatted'] = _dmy(loan['loan_closed_date'])
+    loan['emi_start_formatted'] = _dmy(loan['emi_start_date'])
+    loan['last_emi_date_formatted'] = _dmy(loan['last_emi_date'], 'No payments yet')
+    loan['total_paid_formatted'] = f"₹{loan['total_paid']:.2f}"
+    loan['due_amount_formatted'] = f"₹{loan['due_amount']:.2f}"
+    loan['dpd'] = days_past_due(loan, as_of) if loan['status'] == 'Active' else 0
+    loan['notice_date'] = notice_date
+    return loan
+
+
+def _backend(source):
+    return db_backend.create_backend(source if '://' in source else None, sqlite_path=source)
+
+
+def select_loans(filter_name, as_of, min_dpd=DEFAULT_MIN_DPD, source=DEFAULT_SOURCE, noticed_since=None):
+    """
+    Document fields for every loan the filter selects (one joined query). noticed_since: leave out
+    loans that got a legal notice on or after this date (legal_notice_log).
+    """
+    if filter_name == 'closed_this_month':
+        params = (as_of.replace(day=1).isoformat(), as_of.isoformat())
+    elif filter_name == 'dpd':
+        params = (as_of.isoformat(),)
+    else:
+        params = ()
+    where = _WHERE[filter_name]
+    if noticed_since is not None:
+        where += " AND l.loan_id NOT IN (SELECT loan_id FROM legal_notice_log WHERE notice_date >= ?)"
+        params += (noticed_since.isoformat(),)
+    notice_date = as_of.strftime('%d %B %Y')
+    backend = _backend(source)
+    try:
+        with backend.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SELECT.format(where=where), params)
+            loans = [document_fields(row, as_of, notice_date) for row in cursor.fetchall()]
+    finally:
+        backend.dispose()
+    if filter_name == 'dpd':
+        loans = [loan for loan in loans if loan['dpd'] >= min_dpd]
+    return loans
+
+
+# =====================================================================
+# RENDERING (worker processes)
+# =====================================================================
+
+_env = None
+
+
+def _init_renderer(template_dir, static_url):
+    global _env
+    import jinja2
+
+    def url_for(endpoint, **values):
+        # Only the logo matters in a printed document; navigation links are hidden by `batch`
+        return static_url + values['filename'] if endpoint == 'static' else '#'
+
+    _env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir),
+                              autoescape=jinja2.select_autoescape(['html']))
+    _env.globals.update(url_for=url_for, batch=True)
+
+
+def _render_chunk(tasks):
+    """[(template, context), ...] -> [html, ...] in the same order."""
+    return [_env.get_template(template).render(**context) for template, context in tasks]
+
+
+def render_all(tasks, workers=DEFAULT_WORKERS, static_url='static/'):
+    """Yields the HTML of each (template, context) task in order; worker processes when workers > 1."""
+    chunks = [tasks[i:i + RENDER_CHUNK] for i in range(0, len(tasks), RENDER_CHUNK)]
+    if workers <= 1 or len(chunks) <= 1:
+        _init_renderer(TEMPLATE_DIR, static_url)
+        for chunk in chunks:
+            yield from _render_chunk(chunk)
+        return
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context,
+                             initializer=_init_renderer, initargs=(TEMPLATE_DIR, static_url)) as pool:
+        for htmls in pool.map(_render_chunk, chunks):
+            yield from htmls
+
+
+# =====================================================================
+# OUTPUT (zip / merged html)
+# =====================================================================
+
+_HEAD = re.compile(r'<head>(.*?)</head>', re.S | re.I)
+_BODY = re.compile(r'<body[^>]*>(.*)</body>', re.S | re.I)
+_PAGE_BREAK_CSS = ('<style>.batch-page { page-break-after: always; } '
+                   '.batch-page:last-child { page-break-after: auto; }</style>')
+
+
+def _write_zip(f, documents):
+    with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        if os.path.exists(LOGO_PATH):
+            zf.write(LOGO_PATH, 'static/fin.jpg')
+        index = io.StringIO()
+        writer = csv.writer(index)
+        writer.writerow(['file', 'loan_id', 'member_name', 'phone', 'due_amount', 'dpd'])
+        for entry, html in documents:
+            zf.writestr(entry['file'], html)
+            writer.writerow([entry['file'], entry['loan_id'], entry['member_name'], entry['phone'],
+                             entry['due_amount'], entry['dpd']])
+        zf.writestr('index.csv', '\ufeff' + index.getvalue())  # BOM: Excel opens Hindi names
+
+
+def _write_merged(f, documents, title):
+    f.write(b'<!DOCTYPE html>\n<html lang="en">\n')
+    started = False
+    for _, html in documents:
+        if not started:
+            head = _HEAD.search(html)
+            f.write(f"<head>{head.group(1) if head else ''}{_PAGE_BREAK_CSS}</head>\n<body>\n".encode('utf-8'))
+            started = True
+        body = _BODY.search(html)
+        f.write(f'<div class="batch-page">{body.group(1) if body else html}</div>\n'.encode('utf-8'))
+    if not started:
+        f.write(f"<head><meta charset=\"UTF-8\"><title>{title}</title></head>\n<body>\n"
+                f"<p>No loans matched.</p>\n".encode('utf-8'))
+    f.write(b'</body>\n</html>\n')
+
+
+def render_batch(path, fmt, kind, loans, title, as_of, base_url=None, workers=DEFAULT_WORKERS, progress=None):
+    """
+    Renders the documents of one kind for loans into path (zip or merged html); returns how many.
+    progress: job_queue's row counter - each finished document counts as a row.
+    """
+    if fmt not in FORMATS:
+        raise BatchError(f"Unknown format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+    spec = DOCUMENTS[kind]
+    current_date = dt.datetime.now().strftime('%d/%m/%Y')
+    entries = [{'file': f"{kind}_{loan['loan_id']}.html", 'loan_id': loan['loan_id'],
+                'member_name': loan['member_name'], 'phone': loan['phone'],
+                'due_amount': loan['due_amount'], 'dpd': loan['dpd']} for loan in loans]
+    if spec['var'] is None:
+        tasks = [(spec['template'], {'rows': loans, 'title': title, 'as_of': _dmy(as_of), 'current_date': current_date})]
+        entries = [{'file': f"{kind}_{as_of.isoformat()}.html", 'loan_id': '', 'member_name': '',
+                    'phone': '', 'due_amount': round(sum(loan['due_amount'] for loan in loans), 2), 'dpd': ''}]
+    else:
+        tasks = [(spec['template'], {spec['var']: loan, 'current_date': current_date}) for loan in loans]
+
+    static_url = 'static/'
+    if fmt == 'html' and base_url:
+        static_url = base_url.rstrip('/') + '/static/'
+    rendered = render_all(tasks, workers, static_url)
+    counted = progress.wrap(entries) if progress is not None else iter(entries)
+    documents = ((entry, html) for html, entry in zip(rendered, counted))  # counted once rendered
+
+    tmp_path = path + '.part'
+    with open(tmp_path, 'wb') as f:
+        if fmt == 'zip':
+            _write_zip(f, documents)
+        else:
+            _write_merged(f, documents, title)
+    os.replace(tmp_path, path)
+    return len(tasks)
+
+
+def write_batch(path, fmt, kind, filter_name, as_of=None, min_dpd=DEFAULT_MIN_DPD, base_url=None,
+                source=DEFAULT_SOURCE, workers=DEFAULT_WORKERS, progress=None):
+    """Selects the loans of a filter and renders one document kind for them; returns a summary."""
+    check_batch(kind, filter_name)
+    as_of = dt.date.fromisoformat(str(as_of)) if as_of else dt.date.today()
+    min_dpd = int(min_dpd)
+    loans = select_loans(filter_name, as_of, min_dpd, source)
+    documents = render_batch(path, fmt, kind, loans, TITLES[filter_name].format(min_dpd=min_dpd), as_of,
+                             base_url, workers, progress)
+    return {'kind': kind, 'filter': filter_name, 'as_of': as_of.isoformat(), 'documents': documents,
+            'loans': [loan['loan_id'] for loan in loans]}
+
+
+# =====================================================================
+# LEGAL NOTICE PIPELINE
+# =====================================================================
+
+NOTICE_REPEAT_DAYS = 15  # a notice gives 15 days to pay; no second notice for the loan before that
+
+_NOTICE_LOG_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS legal_notice_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        batch_id TEXT NOT NULL,
+        loan_id TEXT NOT NULL,
+        member_id TEXT,
+        notice_date TEXT NOT NULL,
+        last_emi_date TEXT,
+        dpd INTEGER,
+        due_amount REAL,
+        created_at TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS ix_legal_notice_log_loan_date ON legal_notice_log (loan_id, notice_date)',
+)
+
+
+def write_legal_notices(path, fmt, as_of=None, min_dpd=DEFAULT_MIN_DPD, repeat_days=NOTICE_REPEAT_DAYS,
+                        base_url=None, source=DEFAULT_SOURCE, workers=DEFAULT_WORKERS, progress=None):
+    """
+    Legal notices for every active loan min_dpd+ days past due that hasn't had one in the last
+    repeat_days, all in one file. Each included loan is recorded in legal_notice_log under the
+    artifact's name as batch_id (the job id when run by job_queue).
+    """
+    as_of = dt.date.fromisoformat(str(as_of)) if as_of else dt.date.today()
+    min_dpd, repeat_days = int(min_dpd), int(repeat_days)
+    batch_id = os.path.splitext(os.path.basename(path))[0]
+    backend = _backend(source)
+    try:
+        with backend.connect() as conn:
+            for ddl in _NOTICE_LOG_DDL:
+                conn.execute(ddl)
+        noticed_since = as_of - dt.timedelta(days=repeat_days) if repeat_days > 0 else None
+        loans = select_loans('dpd', as_of, min_dpd, source, noticed_since)
+        render_batch(path, fmt, 'legal_notice', loans, TITLES['dpd'].format(min_dpd=min_dpd), as_of,
+                     base_url, workers, progress)
+        created_at = dt.datetime.now().isoformat(timespec='seconds')
+        with backend.connect() as conn:
+            conn.executemany(
+                "INSERT INTO legal_notice_log (batch_id, loan_id, member_id, notice_date, last_emi_date, dpd, "
+                "due_amount, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(batch_id, loan['loan_id'], loan['member_id'], as_of.isoformat(), loan['last_emi_date'],
+                  loan['dpd'], loan['due_amount'], created_at) for loan in loans])
+    finally:
+        backend.dispose()
+
+    loan_ids = [loan['loan_id'] for loan in loans]
+    logger.debug("Legal notices %s: %d loans, %d+ DPD as of %s", batch_id, len(loan_ids), min_dpd, as_of)
+    return {'batch_id': batch_id, 'as_of': as_of.isoformat(), 'min_dpd': min_dpd, 'documents': len(loans),
+            'due_amount': round(sum(loan['due_amount'] for loan in loans), 2), 'loans': loan_ids}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render NOCs / stamps / legal notices / EMI due lists in bulk.")
+    parser.add_argument('kind', choices=list(DOCUMENTS) + ['legal_notices'],
+                        help="legal_notices: every overdue loan not noticed recently, recorded in legal_notice_log")
+    parser.add_argument('filter', nargs='?', choices=list(FILTERS))
+    parser.add_argument('--as-of', help="YYYY-MM-DD (default today)")
+    parser.add_argument('--min-dpd', type=int, default=DEFAULT_MIN_DPD)
+    parser.add_argument('--repeat-days', type=int, default=NOTICE_REPEAT_DAYS,
+                        help="legal_notices: skip loans noticed within this many days (0 = never skip)")
+    parser.add_argument('--format', choices=FORMATS, default='zip')
+    parser.add_argument('--out', help="Output file (default <kind>_<filter>.<format>)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help="SQLite file or postgres:// URL")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BASE_DIR)
+    if args.kind == 'legal_notices':
+        out = args.out or f"legal_notices_{args.as_of or dt.date.today().isoformat()}.{args.format}"
+        summary = write_legal_notices(out, args.format, args.as_of, args.min_dpd, args.repeat_days,
+                                      source=args.source, workers=args.workers)
+        print(f"{summary['documents']} notices, due {summary['due_amount']:.2f} -> {out}")
+        return 0
+    if args.filter is None:
+        parser.error("filter is required for single document kinds")
+    out = args.out or f"{args.kind}_{args.filter}.{args.format}"
+    try:
+        summary = write_batch(out, args.format, args.kind, args.filter, args.as_of, args.min_dpd,
+                              source=args.source, workers=args.workers)
+    except BatchError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    print(f"{summary['documents']} documents ({len(summary['loans'])} loans) -> {out}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
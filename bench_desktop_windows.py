@@ -0,0 +1,113 @@
+# bench_desktop_windows.py
+# Headless timing of the desktop windows on a synthetic book.
+#
+#   python bench_desktop_windows.py --customers 100000 --loans 50000
+#
+# Runs with the Qt 'offscreen' platform (no display needed) inside a temporary folder, so the
+# real microfinance.db is never touched. For each window it reports:
+#   open_ms        time the GUI thread was blocked constructing and showing the window
+#   first_page_ms  time until the first page of each paged model had arrived (background load)
+
+import argparse
+import datetime as dt
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+
+def seed(engine, customers, loans, schedule_per_loan):
+    """Bulk-loads synthetic customers, products, active loans and schedule rows."""
+    from database import Customer, LoanProduct, LoanAccount, AmortizationSchedule
+    today = dt.date.today()
+    with engine.begin() as conn:
+        conn.execute(Customer.__table__.insert(), [
+            {'id': i, 'full_name': f"Customer {i}", 'aadhaar_encrypted': 'gAAAAA-synthetic', 'address': 'Village'}
+            for i in range(1, customers + 1)
+        ])
+        conn.execute(LoanProduct.__table__.insert(), [
+            {'id': i, 'name': f"Daily Plan {i}", 'interest_rate': 0.24, 'term_months': 12} for i in range(1, 11)
+        ])
+        conn.execute(LoanAccount.__table__.insert(), [
+            {'id': i, 'customer_id': (i % customers) + 1, 'principal_amount': 10000.0, 'annual_interest_rate': 0.24,
+             'tenure_months': 4, 'tenure_days': 100, 'status': 'ACTIVE', 'disbursement_date': today - dt.timedelta(days=60)}
+            for i in range(1, loans + 1)
+        ])
+        conn.execute(AmortizationSchedule.__table__.insert(), [
+            {'loan_account_id': loan_id, 'installment_number': n, 'due_date': today - dt.timedelta(days=schedule_per_loan - n),
+             'principal_due': 100.0, 'interest_due': 20.0, 'total_emi': 120.0, 'paid_status': n % 3 != 0}
+            for loan_id in range(1, loans + 1) for n in range(1, schedule_per_loan + 1)
+        ])
+
+
+def wait_for(app, predicate, timeout=60.0):
+    started = time.perf_counter()
+    while not predicate():
+        app.processEvents()
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError("window did not finish loading")
+        time.sleep(0.001)
+    return time.perf_counter() - started
+
+
+def time_window(app, name, factory, models_of):
+    started = time.perf_counter()
+    window = factory()
+    window.show()
+    open_ms = (time.perf_counter() - started) * 1000
+    models = models_of(window)
+    first_page_ms = (time.perf_counter() - started) * 1000
+    if models:
+        wait_for(app, lambda: all(m.rowCount() > 0 or not m.canFetchMore() for m in models))
+        first_page_ms = (time.perf_counter() - started) * 1000
+    print(f"{name:<24} open_ms={open_ms:8.1f}  first_page_ms={first_page_ms:8.1f}  "
+          f"rows_loaded={[m.rowCount() for m in models]}")
+    window.close()
+    return open_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless desktop window open-time benchmark.")
+    parser.add_argument('--customers', type=int, default=100000)
+    parser.add_argument('--loans', type=int, default=50000)
+    parser.add_argument('--schedule', type=int, default=10, help="Schedule rows per loan")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='mfi_bench_')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)  # database.py uses ./microfinance.db
+    if 'MFI_ENCRYPTION_KEYS' not in os.environ:
+        # Throwaway key: the synthetic rows are never decrypted
+        from cryptography.fernet import Fernet
+        os.environ['MFI_ENCRYPTION_KEYS'] = 'bench:' + Fernet.generate_key().decode()
+
+    from PyQt6.QtWidgets import QApplication
+    from database import engine, create_tables
+    import main_app
+
+    create_tables()
+    started = time.perf_counter()
+    seed(engine, args.customers, args.loans, args.schedule)
+    print(f"Seeded {args.customers} customers / {args.loans} loans in {time.perf_counter() - started:.1f}s ({workdir})")
+
+    app = QApplication(sys.argv)
+    time_window(app, "CustomerListView", main_app.CustomerListView,
+                lambda w: [w.customer_model])
+    time_window(app, "CollectionEntryWindow", main_app.CollectionEntryWindow,
+                lambda w: [w.loan_model])
+    time_window(app, "LoanOriginationWindow", lambda: main_app.LoanOriginationWindow(None),
+                lambda w: [w.customer_model, w.product_model])
+
+    started = time.perf_counter()
+    window = main_app.ReportingWindow()
+    window.show()
+    open_ms = (time.perf_counter() - started) * 1000
+    wait_for(app, lambda: window.ce_calc_btn.isEnabled() and window.par_results.rowCount() == 4)
+    print(f"{'ReportingWindow':<24} open_ms={open_ms:8.1f}  reports_ms={(time.perf_counter() - started) * 1000:8.1f}")
+    window.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+# bench_parallel_reports.py
+# Multi-year P&L / loan dispatch / collection efficiency: one query over the whole range vs.
+# parallel_reports' month partitions at several worker counts.
+#
+#   python bench_parallel_reports.py                          # 5 years, 2M payments, workers 1 2 4 8
+#   python bench_parallel_reports.py --years 2 --payments 300000 --workers 1 2
+#
+# Runs in a temporary folder (database.py uses ./microfinance.db), so the real DB is untouched.
+# Speedup needs free cores: the pool cannot beat the single query on a one-core machine.
+
+import argparse
+import datetime as dt
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+SCHEMA = """
+CREATE TABLE members (id INTEGER PRIMARY KEY, full_name TEXT, phone_number TEXT);
+CREATE TABLE loans (loan_id TEXT PRIMARY KEY, member_id INTEGER, amount REAL, loan_date TEXT,
+                    loan_closed_date TEXT, total_paid REAL);
+CREATE TABLE payments (id INTEGER PRIMARY KEY, loan_id TEXT, pay_date TEXT, type TEXT, interest_amount REAL);
+CREATE TABLE fees (id INTEGER PRIMARY KEY, fee_date TEXT, amount REAL);
+CREATE TABLE expenses (id INTEGER PRIMARY KEY, date TEXT, category TEXT, amount REAL);
+CREATE INDEX ix_loans_loan_date ON loans (loan_date);
+CREATE INDEX ix_payments_pay_date ON payments (pay_date);
+CREATE INDEX ix_fees_fee_date ON fees (fee_date);
+CREATE INDEX ix_expenses_date ON expenses (date);
+"""
+
+
+def _day(start, days, rng):
+    return (start + dt.timedelta(days=rng.randrange(days))).isoformat()
+
+
+def seed_sql(path, start, days, payments, loans, rng):
+    """Only the columns the partitioned queries read (same index names as app.create_report_date_indexes)."""
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO members VALUES (?, ?, ?)",
+                     ((i, f"Member {i}", f"98{i:08d}") for i in range(1, loans // 3 + 2)))
+    conn.executemany("INSERT INTO loans VALUES (?, ?, ?, ?, ?, ?)",
+                     ((f"L{i:07d}", rng.randint(1, loans // 3 + 1), 25000.0, _day(start, days, rng), None,
+                       round(rng.uniform(0, 30000), 2)) for i in range(loans)))
+    conn.executemany("INSERT INTO payments (loan_id, pay_date, type, interest_amount) VALUES (?, ?, ?, ?)",
+                     ((f"L{rng.randrange(loans):07d}", _day(start, days, rng), 'emi' if n % 10 else 'principal',
+                       round(rng.uniform(20, 400), 2)) for n in range(payments)))
+    conn.executemany("INSERT INTO fees (fee_date, amount) VALUES (?, ?)",
+                     ((_day(start, days, rng), 100.0) for _ in range(loans)))
+    conn.executemany("INSERT INTO expenses (date, category, amount) VALUES (?, ?, ?)",
+                     ((_day(start, days, rng), rng.choice(['operating', 'other']), round(rng.uniform(100, 5000), 2))
+                      for _ in range(payments // 20)))
+    conn.commit()
+    conn.close()
+
+
+def seed_orm(start, days, rows, rng):
+    from database import engine, Customer, LoanAccount, AmortizationSchedule, CollectionTransaction
+    with engine.begin() as conn:
+        conn.execute(Customer.__table__.insert(), [{'id': 1, 'full_name': 'Bench'}])
+        conn.execute(LoanAccount.__table__.insert(), [
+            {'id': i, 'customer_id': 1, 'principal_amount': 10000.0, 'annual_interest_rate': 0.24,
+             'tenure_months': 12, 'status': 'ACTIVE'} for i in range(1, 1001)
+        ])
+        conn.execute(AmortizationSchedule.__table__.insert(), [
+            {'loan_account_id': rng.randint(1, 1000), 'installment_number': n % 12 + 1,
+             'due_date': start + dt.timedelta(days=rng.randrange(days)), 'total_emi': 950.0, 'paid_status': False}
+            for n in range(rows)
+        ])
+        conn.execute(CollectionTransaction.__table__.insert(), [
+            {'loan_account_id': rng.randint(1, 1000), 'amount_paid': round(rng.uniform(500, 950), 2),
+             'payment_date': start + dt.timedelta(days=rng.randrange(days))}
+            for _ in range(rows * 3 // 4)
+        ])
+
+
+def serial_pnl(path, from_date, to_date):
+    """The unpartitioned queries of app.get_pnl_report_data."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    interest = conn.execute("""SELECT COALESCE(SUM(interest_amount), 0) FROM payments
+                               WHERE pay_date BETWEEN ? AND ? AND type = 'emi'""", (from_date, to_date)).fetchone()[0]
+    fees = conn.execute("SELECT COALESCE(SUM(amount), 0) FROM fees WHERE fee_date BETWEEN ? AND ?",
+                        (from_date, to_date)).fetchone()[0]
+    operating = conn.execute("""SELECT COALESCE(SUM(amount), 0) FROM expenses
+                                WHERE date BETWEEN ? AND ? AND category = 'operating'""",
+                             (from_date, to_date)).fetchone()[0]
+    conn.close()
+    return round(interest, 2), round(fees, 2), round(operating, 2)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark month-partitioned parallel reports.")
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--payments', type=int, default=2000000)
+    parser.add_argument('--loans', type=int, default=200000)
+    parser.add_argument('--schedules', type=int, default=300000, help="AmortizationSchedule rows (ORM report)")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix='mfi_parallel_bench_')
+    os.chdir(workdir)
+
+    import parallel_reports
+    from reporting_logic import calculate_collection_efficiency
+    from database import SessionLocal, create_tables
+
+    rng = random.Random(42)
+    start = dt.date(dt.date.today().year - args.years, 1, 1)
+    end = dt.date(dt.date.today().year - 1, 12, 31)
+    days = (end - start).days + 1
+    path = os.path.join(workdir, 'bench.db')
+    started = time.perf_counter()
+    seed_sql(path, start, days, args.payments, args.loans, rng)
+    create_tables()
+    seed_orm(start, days, args.schedules, rng)
+    months = len(parallel_reports.month_partitions(start, end))
+    print(f"Seeded {args.payments:,} payments, {args.loans:,} loans, {args.schedules:,} schedules "
+          f"over {months} months in {time.perf_counter() - started:.1f}s ({workdir})")
+    print(f"cpu_count={os.cpu_count()}")
+
+    from_date, to_date = start.isoformat(), end.isoformat()
+    base, expected = timed(lambda: serial_pnl(path, from_date, to_date))
+    print(f"{'pnl single query':<36} {base:7.2f}s")
+    for workers in args.workers:
+        seconds, result = timed(lambda: parallel_reports.parallel_pnl(from_date, to_date, path, workers))
+        same = (result['interest_income'], result['other_income'], result['operating_expenses']) == expected
+        print(f"{f'pnl parallel, {workers} workers':<36} {seconds:7.2f}s  speedup={base / seconds:5.2f}x  "
+              f"same={same}")
+
+    conn = sqlite3.connect(path)
+    base, expected = timed(lambda: conn.execute("""
+        SELECT COUNT(*) FROM loans l JOIN members m ON l.member_id = m.id WHERE l.loan_date BETWEEN ? AND ?
+    """, (from_date, to_date)).fetchone()[0])
+    conn.close()
+    for workers in args.workers:
+        seconds, rows = timed(lambda: parallel_reports.parallel_loan_dispatch(from_date, to_date, path, workers))
+        print(f"{f'loan dispatch, {workers} workers':<36} {seconds:7.2f}s  rows={len(rows):,} "
+              f"same={len(rows) == expected}")
+
+    db = SessionLocal()
+    base, expected = timed(lambda: calculate_collection_efficiency(db, start, end))
+    db.close()
+    print(f"{'collection efficiency single query':<36} {base:7.2f}s")
+    for workers in args.workers:
+        seconds, result = timed(lambda: parallel_reports.parallel_collection_efficiency(start, end, workers))
+        print(f"{f'collection efficiency, {workers} workers':<36} {seconds:7.2f}s  speedup={base / seconds:5.2f}x  "
+              f"same={result == expected}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# bench_sync_stream.py
+# Full /sync/loan_schedules download at ~1M schedule rows: streamed body vs. the old
+# "build a list of ScheduleItem objects" approach.
+#
+#   python bench_sync_stream.py                 # 100k loans x 10 open installments = 1M rows
+#   python bench_sync_stream.py --loans 20000   # quicker run
+#
+# Runs in a temporary folder (database.py uses ./microfinance.db), so the real DB is untouched.
+# Peak memory is measured with tracemalloc (Python allocations only).
+
+import argparse
+import datetime as dt
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def seed(engine, loans, per_loan):
+    from database import Customer, LoanAccount, AmortizationSchedule
+    today = dt.date.today()
+    with engine.begin() as conn:
+        conn.execute(Customer.__table__.insert(), [{'id': 1, 'full_name': 'Bench'}])
+        conn.execute(LoanAccount.__table__.insert(), [
+            {'id': i, 'customer_id': 1, 'principal_amount': 10000.0, 'annual_interest_rate': 0.24,
+             'tenure_months': 4, 'status': 'ACTIVE', 'collector_id': f"C{i % 50}"}
+            for i in range(1, loans + 1)
+        ])
+        batch = []
+        for loan_id in range(1, loans + 1):
+            for n in range(1, per_loan + 1):
+                batch.append({'loan_account_id': loan_id, 'installment_number': n,
+                              'due_date': today + dt.timedelta(days=n), 'total_emi': 120.0, 'paid_status': False})
+            if len(batch) >= 50000:
+                conn.execute(AmortizationSchedule.__table__.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(AmortizationSchedule.__table__.insert(), batch)
+
+
+def measure(label, fn, memory=True):
+    """Times fn() on its own, then (optionally) runs it again under tracemalloc for peak memory."""
+    started = time.perf_counter()
+    size = fn()
+    seconds = time.perf_counter() - started
+    peak_text = "skipped"
+    if memory:
+        # Separate pass: tracemalloc slows allocation-heavy code several times over
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_text = f"{peak / 1e6:8.1f} MB"
+    print(f"{label:<28} {seconds:7.2f}s  body={size / 1e6:8.1f} MB  peak_py_mem={peak_text}")
+
+
+def materialized_body():
+    """The previous implementation: ORM rows -> list of ScheduleItem -> one JSON document."""
+    import json
+    from database import SessionLocal, LoanAccount, AmortizationSchedule
+    from sync_api import ScheduleItem
+    session = SessionLocal()
+    try:
+        schedules = session.query(AmortizationSchedule).join(LoanAccount).filter(
+            LoanAccount.status == 'ACTIVE',
+            AmortizationSchedule.paid_status == False
+        ).all()
+        items = [ScheduleItem(schedule_id=i.id, loan_id=i.loan_account_id, installment_number=i.installment_number,
+                              due_date=i.due_date, total_emi=i.total_emi, paid_status=i.paid_status).model_dump(mode='json')
+                 for i in schedules]
+        return len(json.dumps(items).encode())
+    finally:
+        session.close()
+
+
+def streamed_body(fmt, encoding, collector_id=None):
+    from sync_api import stream_schedules
+    return sum(len(chunk) for chunk in stream_schedules(0, None, collector_id, None, fmt, encoding))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streamed schedule sync at ~1M rows.")
+    parser.add_argument('--loans', type=int, default=100000)
+    parser.add_argument('--per-loan', type=int, default=10)
+    parser.add_argument('--skip-materialized', action='store_true', help="Skip the slow list-based baseline")
+    parser.add_argument('--no-memory', action='store_true', help="Timing pass only")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix='mfi_sync_bench_')
+    os.chdir(workdir)
+
+    from database import engine, create_tables, upgrade_schema
+    create_tables()
+    upgrade_schema()
+    started = time.perf_counter()
+    seed(engine, args.loans, args.per_loan)
+    print(f"Seeded {args.loans * args.per_loan:,} schedule rows in {time.perf_counter() - started:.1f}s ({workdir})")
+
+    if not args.skip_materialized:
+        measure("materialized list (old)", materialized_body, not args.no_memory)
+    measure("stream json", lambda: streamed_body('json', None), not args.no_memory)
+    measure("stream ndjson", lambda: streamed_body('ndjson', None), not args.no_memory)
+    measure("stream json + gzip", lambda: streamed_body('json', 'gzip'), not args.no_memory)
+    measure("stream ndjson + deflate", lambda: streamed_body('ndjson', 'deflate'), not args.no_memory)
+    measure("stream json, one collector", lambda: streamed_body('json', 'gzip', 'C7'), not args.no_memory)
+
+
+if __name__ == '__main__':
+    main()
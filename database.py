@@ -1,20 +1,78 @@
+import os
 import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.pool import QueuePool, StaticPool
 import datetime as dt
+import slow_query_log
 
 # =====================================================================
 # 1. DATABASE CONFIGURATION - SWITCHED TO SQLITE
 # =====================================================================
 
 # This will create a local file named 'microfinance.db' in your MFI_Software folder.
-DATABASE_URL = "sqlite:///./microfinance.db" 
+# MFI_DATABASE_URL overrides it (e.g. a server database for the sync API).
+DATABASE_URL = os.environ.get("MFI_DATABASE_URL", "sqlite:///./microfinance.db")
 
 # Note: You can remove the psycopg2-binary package as it's no longer needed.
 
-engine = sa.create_engine(DATABASE_URL)
+# Applied to every new SQLite connection (see make_engine)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',      # readers (reports, sync downloads) don't block the writer
+    'synchronous': 'NORMAL',    # durable at checkpoints; safe with WAL and far fewer fsyncs
+    'cache_size': -64000,       # negative = KiB, so ~64 MB page cache per connection
+    'temp_store': 'MEMORY',     # sorts / GROUP BY temp tables stay off disk
+    'mmap_size': 268435456,     # 256 MB memory-mapped reads
+    'busy_timeout': 5000,       # wait up to 5 s for a lock instead of failing with "database is locked"
+}
+
+# sync_api keeps DB_WORKERS + DB_MAX_STREAMS (4 + 8) connections busy; leave headroom for the rest
+POOL_SIZE = int(os.environ.get("MFI_DB_POOL_SIZE", 12))
+MAX_OVERFLOW = int(os.environ.get("MFI_DB_MAX_OVERFLOW", 8))
+POOL_RECYCLE = 1800 # Seconds; server databases drop idle connections
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def make_engine(url=DATABASE_URL, **kwargs):
+    """Creates an engine tuned for its backend.
+
+    SQLite: pragmas on every connection; QueuePool for a file, StaticPool (one shared
+    connection) for :memory:. Other backends: sized QueuePool with pre-ping and recycle.
+    Keyword arguments override the defaults.
+    """
+    url = sa.engine.make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        connect_args = kwargs.setdefault('connect_args', {})
+        connect_args.setdefault('check_same_thread', False) # Sessions run on worker threads
+        if url.database in (None, '', ':memory:'):
+            kwargs.setdefault('poolclass', StaticPool)
+        else:
+            kwargs.setdefault('poolclass', QueuePool)
+            kwargs.setdefault('pool_size', POOL_SIZE)
+            kwargs.setdefault('max_overflow', MAX_OVERFLOW)
+        new_engine = sa.create_engine(url, **kwargs)
+        sa.event.listen(new_engine, "connect", _apply_sqlite_pragmas)
+        return new_engine
+
+    kwargs.setdefault('poolclass', QueuePool)
+    kwargs.setdefault('pool_size', POOL_SIZE)
+    kwargs.setdefault('max_overflow', MAX_OVERFLOW)
+    kwargs.setdefault('pool_pre_ping', True)
+    kwargs.setdefault('pool_recycle', POOL_RECYCLE)
+    return sa.create_engine(url, **kwargs)
+
+engine = make_engine()
+slow_query_log.install()  # statements over SLOW_QUERY_MS -> slow_queries.log (all engines)
 Base = declarative_base()
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: objects stay readable after commit (no reload query per attribute,
+# no DetachedInstanceError once the session is closed). Re-query when fresh values matter.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 # ... (rest of the file remains the same) ...
 # =====================================================================
@@ -44,11 +102,15 @@ class Customer(CustomBase):
     id = sa.Column(sa.Integer, primary_key=True, index=True)
     full_name = sa.Column(sa.String, index=True)
     aadhaar_encrypted = sa.Column(sa.String) # Encrypt this data!
+    aadhaar_key_id = sa.Column(sa.String(16), index=True) # Keyring ID used for aadhaar_encrypted (rotation)
+    aadhaar_bidx = sa.Column(sa.String(64), unique=True, index=True) # HMAC blind index (encryption_utils.blind_index)
     address = sa.Column(sa.String)
     date_joined = sa.Column(sa.DateTime, default=sa.func.now())
     
     # Relationship to get all loans for a customer
-    loan_accounts = relationship("LoanAccount", back_populates="customer")
+    # Loading strategies: collections raise instead of lazy-loading per row (use selectinload()
+    # in the query when they are needed); many-to-one parents load with a batched SELECT IN.
+    loan_accounts = relationship("LoanAccount", back_populates="customer", lazy="raise_on_sql")
 
 # --- 3.2 Loan Product Table ---
 class LoanProduct(CustomBase):
@@ -78,11 +140,19 @@ class LoanAccount(CustomBase):
     tenure_days = sa.Column(sa.Integer, default=0) # Extra days for flexibility
     
     status = sa.Column(sa.String, default="Active") # e.g., 'Active', 'Closed', 'Defaulted'
+
+    # Field assignment (mobile sync filters on these)
+    collector_id = sa.Column(sa.String, index=True)
+    branch_id = sa.Column(sa.String, index=True)
+
+    # Delta sync cursor: set on every insert/update (see reserve_change_seq)
+    change_seq = sa.Column(sa.Integer, index=True)
     
     # Relationships
-    customer = relationship("Customer", back_populates="loan_accounts")
-    schedule = relationship("AmortizationSchedule", back_populates="loan_account")
-    transactions = relationship("CollectionTransaction", back_populates="loan_account")
+    customer = relationship("Customer", back_populates="loan_accounts", lazy="selectin")
+    schedule = relationship("AmortizationSchedule", back_populates="loan_account", lazy="raise_on_sql",
+                            order_by="AmortizationSchedule.installment_number")
+    transactions = relationship("CollectionTransaction", back_populates="loan_account", lazy="raise_on_sql")
 
 # --- 3.4 Amortization Schedule Table (Expected Repayment Plan) ---
 class AmortizationSchedule(CustomBase):
@@ -99,8 +169,16 @@ class AmortizationSchedule(CustomBase):
     total_emi = sa.Column(sa.Float, default=0.0)
     
     paid_status = sa.Column(sa.Boolean, default=False)
+
+    change_seq = sa.Column(sa.Integer, index=True) # Delta sync cursor (see reserve_change_seq)
     
-    loan_account = relationship("LoanAccount", back_populates="schedule")
+    loan_account = relationship("LoanAccount", back_populates="schedule", lazy="raise_on_sql")
+
+# Per-loan schedule lookups (sync downloads, collection allocation) read installments in order
+sa.Index('ix_amortization_schedule_loan_installment',
+         AmortizationSchedule.loan_account_id, AmortizationSchedule.installment_number)
+# Date-range reports (collection efficiency, month partitions in parallel_reports)
+sa.Index('ix_amortization_schedule_due_date', AmortizationSchedule.due_date)
 
 # --- 3.5 Collection Transaction Table (Actual Payments) ---
 class CollectionTransaction(CustomBase):
@@ -118,7 +196,9 @@ class CollectionTransaction(CustomBase):
     # Link to General Ledger entries for audit trail (Optional but good practice)
     gl_entry_id = sa.Column(sa.Integer, sa.ForeignKey("general_ledger.id"), nullable=True) 
     
-    loan_account = relationship("LoanAccount", back_populates="transactions")
+    loan_account = relationship("LoanAccount", back_populates="transactions", lazy="raise_on_sql")
+
+sa.Index('ix_collection_transactions_payment_date', CollectionTransaction.payment_date)
 
 # --- 3.6 General Ledger (For Accounting) ---
 class GeneralLedger(CustomBase):
@@ -134,6 +214,107 @@ class GeneralLedger(CustomBase):
     narration = sa.Column(sa.String)
 
 
+# --- 3.7 Sync Bookkeeping (Delta sync for mobile collectors) ---
+class SyncCounter(CustomBase):
+    __tablename__ = "sync_counters"
+
+    name = sa.Column(sa.String, primary_key=True) # 'change_seq'
+    value = sa.Column(sa.Integer, nullable=False, default=0)
+
+class SyncTombstone(CustomBase):
+    """Rows that left a collector's book (deleted, or loan moved to another collector/branch)."""
+    __tablename__ = "sync_tombstones"
+
+    id = sa.Column(sa.Integer, primary_key=True, index=True)
+    entity = sa.Column(sa.String, nullable=False) # 'loan' or 'schedule'
+    entity_id = sa.Column(sa.Integer, nullable=False)
+    loan_account_id = sa.Column(sa.Integer)
+    collector_id = sa.Column(sa.String, index=True)
+    branch_id = sa.Column(sa.String, index=True)
+    change_seq = sa.Column(sa.Integer, nullable=False, index=True)
+    created_at = sa.Column(sa.DateTime, default=sa.func.now())
+
+class SyncDevice(CustomBase):
+    """Per-device upload acknowledgement: the highest collection chunk sequence applied."""
+    __tablename__ = "sync_devices"
+
+    device_id = sa.Column(sa.String, primary_key=True)
+    last_seq = sa.Column(sa.Integer, nullable=False, default=0)
+    applied_items = sa.Column(sa.Integer, nullable=False, default=0)
+    last_seen_at = sa.Column(sa.DateTime, default=sa.func.now())
+
+
+# =====================================================================
+# 3.8 CHANGE SEQUENCE (Delta sync cursor)
+# =====================================================================
+# Every insert/update of a loan or schedule row gets the next value of the 'change_seq' counter,
+# so mobile clients can ask for "everything after cursor N". The counter row is updated inside
+# the writing transaction, which also serializes writers: sequence values become visible in
+# commit order and a reader's cursor never skips a row.
+#
+# ORM flushes are tagged automatically (before_flush below). Bulk Core/ORM UPDATEs bypass the
+# flush, so they must set change_seq=reserve_change_seq(session) themselves.
+
+CHANGE_SEQ = 'change_seq'
+SYNC_TRACKED_MODELS = (LoanAccount, AmortizationSchedule)
+
+def reserve_change_seq(session, name=CHANGE_SEQ) -> int:
+    """Increments the named counter inside the session's transaction and returns the new value."""
+    conn = session.connection()
+    counters = SyncCounter.__table__
+    result = conn.execute(
+        counters.update().where(counters.c.name == name).values(value=counters.c.value + 1)
+    )
+    if result.rowcount == 0:
+        conn.execute(counters.insert().values(name=name, value=1))
+    return conn.execute(sa.select(counters.c.value).where(counters.c.name == name)).scalar_one()
+
+def current_change_seq(session, name=CHANGE_SEQ) -> int:
+    """Latest committed sequence value (the cursor to hand back to a syncing client)."""
+    counters = SyncCounter.__table__
+    return session.connection().execute(
+        sa.select(counters.c.value).where(counters.c.name == name)
+    ).scalar() or 0
+
+def _loan_tombstone(loan, seq, collector_id, branch_id):
+    return SyncTombstone(entity='loan', entity_id=loan.id, loan_account_id=loan.id,
+                         collector_id=collector_id, branch_id=branch_id, change_seq=seq)
+
+@sa.event.listens_for(SessionLocal, "before_flush")
+def _tag_sync_changes(session, flush_context, instances):
+    changed = [obj for obj in list(session.new) + list(session.dirty)
+               if isinstance(obj, SYNC_TRACKED_MODELS) and (obj in session.new or session.is_modified(obj))]
+    deleted = [obj for obj in session.deleted if isinstance(obj, SYNC_TRACKED_MODELS)]
+    if not changed and not deleted:
+        return
+
+    seq = reserve_change_seq(session)
+    for obj in changed:
+        obj.change_seq = seq
+        if isinstance(obj, LoanAccount) and obj not in session.new:
+            # Loan reassigned: the previous collector/branch must drop it
+            state = sa.inspect(obj)
+            if state.attrs.collector_id.history.added or state.attrs.branch_id.history.added:
+                # Old values may have been expired, so read them from the row (not yet flushed)
+                loans = LoanAccount.__table__
+                old = session.connection().execute(
+                    sa.select(loans.c.collector_id, loans.c.branch_id).where(loans.c.id == obj.id)
+                ).first()
+                if old and (old.collector_id, old.branch_id) != (obj.collector_id, obj.branch_id):
+                    session.add(_loan_tombstone(obj, seq, old.collector_id, old.branch_id))
+    for obj in deleted:
+        if isinstance(obj, LoanAccount):
+            session.add(_loan_tombstone(obj, seq, obj.collector_id, obj.branch_id))
+        else:
+            loan = session.get(LoanAccount, obj.loan_account_id) # Identity map first (relationship is raise_on_sql)
+            session.add(SyncTombstone(
+                entity='schedule', entity_id=obj.id, loan_account_id=obj.loan_account_id,
+                collector_id=loan.collector_id if loan else None,
+                branch_id=loan.branch_id if loan else None,
+                change_seq=seq
+            ))
+
+
 # =====================================================================
 # 4. DATABASE CREATION FUNCTION
 # =====================================================================
@@ -144,9 +325,30 @@ def create_tables():
     Base.metadata.create_all(bind=engine)
     print("Database tables created successfully!")
 
+def upgrade_schema():
+    """Adds columns/indexes introduced after a table was first created.
+
+    create_all() skips existing tables, so new model columns are added with ALTER TABLE here.
+    """
+    inspector = sa.inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(sa.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+                    print(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    Base.metadata.create_all(bind=engine)
+
 # =====================================================================
 # 5. EXECUTION BLOCK (Run only when script is executed directly)
 # =====================================================================
 
 if __name__ == "__main__":
-    create_tables()
\ No newline at end of file
+    create_tables()
+    upgrade_schema()
\ No newline at end of file
@@ -0,0 +1,616 @@
+# db_backend.py
+# Thin data-access layer for the Flask app (app.py): the same code runs on SQLite or PostgreSQL.
+#
+#   DATABASE_URL unset / sqlite:///file.db   -> sqlite3, one connection per request
+#   DATABASE_URL=postgres://user:pw@host/db  -> psycopg2 with a thread-safe connection pool
+#
+# app.py keeps writing SQLite-style SQL ('?' placeholders, INSERT OR IGNORE, AUTOINCREMENT,
+# BEGIN IMMEDIATE). translate_sql() rewrites it for Postgres once per statement (cached).
+# Rows support both row[0] and row['column'] on either backend.
+#
+# Connections work like sqlite3's: `with get_db_connection() as conn:` commits on success and
+# rolls back on error; leaving the block also closes the connection (Postgres: back to the pool).
+#
+# Reports can read from a replica instead (create_report_backend): on SQLite a read-only copy of the
+# file refreshed in the background with the backup API, on Postgres REPORT_DATABASE_URL (a standby).
+
+import atexit
+import glob
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+try:
+    import psycopg2
+    import psycopg2.extras
+    import psycopg2.pool
+except ImportError:  # SQLite-only installs (desktop)
+    psycopg2 = None
+
+# Catch these instead of sqlite3.* so error handling works on both backends
+if psycopg2 is not None:
+    DatabaseError = (sqlite3.DatabaseError, psycopg2.DatabaseError)
+    OperationalError = (sqlite3.OperationalError, psycopg2.OperationalError)
+    IntegrityError = (sqlite3.IntegrityError, psycopg2.IntegrityError)
+else:
+    DatabaseError = (sqlite3.DatabaseError,)
+    OperationalError = (sqlite3.OperationalError,)
+    IntegrityError = (sqlite3.IntegrityError,)
+
+SQLITE_BUSY_TIMEOUT_MS = 5000
+PG_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+PG_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+REPLICA_REFRESH_SECONDS = float(os.environ.get('REPORT_REPLICA_REFRESH_SECONDS', 60))
+REPLICA_MAX_AGE_SECONDS = float(os.environ.get('REPORT_REPLICA_MAX_AGE', 600))  # older -> reports use the primary
+REPLICA_BACKUP_PAGES = 256  # pages per backup step; live writers get the lock between steps
+
+logger = logging.getLogger(__name__)
+
+# listener(sql, params, seconds, backend_name, raw_connection, error) after every statement, failed
+# ones included with the exception as error (request_profiler, slow_query_log, metrics). sql/params
+# are what the driver got (on Postgres the translated statement); executemany passes params=None.
+# Empty list: statements aren't timed.
+QUERY_LISTENERS = []
+# listener(seconds, outcome, backend_name) when a Connection that wrote commits / rolls back;
+# seconds run from its first BEGIN/INSERT/UPDATE/DELETE, lock wait included (metrics)
+TRANSACTION_LISTENERS = []
+_WRITE_STATEMENT = re.compile(r'^\s*(BEGIN|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+# =====================================================================
+# SQL TRANSLATION (SQLite dialect -> PostgreSQL)
+# =====================================================================
+
+_INSERT_OR_IGNORE = re.compile(r'^\s*INSERT\s+OR\s+IGNORE\s+INTO\b', re.IGNORECASE)
+_AUTOINCREMENT_PK = re.compile(r'\bINTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT\b', re.IGNORECASE)
+_ADD_COLUMN = re.compile(r'\bADD\s+COLUMN\s+(?!IF\s+NOT\s+EXISTS)', re.IGNORECASE)
+_IS_DDL = re.compile(r'^\s*(CREATE\s+TABLE|ALTER\s+TABLE)\b', re.IGNORECASE)
+# SQLite stores dates as text and the app parses them with strptime(), so keep them text
+_DDL_TYPES = [
+    (re.compile(r'\bREAL\b'), 'DOUBLE PRECISION'),
+    (re.compile(r'\bTIMESTAMP\b'), 'TEXT'),
+    (re.compile(r'\bDATE\b'), 'TEXT'),
+]
+_SKIP_ON_POSTGRES = re.compile(r'^\s*(BEGIN(\s+(IMMEDIATE|DEFERRED|EXCLUSIVE))?|PRAGMA\b.*)\s*;?\s*$', re.IGNORECASE)
+
+
+def _rewrite_placeholders(sql, escape_percent):
+    """'?' -> '%s' outside string literals, identifiers and comments ('%' -> '%%' when formatting)."""
+    out = []
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch in ("'", '"'):
+            end = sql.find(ch, i + 1)
+            while end != -1 and end + 1 < n and sql[end + 1] == ch:  # doubled quote escape
+                end = sql.find(ch, end + 2)
+            end = n if end == -1 else end + 1
+            chunk = sql[i:end]
+            out.append(chunk.replace('%', '%%') if escape_percent else chunk)
+            i = end
+        elif ch == '-' and sql.startswith('--', i):
+            end = sql.find('\n', i)
+            end = n if end == -1 else end
+            chunk = sql[i:end]
+            out.append(chunk.replace('%', '%%') if escape_percent else chunk)
+            i = end
+        elif ch == '?':
+            out.append('%s')
+            i += 1
+        elif ch == '%' and escape_percent:
+            out.append('%%')
+            i += 1
+        else:
+            out.append(ch)
+            i += 1
+    return ''.join(out)
+
+
+@lru_cache(maxsize=1024)
+def translate_sql(sql, escape_percent=True):
+    """Rewrites one SQLite-dialect statement for PostgreSQL. Returns None if it should be skipped."""
+    if _SKIP_ON_POSTGRES.match(sql):
+        # Postgres opens the transaction implicitly; row locks taken by UPDATE serialize writers
+        return None
+    if _IS_DDL.match(sql):
+        sql = _AUTOINCREMENT_PK.sub('SERIAL PRIMARY KEY', sql)
+        sql = _ADD_COLUMN.sub('ADD COLUMN IF NOT EXISTS ', sql)
+        for pattern, replacement in _DDL_TYPES:
+            sql = pattern.sub(replacement, sql)
+    if _INSERT_OR_IGNORE.match(sql):
+        sql = _INSERT_OR_IGNORE.sub('INSERT INTO', sql).rstrip().rstrip(';') + ' ON CONFLICT DO NOTHING'
+    return _rewrite_placeholders(sql, escape_percent)
+
+
+# =====================================================================
+# CONNECTION / CURSOR WRAPPERS
+# =====================================================================
+
+def _notify_listeners(sql, params, seconds, backend_name, raw_connection, error=None):
+    for listener in QUERY_LISTENERS:
+        try:
+            listener(sql, params, seconds, backend_name, raw_connection, error)
+        except Exception:  # a broken listener must not fail the query
+            pass
+
+
+_sqlalchemy_forwarded = False
+
+
+def forward_sqlalchemy_queries():
+    """Reports statements run through any SQLAlchemy engine (database.py) to QUERY_LISTENERS too."""
+    global _sqlalchemy_forwarded
+    if _sqlalchemy_forwarded:
+        return
+    try:
+        import sqlalchemy as sa
+    except ImportError:
+        return
+
+    def backend_name(conn):
+        return 'postgres' if conn.dialect.name == 'postgresql' else conn.dialect.name
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['query_started'].pop()
+        _notify_listeners(statement, None if executemany else parameters, seconds, backend_name(conn),
+                          cursor.connection)
+
+    def failed(context):
+        # Observer only: whatever goes wrong here, SQLAlchemy must go on to raise the original error
+        try:
+            conn = context.connection
+            started = conn.info.get('query_started') if conn is not None else None
+            if not started:
+                return
+            seconds = time.perf_counter() - started.pop()
+            execution = context.execution_context
+            params = None if execution is None or execution.executemany else context.parameters
+            cursor = getattr(execution, 'cursor', None)
+            _notify_listeners(context.statement, params, seconds, backend_name(conn),
+                              cursor.connection if cursor is not None else None, context.original_exception)
+        except Exception:
+            pass
+
+    sa.event.listen(sa.engine.Engine, 'before_cursor_execute', before)
+    sa.event.listen(sa.engine.Engine, 'after_cursor_execute', after)
+    sa.event.listen(sa.engine.Engine, 'handle_error', failed)
+    _sqlalchemy_forwarded = True
+
+
+class _InstrumentedSQLiteCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        if not QUERY_LISTENERS:
+            return super().execute(sql, params)
+        started, error = time.perf_counter(), None
+        try:
+            return super().execute(sql, params)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _notify_listeners(sql, params, time.perf_counter() - started, 'sqlite', self.connection, error)
+
+    def executemany(self, sql, seq_of_params):
+        if not QUERY_LISTENERS:
+            return super().executemany(sql, seq_of_params)
+        started, error = time.perf_counter(), None
+        try:
+            return super().executemany(sql, seq_of_params)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _notify_listeners(sql, None, time.perf_counter() - started, 'sqlite', self.connection, error)
+
+
+class InstrumentedSQLiteConnection(sqlite3.Connection):
+    """sqlite3.connect(path, factory=InstrumentedSQLiteConnection): plain sqlite3 for modules that
+    don't go through a backend (db_functions), with statements reported to QUERY_LISTENERS."""
+
+    def cursor(self, factory=_InstrumentedSQLiteCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+class Cursor:
+    """DB-API cursor that accepts SQLite-style SQL on either backend."""
+
+    def __init__(self, raw, backend, connection=None):
+        self._raw = raw
+        self._backend = backend
+        self._connection = connection
+
+    def execute(self, sql, params=()):
+        if self._backend.name == 'postgres':
+            sql = translate_sql(sql, bool(params))
+            if sql is None:
+                return self
+            params = tuple(params) if params else ()
+        driver_params = params if params or self._backend.name != 'postgres' else None
+        return self._run(lambda: self._raw.execute(sql, driver_params), sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        if self._backend.name == 'postgres':
+            sql = translate_sql(sql, True)
+            if sql is None:
+                return self
+            return self._run(lambda: psycopg2.extras.execute_batch(self._raw, sql, [tuple(p) for p in seq_of_params]),
+                             sql, None)
+        return self._run(lambda: self._raw.executemany(sql, seq_of_params), sql, None)
+
+    def _run(self, run, sql, params):
+        if not QUERY_LISTENERS and not TRANSACTION_LISTENERS:
+            run()
+            return self
+        started, error = time.perf_counter(), None
+        conn = self._connection
+        if conn is not None and conn.write_started is None and _WRITE_STATEMENT.match(sql):
+            conn.write_started = started
+        try:
+            run()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _notify_listeners(sql, params, time.perf_counter() - started, self._backend.name, self._raw.connection,
+                              error)
+        return self
+
+    def fetchone(self):
+        return self._raw.fetchone()
+
+    def fetchall(self):
+        return self._raw.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._raw.fetchmany(size) if size is not None else self._raw.fetchmany()
+
+    def close(self):
+        self._raw.close()
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    @property
+    def rowcount(self):
+        return self._raw.rowcount
+
+    @property
+    def description(self):
+        return self._raw.description
+
+    @property
+    def lastrowid(self):
+        # SQLite only; on Postgres use INSERT ... RETURNING id
+        return getattr(self._raw, 'lastrowid', None)
+
+
+class Connection:
+    """sqlite3-like connection; close() returns Postgres connections to the pool."""
+
+    def __init__(self, raw, backend):
+        self._raw = raw
+        self._backend = backend
+        self.closed = False
+        self.write_started = None  # perf_counter of the first write statement (TRANSACTION_LISTENERS)
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def cursor(self):
+        return Cursor(self._backend.raw_cursor(self._raw), self._backend, self)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def commit(self):
+        self._raw.commit()
+        self._end_transaction('commit')
+
+    def rollback(self):
+        self._raw.rollback()
+        self._end_transaction('rollback')
+
+    def _end_transaction(self, outcome):
+        started, self.write_started = self.write_started, None
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        for listener in TRANSACTION_LISTENERS:
+            try:
+                listener(seconds, outcome, self._backend.name)
+            except Exception:
+                pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._end_transaction('rollback')  # closed without commit: the driver discards it
+            self._backend.release(self._raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if not self.closed:
+                if exc_type is None:
+                    self.commit()
+                else:
+                    self.rollback()
+        finally:
+            self.close()
+        return False
+
+
+# =====================================================================
+# BACKENDS
+# =====================================================================
+
+class SQLiteBackend:
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        raw = sqlite3.connect(self.path)
+        raw.row_factory = sqlite3.Row # Allows dict-like access
+        raw.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")  # retry on lock
+        return Connection(raw, self)
+
+    def raw_cursor(self, raw):
+        return raw.cursor()
+
+    def release(self, raw):
+        raw.close()
+
+    def dispose(self):
+        pass
+
+
+class PostgresBackend:
+    name = 'postgres'
+
+    def __init__(self, dsn, minconn=PG_POOL_MIN, maxconn=PG_POOL_MAX):
+        if psycopg2 is None:
+            raise RuntimeError("DATABASE_URL points to PostgreSQL but psycopg2 is not installed")
+        self.dsn = dsn
+        self.pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn)
+        # ThreadedConnectionPool raises when exhausted; make callers wait for a free connection instead
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def connect(self):
+        self._slots.acquire()
+        try:
+            raw = self.pool.getconn()
+            if raw.closed:
+                self.pool.putconn(raw, close=True)
+                raw = self.pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        return Connection(raw, self)
+
+    def raw_cursor(self, raw):
+        return raw.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+    def release(self, raw):
+        try:
+            broken = bool(raw.closed)
+            if not broken and raw.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                raw.rollback() # Never hand an open transaction to the next request
+            self.pool.putconn(raw, close=broken)
+        except psycopg2.Error:
+            self.pool.putconn(raw, close=True)
+        finally:
+            self._slots.release()
+
+    def dispose(self):
+        self.pool.closeall()
+
+
+class SQLiteReportReplica(SQLiteBackend):
+    """
+    Read-only copy of the SQLite file for heavy reports, so long scans don't hold locks on the live DB.
+    Each process (gunicorn worker, job worker) keeps its own two copies, <name>.report-<pid>-a.db /
+    -b.db, used in turn: a refresh writes the copy none of this process's report connections has
+    open, then new report connections switch to it. Copies are removed at exit; ones left behind by
+    killed processes are swept on the next start.
+    """
+    name = 'sqlite'
+
+    def __init__(self, primary_path, refresh_seconds=REPLICA_REFRESH_SECONDS, max_age=REPLICA_MAX_AGE_SECONDS):
+        super().__init__(None)
+        self.primary_path = primary_path
+        self.base = os.path.splitext(primary_path)[0]
+        self.refresh_seconds = refresh_seconds
+        self.max_age = max_age
+        self._started = False
+        self._pid = None
+        self._reset_for_process()
+        atexit.register(self._remove_copies)
+
+    def _reset_for_process(self):
+        # Also runs in a forked child (gunicorn --preload): nothing of the parent's copies is reused
+        self._pid = os.getpid()
+        self.paths = [f"{self.base}.report-{self._pid}-a.db", f"{self.base}.report-{self._pid}-b.db"]
+        self.current = None       # index into self.paths handed to new connections
+        self.refreshed_at = None  # time.time() the current copy was known to match the primary
+        self._source = None
+        self._data_version = None
+        self._readers = [0, 0]    # open report connections per copy
+        self._open = {}           # id(raw connection) -> copy index
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _check_process(self):
+        if self._pid != os.getpid():
+            self._reset_for_process()
+            if self._started:
+                self.start()
+
+    def refresh(self):
+        """Copies the primary into the idle copy (skipped if nothing was committed since the last one)."""
+        self._check_process()
+        with self._lock:
+            if self._source is None:
+                self._source = sqlite3.connect(self.primary_path, check_same_thread=False)
+                self._source.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+            # data_version changes whenever another connection commits to the primary
+            data_version = self._source.execute("PRAGMA data_version").fetchone()[0]
+            if self.current is not None and data_version == self._data_version:
+                self.refreshed_at = time.time()
+                return False
+            target = 1 if self.current == 0 else 0
+            if self._readers[target]:
+                # A report still reads the previous snapshot from it; try again next round
+                logger.debug("Report replica refresh deferred: %d reader(s) on %s",
+                             self._readers[target], self.paths[target])
+                return False
+            dst = sqlite3.connect(self.paths[target])
+            try:
+                dst.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+                self._source.backup(dst, pages=REPLICA_BACKUP_PAGES, sleep=0.005)
+                dst.execute("PRAGMA journal_mode=DELETE")  # plain file, no -wal/-shm for read-only readers
+            finally:
+                dst.close()
+            self.current = target
+            self._data_version = data_version
+            self.refreshed_at = time.time()
+            return True
+
+    def start(self):
+        """Refreshes now and then every refresh_seconds on a daemon thread."""
+        self._started = True
+        self._sweep_stale_copies()
+        self.refresh()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name='report-replica', daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                self.refresh()
+            except sqlite3.Error as e:
+                logger.warning("Report replica refresh failed: %s", e)
+
+    def _sweep_stale_copies(self):
+        """Removes copies whose process is gone (killed workers never ran their atexit cleanup)."""
+        for path in glob.glob(f"{glob.escape(self.base)}.report-*-[ab].db"):
+            pid = path[len(self.base) + len('.report-'):].rsplit('-', 1)[0]
+            if not pid.isdigit() or int(pid) == os.getpid() or _process_alive(int(pid)):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remove_copies(self):
+        if self._pid != os.getpid():
+            return  # a forked child exiting: the copies belong to the parent
+        self.dispose()
+        for path in self.paths:
+            for name in (path, f"{path}-journal"):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+
+    def age(self):
+        """Seconds since the replica last matched the primary (None before the first refresh)."""
+        self._check_process()
+        return None if self.refreshed_at is None else time.time() - self.refreshed_at
+
+    def connect(self):
+        self._check_process()
+        if self.current is None:
+            self.refresh()
+        with self._lock:
+            index = self.current
+            raw = sqlite3.connect(f"file:{self.paths[index]}?mode=ro", uri=True)
+            self._readers[index] += 1
+            self._open[id(raw)] = index
+        raw.row_factory = sqlite3.Row
+        raw.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        return Connection(raw, self)
+
+    def release(self, raw):
+        with self._lock:
+            index = self._open.pop(id(raw), None)
+            if index is not None:
+                self._readers[index] -= 1
+        raw.close()
+
+    def dispose(self):
+        with self._lock:
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+class PostgresReportReplica(PostgresBackend):
+    """Hot standby given by REPORT_DATABASE_URL; lag comes from the last replayed transaction."""
+
+    max_age = REPLICA_MAX_AGE_SECONDS
+
+    def start(self):
+        pass
+
+    def age(self):
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())").fetchone()
+        # NULL on a server that isn't replaying (e.g. pointed at the primary itself): treat as current
+        return 0.0 if row[0] is None else float(row[0])
+
+
+def create_report_backend(primary, report_url=None):
+    """
+    Replica for read-only reports, or None to read from the primary.
+    SQLite: a refreshed copy of the primary file (REPORT_REPLICA=0 turns it off).
+    Postgres: REPORT_DATABASE_URL if set.
+    """
+    if primary.name == 'postgres':
+        return PostgresReportReplica(report_url) if report_url else None
+    if os.environ.get('REPORT_REPLICA', '1') == '0':
+        return None
+    return SQLiteReportReplica(primary.path)
+
+
+def create_backend(url=None, sqlite_path='finvestacore.db'):
+    """Picks the backend from a database URL (postgres://, postgresql:// or sqlite:///path)."""
+    url = (url or '').strip()
+    if url.startswith(('postgres://', 'postgresql://')):
+        return PostgresBackend(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    return SQLiteBackend(sqlite_path)
@@ -1,8 +1,12 @@
 import sqlite3
 from datetime import datetime
+import db_backend
+import slow_query_log
+
+slow_query_log.install()  # statements over SLOW_QUERY_MS -> slow_queries.log
 
 def init_db():
-    conn = sqlite3.connect('microfinance_loans.db')
+    conn = get_connection()
     cur = conn.cursor()
     
     # Members table
@@ -95,7 +99,8 @@ def init_db():
     conn.close()
 
 def get_connection():
-    return sqlite3.connect('microfinance_loans.db')
+    # Instrumented sqlite3 connection: slow statements reach slow_query_log
+    return sqlite3.connect('microfinance_loans.db', factory=db_backend.InstrumentedSQLiteConnection)
 
 def add_member(data):
     conn = get_connection()
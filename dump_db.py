@@ -1,3 +1,7 @@
+# dump_db.py
+# Plain-SQL dump (backup.sql) for inspecting data by eye.
+# Real backups: backup_db.py (online, compressed, verifiable, point-in-time restore).
+
 import sqlite3
 import os
 
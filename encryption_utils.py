@@ -1,5 +1,13 @@
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
+import hashlib
+import hmac
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
+
+from normalize_utils import normalize_aadhaar
 
 # --- CRITICAL: THE ENCRYPTION KEY ---
 # इस कुंजी को एक बार जनरेट करें और इसे कहीं सुरक्षित जगह पर स्टोर करें।
@@ -13,12 +21,37 @@ import os
 # key = Fernet.generate_key() 
 # print(key) # Copy this outputted key and use it below.
 
+logger = logging.getLogger(__name__)
+
 # Placeholder Key (REPLACE THIS WITH YOUR SECURE GENERATED KEY!)
 ENCRYPTION_KEY = b'vUaF-6sT-s9Q0I3D_wXyZ-aBcD-eFgH-iJkL-mNoP-qRsT-uVwX-yZaB-cD' 
-fernet = Fernet(ENCRYPTION_KEY)
+
+# --- KEYRING (for key rotation) ---
+# MFI_ENCRYPTION_KEYS="k2:<new key>,k1:<old key>" -- the FIRST entry is the primary key used for
+# new encryptions; the rest are only used to decrypt rows that have not been rotated yet.
+# Every encrypted column has a *_key_id column next to it recording which key was used.
+# Without the env var the keyring is just the key above, under id 'k1'.
+#
+# MFI_BLIND_INDEX_KEY="<long random secret>" -- HMAC key of the Aadhaar blind index (see blind_index
+# below). Required: there is no built-in default, blind_index() raises while it is unset.
+def _load_keyring():
+    raw = os.environ.get('MFI_ENCRYPTION_KEYS')
+    if not raw:
+        return [('k1', ENCRYPTION_KEY)]
+    keyring = []
+    for entry in raw.split(','):
+        key_id, _, key = entry.strip().partition(':')
+        keyring.append((key_id, key.encode()))
+    return keyring
+
+KEYRING = {key_id: Fernet(key) for key_id, key in _load_keyring()}
+PRIMARY_KEY_ID = next(iter(KEYRING))
+fernet = KEYRING[PRIMARY_KEY_ID]
+# Tries the primary key first, then the older ones
+multi_fernet = MultiFernet(list(KEYRING.values()))
 
 def encrypt_data(data: str) -> str:
-    """Encrypts a string (like Aadhaar) using Fernet."""
+    """Encrypts a string (like Aadhaar) using the primary Fernet key (tag the row with PRIMARY_KEY_ID)."""
     if not data:
         return ""
     # Data must be encoded to bytes before encryption
@@ -26,19 +59,109 @@ def encrypt_data(data: str) -> str:
     # Return the encrypted bytes as a string for storage in PostgreSQL
     return encrypted_bytes.decode()
 
-def decrypt_data(encrypted_data: str) -> str:
-    """Decrypts a string back to its original form."""
+def rotate_data(encrypted_data: str, key_id: str = None) -> str:
+    """Re-encrypts a token under the primary key. Raises cryptography.fernet.InvalidToken if no key in the ring fits."""
+    if not encrypted_data:
+        return ""
+    old_fernet = KEYRING.get(key_id)
+    if old_fernet is not None:
+        plain = old_fernet.decrypt(encrypted_data.encode())
+        return fernet.encrypt(plain).decode()
+    return multi_fernet.rotate(encrypted_data.encode()).decode()
+
+# --- BLIND INDEX KEY ---
+# Fernet is randomized (same Aadhaar -> different ciphertext every time), so the ciphertext
+# column cannot be searched. We store a keyed HMAC of the normalized value next to it.
+# This key must be different from ENCRYPTION_KEY and must never change once rows are indexed
+# (changing it means rebuilding the whole index with aadhaar_index.py).
+# No fallback: a key shared by every deployment (and visible in this repo) would let anyone holding
+# the DB brute-force all 10^12 Aadhaar numbers against the index.
+BLIND_INDEX_KEY = (os.environ.get('MFI_BLIND_INDEX_KEY') or '').encode() or None
+
+def blind_index(data: str) -> str:
+    """Deterministic HMAC-SHA256 (hex) of a normalized Aadhaar, for equality lookups."""
+    if BLIND_INDEX_KEY is None:
+        raise RuntimeError("MFI_BLIND_INDEX_KEY is not set; refusing to build the Aadhaar blind index without a secret key")
+    normalized = normalize_aadhaar(data)
+    if not normalized:
+        return None
+    return hmac.new(BLIND_INDEX_KEY, normalized.encode(), hashlib.sha256).hexdigest()
+
+def decrypt_data(encrypted_data: str, key_id: str = None) -> str:
+    """Decrypts a string back to its original form (key_id picks the key directly when known)."""
     if not encrypted_data:
         return ""
     try:
         # Data must be re-encoded to bytes before decryption
-        decrypted_bytes = fernet.decrypt(encrypted_data.encode())
+        key = KEYRING.get(key_id, multi_fernet)
+        decrypted_bytes = key.decrypt(encrypted_data.encode())
         return decrypted_bytes.decode()
     except Exception as e:
-        # Handle errors like invalid key or corrupted data
-        print(f"Decryption Error: {e}")
+        # Handle errors like invalid key or corrupted data (never log the token itself)
+        logger.warning("Decryption Error: %s", type(e).__name__)
         return "DECRYPTION_FAILED"
 
+# --- DECRYPTED VALUE CACHE ---
+# Screens that show the same customer repeatedly (list -> detail -> back) should not pay for a
+# Fernet decrypt every time, but plaintext Aadhaar must not pile up in memory either: the cache
+# holds at most DECRYPT_CACHE_SIZE values, each for at most DECRYPT_CACHE_TTL seconds.
+DECRYPT_CACHE_SIZE = int(os.environ.get('MFI_DECRYPT_CACHE_SIZE', '256'))
+DECRYPT_CACHE_TTL = float(os.environ.get('MFI_DECRYPT_CACHE_TTL', '300'))
+
+class DecryptCache:
+    """Bounded LRU of decrypted values with per-entry expiry."""
+    def __init__(self, max_size=DECRYPT_CACHE_SIZE, ttl=DECRYPT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()  # token -> (expires_at, plain)
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._items.get(token)
+            if entry is None:
+                return None
+            expires_at, plain = entry
+            if expires_at < time.monotonic():
+                del self._items[token]
+                return None
+            self._items.move_to_end(token)
+            return plain
+
+    def put(self, token, plain):
+        with self._lock:
+            self._items[token] = (time.monotonic() + self.ttl, plain)
+            self._items.move_to_end(token)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def purge_expired(self):
+        """Drops expired entries (call from a timer; get() only expires what it touches)."""
+        now = time.monotonic()
+        with self._lock:
+            for token in [t for t, (expires_at, _) in self._items.items() if expires_at < now]:
+                del self._items[token]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+decrypt_cache = DecryptCache()
+
+def decrypt_cached(encrypted_data: str, key_id: str = None) -> str:
+    """decrypt_data() through decrypt_cache. Failures are not cached."""
+    if not encrypted_data:
+        return ""
+    plain = decrypt_cache.get(encrypted_data)
+    if plain is None:
+        plain = decrypt_data(encrypted_data, key_id)
+        if plain != "DECRYPTION_FAILED":
+            decrypt_cache.put(encrypted_data, plain)
+    return plain
+
 if __name__ == '__main__':
     test_data = "123456789012"
     encrypted = encrypt_data(test_data)
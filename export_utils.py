@@ -0,0 +1,179 @@
+# export_utils.py
+# Streaming report exports for app.py: ?format=csv|xlsx|ndjson on the report endpoints.
+#
+# Rows come from a generator that walks the DB cursor, and go out chunk by chunk through Flask's
+# stream_with_context, so a month-end export of the whole book never sits in memory as one list.
+# XLSX is written as a streamed zip (inline strings, no sharedStrings table) - no openpyxl needed.
+
+import csv
+import datetime
+import io
+import itertools
+import json
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from flask import Response, stream_with_context
+
+EXPORT_FORMATS = ('csv', 'xlsx', 'ndjson')
+FLUSH_ROWS = 500  # rows buffered before a chunk is sent
+
+MIMETYPES = {
+    'csv': 'text/csv',  # Werkzeug appends '; charset=utf-8' to text/* itself
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def iter_cursor(cursor, size=FLUSH_ROWS):
+    """Yields rows with fetchmany() so only one batch is in memory."""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+# =====================================================================
+# CSV / NDJSON
+# =====================================================================
+
+def csv_chunks(columns, rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write('﻿')  # BOM so Excel opens Hindi names as UTF-8
+    writer.writerow(columns)
+    for n, row in enumerate(rows, start=1):
+        writer.writerow(['' if row.get(c) is None else row.get(c) for c in columns])
+        if n % FLUSH_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def ndjson_chunks(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, default=json_default, ensure_ascii=False))
+        if len(lines) >= FLUSH_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+# =====================================================================
+# XLSX (streamed zip)
+# =====================================================================
+
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+
+_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>"""
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable file: zipfile writes into it, the generator drains it."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_ILLEGAL_XML.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_chunks(columns, rows, sheet_name='Report'):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _ROOT_RELS)
+        zf.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name[:31])))
+        zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            sheet.write(('<row>' + ''.join(_xlsx_cell(c) for c in columns) + '</row>').encode('utf-8'))
+            for n, row in enumerate(rows, start=1):
+                sheet.write(('<row>' + ''.join(_xlsx_cell(row.get(c)) for c in columns) + '</row>').encode('utf-8'))
+                if n % FLUSH_ROWS == 0:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+        yield sink.drain()
+    yield sink.drain()  # central directory
+
+
+# =====================================================================
+# FLASK RESPONSE
+# =====================================================================
+
+def stream_response(fmt, filename, rows, columns=None):
+    """
+    Streams report rows (dicts) as csv / xlsx / ndjson. The first row is fetched here, inside the
+    view, so query errors still become normal error responses and columns can default to its keys.
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if columns is None:
+        columns = list(first.keys()) if first is not None else []
+    rows = itertools.chain([first], rows) if first is not None else iter(())
+
+    if fmt == 'csv':
+        body = csv_chunks(columns, rows)
+    elif fmt == 'ndjson':
+        body = ndjson_chunks(rows)
+    else:
+        body = xlsx_chunks(columns, rows, sheet_name=filename)
+    response = Response(stream_with_context(body), mimetype=MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
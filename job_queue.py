@@ -0,0 +1,399 @@
+# job_queue.py
+# Background report jobs, so long date ranges don't run inside a gunicorn request (worker timeout).
+#
+#   POST /jobs {"report": "emi_due", "params": {"date": "2026-10-31"}, "format": "csv"}  -> 202 + job id
+#   GET  /jobs/<id>              status, rows done, first rows of the result (partial), errors
+#   GET  /jobs/<id>/download     the finished file (csv / xlsx / ndjson)
+#   Report endpoints also accept ?async=1 and answer with the job instead of the data.
+#
+#   python job_queue.py worker            # separate worker process (set JOB_WORKER=external for the app)
+#   python job_queue.py cleanup           # delete expired artifacts
+#
+# Jobs live in a local SQLite file (jobs.db), whichever database the app itself uses. By default
+# each app process also runs one worker thread (JOB_WORKER=thread), which is enough on Render's
+# free plan where a second service isn't available.
+#
+# Reports run through the existing functions, looked up by "module:function" in REPORTS: generator
+# reports (iter_*) are written to the artifact row by row; dict reports are stored as the result
+# and as a one-row artifact. reporting_logic functions get a SQLAlchemy session as first argument.
+
+import argparse
+import datetime as dt
+import importlib
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+import export_utils
+
+JOBS_DB = os.environ.get('MFI_JOBS_DB', 'jobs.db')
+ARTIFACT_DIR = os.environ.get('MFI_JOB_ARTIFACTS', 'job_artifacts')
+ARTIFACT_TTL_HOURS = float(os.environ.get('MFI_JOB_TTL_HOURS', 24))
+POLL_SECONDS = 1.0
+PARTIAL_ROWS = 50           # rows kept in the job record for a preview while it runs
+PROGRESS_EVERY = 1000       # rows between progress updates
+STALE_AFTER_SECONDS = 300   # running job without heartbeat this long -> back to the queue
+HEARTBEAT_SECONDS = 30
+MAX_ATTEMPTS = 3            # a job that keeps killing its worker is failed after this many claims
+
+# name -> how to run it. 'args' are the params in call order, 'dates' are parsed to date objects,
+# 'optional' params are passed by name when given. 'artifact' functions write the file themselves
+# (func(path, format, *args, progress=...)) in one of their own 'formats'.
+REPORTS = {
+    'emi_due': {'func': 'app:iter_active_members_report', 'args': ['date']},
+    'loan_dispatch': {'func': 'app:iter_loan_dispatch_report_data', 'args': ['from_date', 'to_date']},
+    'member_ledger': {'func': 'app:iter_member_ledger_data', 'args': ['member_id', 'from_date', 'to_date']},
+    'invest_expense': {'func': 'app:iter_invest_expense_rows', 'args': []},
+    'pnl': {'func': 'app:get_pnl_report_data', 'args': ['from_date', 'to_date']},
+    'bank': {'func': 'app:get_bank_report_data', 'args': ['date']},
+    'balance_sheet': {'func': 'app:get_balance_sheet_data', 'args': ['date']},
+    'portfolio_at_risk': {'func': 'reporting_logic:calculate_portfolio_at_risk', 'args': ['as_of_date'],
+                          'session': True, 'dates': ['as_of_date']},
+    'collection_efficiency': {'func': 'reporting_logic:calculate_collection_efficiency',
+                              'args': ['start_date', 'end_date'], 'session': True,
+                              'dates': ['start_date', 'end_date']},
+    # Multi-year ranges: month partitions computed in worker processes (parallel_reports)
+    'pnl_parallel': {'func': 'parallel_reports:parallel_pnl', 'args': ['from_date', 'to_date']},
+    'loan_dispatch_parallel': {'func': 'parallel_reports:parallel_loan_dispatch', 'args': ['from_date', 'to_date']},
+    'collection_efficiency_parallel': {'func': 'parallel_reports:parallel_collection_efficiency',
+                                       'args': ['start_date', 'end_date']},
+    # NOCs / stamps / legal notices / EMI due lists for a whole filter (batch_documents)
+    'documents': {'func': 'batch_documents:write_batch', 'args': ['kind', 'filter'],
+                  'optional': ['as_of', 'min_dpd', 'base_url'], 'formats': ['zip', 'html'], 'artifact': True},
+    'legal_notices': {'func': 'batch_documents:write_legal_notices', 'args': [],
+                      'optional': ['as_of', 'min_dpd', 'repeat_days', 'base_url'], 'formats': ['zip', 'html'],
+                      'artifact': True},
+}
+
+
+class JobError(ValueError):
+    """Bad job request (unknown report, missing params, unknown format)."""
+
+
+def _now():
+    return dt.datetime.now().isoformat(timespec='seconds')
+
+
+def get_jobs_connection():
+    conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")  # pollers read while the worker writes progress
+    return conn
+
+
+def init_jobs_db():
+    conn = get_jobs_connection()
+    try:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                report TEXT NOT NULL,
+                params TEXT NOT NULL,
+                format TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER DEFAULT 0,
+                rows_done INTEGER DEFAULT 0,
+                progress REAL DEFAULT 0,
+                partial TEXT,
+                result TEXT,
+                artifact TEXT,
+                error TEXT,
+                worker TEXT,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                heartbeat_at TEXT,
+                finished_at TEXT,
+                expires_at TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_status_created ON jobs (status, created_at)')
+    finally:
+        conn.close()
+
+
+# =====================================================================
+# QUEUE API (used by app.py)
+# =====================================================================
+
+def submit(report, params, fmt='csv'):
+    """Queues a report and returns the job id."""
+    spec = REPORTS.get(report)
+    if spec is None:
+        raise JobError(f"Unknown report '{report}'. Available: {', '.join(sorted(REPORTS))}")
+    formats = spec.get('formats', export_utils.EXPORT_FORMATS)
+    if fmt not in formats:
+        raise JobError(f"Unknown format '{fmt}'. Use one of: {', '.join(formats)}")
+    params = {k: v for k, v in (params or {}).items() if k in spec['args'] or k in spec.get('optional', ())}
+    missing = [name for name in spec['args'] if not params.get(name)]
+    if missing:
+        raise JobError(f"Missing parameters: {', '.join(missing)}")
+
+    job_id = uuid.uuid4().hex
+    conn = get_jobs_connection()
+    try:
+        conn.execute("INSERT INTO jobs (id, report, params, format, created_at) VALUES (?, ?, ?, ?, ?)",
+                     (job_id, report, json.dumps(params), fmt, _now()))
+    finally:
+        conn.close()
+    return job_id
+
+
+def get_job(job_id):
+    """Job status as a dict for /jobs/<id>, or None."""
+    conn = get_jobs_connection()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    for key in ('params', 'partial', 'result'):
+        job[key] = json.loads(job[key]) if job[key] else None
+    job['download'] = bool(job['artifact']) and job['status'] == 'done'
+    job.pop('artifact')
+    return job
+
+
+def artifact_path(job_id):
+    """Path of a finished, unexpired artifact, or None."""
+    conn = get_jobs_connection()
+    try:
+        row = conn.execute("SELECT artifact, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None or row['status'] != 'done' or not row['artifact'] or not os.path.exists(row['artifact']):
+        return None
+    return row['artifact']
+
+
+# =====================================================================
+# WORKER
+# =====================================================================
+
+def _resolve(spec):
+    module_name, func_name = spec['func'].split(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _claim(conn, worker_name):
+    """Atomically takes the oldest queued job (several workers/threads can poll the same file)."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Jobs whose worker died go back to the queue
+        stale = (dt.datetime.now() - dt.timedelta(seconds=STALE_AFTER_SECONDS)).isoformat(timespec='seconds')
+        conn.execute("UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                     "error = CASE WHEN attempts >= ? THEN 'Worker stopped while running this job' END, "
+                     "worker = NULL WHERE status = 'running' AND heartbeat_at < ?",
+                     (MAX_ATTEMPTS, MAX_ATTEMPTS, stale))
+        row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+        if row is not None:
+            conn.execute("UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ?, "
+                         "attempts = attempts + 1, rows_done = 0, progress = 0, partial = NULL WHERE id = ?",
+                         (worker_name, _now(), _now(), row['id']))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return row
+
+
+class _Progress:
+    """Counts rows going into the artifact; every PROGRESS_EVERY rows saves count + preview rows."""
+
+    def __init__(self, conn, job_id):
+        self.conn = conn
+        self.job_id = job_id
+        self.rows_done = 0
+        self.preview = []
+
+    def wrap(self, rows):
+        for row in rows:
+            self.rows_done += 1
+            if len(self.preview) < PARTIAL_ROWS:
+                self.preview.append(dict(row))
+            if self.rows_done % PROGRESS_EVERY == 0 or self.rows_done == PARTIAL_ROWS:
+                self.save()
+            yield row
+
+    def save(self):
+        self.conn.execute("UPDATE jobs SET rows_done = ?, partial = ?, heartbeat_at = ? WHERE id = ?",
+                          (self.rows_done, json.dumps(self.preview, default=export_utils.json_default),
+                           _now(), self.job_id))
+
+
+class _Heartbeat:
+    """Touches heartbeat_at from a side thread, so a slow single-query report isn't taken as dead."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"job-heartbeat-{job_id[:8]}", daemon=True)
+
+    def _run(self):
+        conn = get_jobs_connection()
+        try:
+            while not self.stop.wait(HEARTBEAT_SECONDS):
+                conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (_now(), self.job_id))
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+        return False
+
+
+def _write_artifact(path, fmt, rows):
+    """Writes rows through the same chunk writers the streaming exports use."""
+    rows = iter(rows)
+    first = next(rows, None)
+    columns = list(first.keys()) if first is not None else []
+    rows = itertools.chain([first], rows) if first is not None else iter(())
+    if fmt == 'csv':
+        chunks, mode = export_utils.csv_chunks(columns, rows), 'w'
+    elif fmt == 'ndjson':
+        chunks, mode = export_utils.ndjson_chunks(rows), 'w'
+    else:
+        chunks, mode = export_utils.xlsx_chunks(columns, rows), 'wb'
+    tmp_path = path + '.part'
+    with open(tmp_path, mode, **({'encoding': 'utf-8', 'newline': ''} if mode == 'w' else {})) as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+
+
+def run_job(conn, job):
+    """Runs one claimed job to completion and records the outcome."""
+    job_id = job['id']
+    spec = REPORTS[job['report']]
+    params = json.loads(job['params'])
+    try:
+        args = [dt.date.fromisoformat(params[name]) if name in spec.get('dates', ()) else params[name]
+                for name in spec['args']]
+        kwargs = {name: params[name] for name in spec.get('optional', ()) if name in params}
+        func = _resolve(spec)
+        session = None
+        if spec.get('session'):
+            from database import SessionLocal
+            session = SessionLocal()
+            args.insert(0, session)
+        try:
+            with _Heartbeat(job_id):
+                os.makedirs(ARTIFACT_DIR, exist_ok=True)
+                path = os.path.join(ARTIFACT_DIR, f"{job_id}.{job['format']}")
+                progress = _Progress(conn, job_id)
+                result = None
+                if spec.get('artifact'):
+                    result = func(path, job['format'], *args, progress=progress, **kwargs)  # returns a summary
+                else:
+                    value = func(*args, **kwargs)
+                    if isinstance(value, dict):
+                        result = value  # single-figure reports: keep the numbers in the job record too
+                        _write_artifact(path, job['format'], progress.wrap([value]))
+                    else:
+                        _write_artifact(path, job['format'], progress.wrap(value))
+                progress.save()
+        finally:
+            if session is not None:
+                session.close()
+    except Exception as e:
+        conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                     (f"{type(e).__name__}: {e}", _now(), job_id))
+        print(f"Job {job_id} ({job['report']}) failed: {e}")
+        return False
+
+    expires_at = (dt.datetime.now() + dt.timedelta(hours=ARTIFACT_TTL_HOURS)).isoformat(timespec='seconds')
+    conn.execute("UPDATE jobs SET status = 'done', progress = 1, result = ?, artifact = ?, finished_at = ?, "
+                 "expires_at = ? WHERE id = ?",
+                 (json.dumps(result, default=export_utils.json_default) if result is not None else None,
+                  path, _now(), expires_at, job_id))
+    return True
+
+
+def cleanup_expired(conn=None):
+    """Deletes artifacts past expires_at; their jobs stay visible as 'expired'."""
+    own = conn is None
+    conn = conn or get_jobs_connection()
+    try:
+        rows = conn.execute("SELECT id, artifact FROM jobs WHERE status = 'done' AND expires_at < ?",
+                            (_now(),)).fetchall()
+        for row in rows:
+            if row['artifact'] and os.path.exists(row['artifact']):
+                os.remove(row['artifact'])
+            conn.execute("UPDATE jobs SET status = 'expired', artifact = NULL WHERE id = ?", (row['id'],))
+        return len(rows)
+    finally:
+        if own:
+            conn.close()
+
+
+def work(stop=None, once=False, poll=POLL_SECONDS):
+    """Worker loop: claim, run, repeat; sweeps expired artifacts between jobs."""
+    worker_name = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    init_jobs_db()
+    conn = get_jobs_connection()
+    last_cleanup = 0.0
+    try:
+        while stop is None or not stop.is_set():
+            if time.time() - last_cleanup > 600:
+                cleanup_expired(conn)
+                last_cleanup = time.time()
+            job = _claim(conn, worker_name)
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll)
+                continue
+            started = time.perf_counter()
+            ok = run_job(conn, job)
+            print(f"Job {job['id']} ({job['report']}) {'done' if ok else 'failed'} in {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+
+
+_worker_thread = None
+
+
+def start_worker_thread():
+    """One daemon worker inside this process (JOB_WORKER=thread, the default)."""
+    global _worker_thread
+    if _worker_thread is None:
+        _worker_thread = threading.Thread(target=work, name='job-worker', daemon=True)
+        _worker_thread.start()
+    return _worker_thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background report job worker.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('worker', help="Run jobs until stopped")
+    p.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+    p.add_argument('--poll', type=float, default=POLL_SECONDS)
+    sub.add_parser('cleanup', help="Delete expired artifacts")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if args.command == 'cleanup':
+        init_jobs_db()
+        print(f"Expired {cleanup_expired()} job artifacts")
+        return 0
+    try:
+        work(once=args.once, poll=args.poll)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
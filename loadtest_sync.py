@@ -0,0 +1,137 @@
+# loadtest_sync.py
+# Local stand-in for a morning of collector phones hitting sync_api at once.
+#
+#   python loadtest_sync.py --devices 300 --loans 20000
+#
+# Every simulated device: full schedule download for its collector -> delta download ->
+# uploads its collections in chunks (/sync/collections/chunk, resending one chunk to exercise
+# replay dedupe) -> reads its ack. Requests go through httpx's in-process ASGI transport, so no
+# server or network is needed. Runs in a temporary folder (database.py uses ./microfinance.db).
+# 503s (backpressure) are retried after a short sleep and counted.
+
+import argparse
+import asyncio
+import datetime as dt
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def seed(engine, loans, per_loan, collectors):
+    from database import Customer, LoanAccount, AmortizationSchedule
+    start = dt.date.today() - dt.timedelta(days=per_loan // 2)
+    with engine.begin() as conn:
+        conn.execute(Customer.__table__.insert(), [{'id': 1, 'full_name': 'Load Test'}])
+        conn.execute(LoanAccount.__table__.insert(), [
+            {'id': i, 'customer_id': 1, 'principal_amount': 10000.0, 'annual_interest_rate': 0.24, 'tenure_months': 4,
+             'status': 'ACTIVE', 'disbursement_date': start, 'collector_id': f"C{i % collectors}"}
+            for i in range(1, loans + 1)
+        ])
+        conn.execute(AmortizationSchedule.__table__.insert(), [
+            {'loan_account_id': loan_id, 'installment_number': n, 'due_date': start + dt.timedelta(days=n),
+             'total_emi': 110.0, 'paid_status': False}
+            for loan_id in range(1, loans + 1) for n in range(1, per_loan + 1)
+        ])
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.status = {}
+        self.retries = 0
+
+    def record(self, name, seconds, status):
+        self.latencies.setdefault(name, []).append(seconds)
+        self.status[status] = self.status.get(status, 0) + 1
+
+    def report(self, wall):
+        total = sum(len(v) for v in self.latencies.values())
+        print(f"\n{total} requests in {wall:.1f}s ({total / wall:.0f} req/s), 503 retries: {self.retries}")
+        print(f"status codes: {self.status}")
+        for name, values in self.latencies.items():
+            values = sorted(values)
+            p95 = values[int(len(values) * 0.95) - 1] if len(values) > 1 else values[0]
+            print(f"  {name:<16} n={len(values):5d}  p50={statistics.median(values) * 1000:8.1f} ms  "
+                  f"p95={p95 * 1000:8.1f} ms  max={values[-1] * 1000:8.1f} ms")
+
+
+async def call(client, stats, name, method, url, **kwargs):
+    while True:
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        stats.record(name, time.perf_counter() - started, response.status_code)
+        if response.status_code != 503:
+            return response
+        stats.retries += 1
+        await asyncio.sleep(0.2)
+
+
+async def device(client, stats, number, collector, loan_ids, chunk_size):
+    device_id = f"phone-{number}"
+    full = await call(client, stats, 'download_full', 'GET', '/sync/loan_schedules', params={'collector_id': collector})
+    if full.status_code != 200:
+        raise RuntimeError(f"download failed: {full.status_code} {full.text[:300]}")
+    cursor = full.headers['x-sync-cursor']
+    await call(client, stats, 'download_delta', 'GET', '/sync/loan_schedules',
+               params={'collector_id': collector, 'since': cursor})
+
+    today = dt.date.today().isoformat()
+    collections = [{'loan_id': loan_id, 'amount_paid': 110.0, 'payment_date': today} for loan_id in loan_ids]
+    chunks = [collections[i:i + chunk_size] for i in range(0, len(collections), chunk_size)]
+    for seq, items in enumerate(chunks, start=1):
+        body = {'device_id': device_id, 'seq': seq, 'collections': items}
+        await call(client, stats, 'upload_chunk', 'POST', '/sync/collections/chunk', json=body)
+        if seq == 1:
+            # Lost ack on a bad network: the phone sends the same chunk again
+            await call(client, stats, 'upload_replay', 'POST', '/sync/collections/chunk', json=body)
+    await call(client, stats, 'ack', 'GET', f'/sync/devices/{device_id}/ack')
+
+
+async def run(args):
+    import httpx
+    import sync_api
+
+    stats = Stats()
+    loans_by_collector = {}
+    for loan_id in range(1, args.loans + 1):
+        loans_by_collector.setdefault(f"C{loan_id % args.devices}", []).append(loan_id)
+
+    transport = httpx.ASGITransport(app=sync_api.app)
+    async with sync_api.app.router.lifespan_context(sync_api.app):
+        async with httpx.AsyncClient(transport=transport, base_url='http://sync.local', timeout=120) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*[
+                device(client, stats, n, f"C{n}", loans_by_collector.get(f"C{n}", []), args.chunk)
+                for n in range(args.devices)
+            ])
+            wall = time.perf_counter() - started
+        print(f"DB pool: {sync_api.DB_WORKERS} workers, {sync_api.DB_MAX_PENDING} pending slots, "
+              f"{sync_api.app.state.db.rejected} rejected with 503")
+    stats.report(wall)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many collector devices syncing at once.")
+    parser.add_argument('--devices', type=int, default=300)
+    parser.add_argument('--loans', type=int, default=20000)
+    parser.add_argument('--per-loan', type=int, default=20, help="Schedule rows per loan")
+    parser.add_argument('--chunk', type=int, default=25, help="Collections per upload chunk")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix='mfi_sync_load_')
+    os.chdir(workdir)
+
+    from database import engine, create_tables, upgrade_schema
+    create_tables()
+    upgrade_schema()
+    seed(engine, args.loans, args.per_loan, args.devices)
+    print(f"Seeded {args.loans} loans x {args.per_loan} installments for {args.devices} collectors ({workdir})")
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
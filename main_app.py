@@ -2,6 +2,10 @@
 from accounting_logic import post_collection_to_gl
 from loan_calc import calculate_daily_emi # To reference the daily EMI
 from PyQt6.QtWidgets import QTableWidget, QTableWidgetItem, QMessageBox, QComboBox
+from PyQt6.QtWidgets import QWidget, QMainWindow, QVBoxLayout, QHBoxLayout, QFormLayout, QLabel, QLineEdit, QPushButton, QDateEdit
+from PyQt6.QtCore import QDate
+from database import SessionLocal, Customer, LoanAccount, LoanProduct, CollectionTransaction
+from qt_models import PagedQueryModel, run_query
 
 # main_app.py (Update the record_collection method in CollectionEntryWindow)
 # ...
@@ -9,7 +13,7 @@ from PyQt6.QtWidgets import QTableWidget, QTableWidgetItem, QMessageBox, QComboB
 def record_collection(self):
         """Handles the collection entry, payment allocation, and GL posting."""
         
-        loan_id = self.loan_map.get(self.loan_combo.currentText())
+        loan_id = self.loan_model.key_for_row(self.loan_combo.currentIndex())
         if not loan_id:
              QMessageBox.critical(self, "Error", "Please select a valid loan account.")
              return
@@ -88,6 +92,16 @@ def record_collection(self):
             session.close()
 
 # ... (rest of the CollectionEntryWindow class)
+def active_loan_page(session, after_id, limit):
+    """One page of active loans for the loan dropdown: (loan_id, display text)."""
+    rows = session.query(LoanAccount.id, Customer.full_name).join(
+        Customer, LoanAccount.customer_id == Customer.id
+    ).filter(
+        LoanAccount.status == 'ACTIVE',
+        LoanAccount.id > (after_id or 0)
+    ).order_by(LoanAccount.id).limit(limit).all()
+    return [(loan_id, f"Loan ID: {loan_id} - Customer: {full_name}") for loan_id, full_name in rows]
+
 class CollectionEntryWindow(QWidget):
     """Form to record daily collections against a specific loan account."""
     def __init__(self):
@@ -99,7 +113,13 @@ class CollectionEntryWindow(QWidget):
         # Loan Selection and Details
         loan_select_layout = QHBoxLayout()
         self.loan_combo = QComboBox()
-        self.load_active_loans() # Load active loans into the combobox
+        self.loan_model = PagedQueryModel(["ID", "लोन"], active_loan_page, self)
+        self.loan_combo.setModel(self.loan_model)
+        self.loan_combo.setModelColumn(1) # Show the display text, keep the loan ID in column 0
+        self.loan_model.load_failed.connect(
+            lambda message: QMessageBox.critical(self, "DB Error", f"लोन सूची लोड करने में त्रुटि: {message}")
+        )
+        self.load_active_loans() # Load active loans into the combobox (in the background)
         self.loan_combo.currentIndexChanged.connect(self.display_loan_details)
         
         self.details_label = QLabel("लोन विवरण यहां प्रदर्शित होगा।")
@@ -130,22 +150,12 @@ class CollectionEntryWindow(QWidget):
         self.layout.addWidget(self.collect_btn)
         self.setLayout(self.layout)
         
-        self.loan_map = {} # Map display text to loan_account_id
-        
     # --- Data Loading and Display Functions (TODO) ---
     # This section is the most complex logic (Payment Allocation) and needs to be implemented next.
     
     def load_active_loans(self):
-        """Loads active loans into the combobox."""
-        session = SessionLocal()
-        try:
-            active_loans = session.query(LoanAccount).filter(LoanAccount.status == 'ACTIVE').all()
-            for loan in active_loans:
-                display = f"Loan ID: {loan.id} - Customer: {loan.customer.full_name}"
-                self.loan_combo.addItem(display)
-                self.loan_map[display] = loan.id
-        finally:
-            session.close()
+        """Loads active loans into the combobox, a page at a time as the list is scrolled."""
+        self.loan_model.reload()
 
     def display_loan_details(self):
         """Displays key loan details and the remaining schedule."""
@@ -155,7 +165,7 @@ class CollectionEntryWindow(QWidget):
     def record_collection(self):
         """Handles the collection entry, payment allocation, and GL posting."""
         
-        loan_id = self.loan_map.get(self.loan_combo.currentText())
+        loan_id = self.loan_model.key_for_row(self.loan_combo.currentIndex())
         try:
             amount_paid = float(self.amount_paid_input.text())
             
@@ -232,7 +242,8 @@ class MainWindow(QMainWindow):
 # ... (rest of the main_app.py code)
 # main_app.py (Modified section)
 # Import the utility functions
-from encryption_utils import encrypt_data 
+from encryption_utils import encrypt_data, blind_index, PRIMARY_KEY_ID
+from aadhaar_index import find_customer_by_aadhaar
 
 class CustomerEntryWindow(QWidget):
     # ... (omitted __init__ for brevity)
@@ -255,10 +266,18 @@ class CustomerEntryWindow(QWidget):
         
         session = SessionLocal()
         try:
+            # Duplicate check via the blind index (no decryption needed)
+            existing = find_customer_by_aadhaar(session, aadhaar)
+            if existing:
+                print(f"Error: Aadhaar already registered for customer ID {existing.id}.")
+                return
+
             new_customer = Customer(
                 full_name=name,
                 # Store the encrypted version
                 aadhaar_encrypted=encrypted_aadhaar, 
+                aadhaar_key_id=PRIMARY_KEY_ID,
+                aadhaar_bidx=blind_index(aadhaar),
                 address=address
             )
             session.add(new_customer)
@@ -276,11 +295,11 @@ class CustomerEntryWindow(QWidget):
             session.close()
 
 import sys
-from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QLabel, QLineEdit, QFormLayout
+from PyQt6.QtWidgets import QApplication
 from PyQt6.QtCore import Qt
 
 # Assume database.py and models (Customer, LoanProduct) are correctly set up and accessible
-from database import SessionLocal, Customer, create_tables 
+from database import create_tables 
 
 class CustomerEntryWindow(QWidget):
     """एक नया ग्राहक जोड़ने के लिए फॉर्म विंडो"""
@@ -319,10 +338,16 @@ class CustomerEntryWindow(QWidget):
 
         session = SessionLocal()
         try:
+            existing = find_customer_by_aadhaar(session, aadhaar)
+            if existing:
+                print(f"त्रुटि: यह आधार पहले से ग्राहक ID {existing.id} के नाम दर्ज है।")
+                return
+
             # NOTE: यहां Aadhaar encryption logic जोड़ी जाएगी। अभी यह RAW सेव कर रहा है।
             new_customer = Customer(
                 full_name=name,
                 aadhaar_encrypted=aadhaar, 
+                aadhaar_bidx=blind_index(aadhaar),
                 address=address
             )
             session.add(new_customer)
@@ -378,80 +403,167 @@ if __name__ == "__main__":
     window.show()
     sys.exit(app.exec())
     # main_app.py (Add the following imports)
-from PyQt6.QtWidgets import QTableWidget, QTableWidgetItem, QMessageBox
-from encryption_utils import decrypt_data 
+from PyQt6.QtWidgets import QTableView, QHeaderView, QMessageBox
+from PyQt6.QtCore import QTimer
+from sqlalchemy import func
+from encryption_utils import decrypt_cached, decrypt_cache
 # ... (existing imports)
 
+def customer_page(session, after_id, limit):
+    """One page of the customer list (keyset on id); only a 5-char prefix of the Aadhaar token."""
+    rows = session.query(
+        Customer.id, Customer.full_name,
+        func.substr(Customer.aadhaar_encrypted, 1, 5), Customer.address
+    ).filter(Customer.id > (after_id or 0)).order_by(Customer.id).limit(limit).all()
+    return [(c_id, name, (prefix + "...") if prefix else "", address) for c_id, name, prefix, address in rows]
+
+
+class CustomerTableModel(PagedQueryModel):
+    """
+    Virtual customer table: rows are read from the DB one page at a time (keyset on id)
+    as the view scrolls, so opening a 100k-customer list only costs the first page.
+    Only a short prefix of the Aadhaar token is kept per row; decryption happens on demand.
+    """
+    HEADERS = ["ID", "पूरा नाम", "आधार (Encrypted)", "पता"]
+
+    def __init__(self, parent=None):
+        super().__init__(self.HEADERS, customer_page, parent)
+        self._revealed = {}      # row -> decrypted Aadhaar, shown until hide_revealed()/reset()
+
+    def display_value(self, row, column):
+        if column == 2 and row in self._revealed:
+            return self._revealed[row]
+        return super().display_value(row, column)
+
+    def reset(self):
+        self._revealed = {}
+        super().reset()
+
+    def customer_id(self, row):
+        return self.key_for_row(row)
+
+    def locate_customer(self, customer_id, on_found):
+        self.locate_key(customer_id, on_found)
+
+    def reveal(self, row, plain):
+        self._revealed[row] = plain
+        index = self.index(row, 2)
+        self.dataChanged.emit(index, index)
+
+    def hide_revealed(self):
+        rows = list(self._revealed)
+        self._revealed = {}
+        for row in rows:
+            index = self.index(row, 2)
+            self.dataChanged.emit(index, index)
+
+
 class CustomerListView(QWidget):
     """Displays a list of all customers from the PostgreSQL database."""
+    REVEAL_SECONDS = 60  # decrypted Aadhaar is masked again after this
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("सभी ग्राहक सूची")
         self.layout = QVBoxLayout()
         
-        # 1. Table Widget Setup
-        self.customer_table = QTableWidget()
-        self.customer_table.setColumnCount(4)
-        self.customer_table.setHorizontalHeaderLabels([
-            "ID", "पूरा नाम", "आधार (Encrypted)", "पता"
-        ])
+        # 1. Table View Setup (model pages rows in as the user scrolls)
+        self.customer_model = CustomerTableModel(self)
+        self.customer_model.load_failed.connect(
+            lambda message: QMessageBox.critical(self, "DB Error", f"डेटा लोड करने में त्रुटि: {message}")
+        )
+        self.customer_table = QTableView()
+        self.customer_table.setModel(self.customer_model)
+        self.customer_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.customer_table.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+        # Fixed row height: the view never has to measure unloaded rows
+        self.customer_table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.customer_table.horizontalHeader().setStretchLastSection(True)
         
         # 2. Add Decrypt Button
         self.decrypt_button = QPushButton("चयनित आधार संख्या देखें (Decrypt)")
         self.decrypt_button.clicked.connect(self.decrypt_selected_aadhaar)
+
+        # 3. Lookup by Aadhaar (blind index, no decryption of other rows)
+        self.aadhaar_search_input = QLineEdit()
+        self.aadhaar_search_input.setPlaceholderText("आधार संख्या से खोजें")
+        self.aadhaar_search_button = QPushButton("खोजें")
+        self.aadhaar_search_button.clicked.connect(self.search_by_aadhaar)
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(self.aadhaar_search_input)
+        search_layout.addWidget(self.aadhaar_search_button)
         
+        self.layout.addLayout(search_layout)
         self.layout.addWidget(self.customer_table)
         self.layout.addWidget(self.decrypt_button)
         self.setLayout(self.layout)
+
+        # 4. Mask revealed Aadhaar again and drop expired plaintext from the cache
+        self.mask_timer = QTimer(self)
+        self.mask_timer.setSingleShot(True)
+        self.mask_timer.timeout.connect(self.mask_revealed_aadhaar)
         
         # Load data immediately
         self.load_customer_data()
 
     def load_customer_data(self):
-        """Fetches all customer data (including encrypted Aadhaar) from the database."""
+        """(Re)loads the list; the first page is read in the background, the rest on scroll."""
+        self.customer_model.reload()
+
+    def search_by_aadhaar(self):
+        """Selects the customer whose Aadhaar matches the search box."""
+        aadhaar = self.aadhaar_search_input.text().strip()
+        if not aadhaar:
+            return
         session = SessionLocal()
         try:
-            customers = session.query(Customer).all()
-            
-            self.customer_table.setRowCount(len(customers))
-            
-            for row_num, customer in enumerate(customers):
-                # ID and Name are stored as normal text
-                self.customer_table.setItem(row_num, 0, QTableWidgetItem(str(customer.id)))
-                self.customer_table.setItem(row_num, 1, QTableWidgetItem(customer.full_name))
-                
-                # Encrypted Aadhaar is shown by default
-                # We use a placeholder to indicate it's encrypted
-                encrypted_text = customer.aadhaar_encrypted[:5] + "..." 
-                self.customer_table.setItem(row_num, 2, QTableWidgetItem(encrypted_text))
-                
-                self.customer_table.setItem(row_num, 3, QTableWidgetItem(customer.address))
-
+            customer = find_customer_by_aadhaar(session, aadhaar)
+            if not customer:
+                QMessageBox.information(self, "खोज परिणाम", "इस आधार से कोई ग्राहक नहीं मिला।")
+                return
+            customer_id, full_name = customer.id, customer.full_name
         except Exception as e:
-            QMessageBox.critical(self, "DB Error", f"डेटा लोड करने में त्रुटि: {e}")
+            QMessageBox.critical(self, "DB Error", f"खोज में त्रुटि: {e}")
+            return
         finally:
             session.close()
+        # Rows before it may not be loaded yet: they are read in the background, then the row is selected
+        self.customer_model.locate_customer(
+            customer_id, lambda row_num: self.show_found_customer(row_num, customer_id, full_name)
+        )
+
+    def show_found_customer(self, row_num, customer_id, full_name):
+        if row_num is not None:
+            self.customer_table.selectRow(row_num)
+            self.customer_table.scrollTo(self.customer_model.index(row_num, 0))
+        QMessageBox.information(self, "खोज परिणाम", f"ग्राहक: {full_name} (ID: {customer_id})")
 
     def decrypt_selected_aadhaar(self):
         """Decrypts and shows the Aadhaar of the selected row."""
-        selected_rows = self.customer_table.selectedItems()
+        selected_rows = self.customer_table.selectionModel().selectedRows()
         if not selected_rows:
             QMessageBox.warning(self, "चयन त्रुटि", "कृपया पहले ग्राहक की एक पंक्ति चुनें।")
             return
 
         # Get the ID of the selected customer (Column 0)
         selected_row_index = selected_rows[0].row()
-        customer_id = int(self.customer_table.item(selected_row_index, 0).text())
+        customer_id = self.customer_model.customer_id(selected_row_index)
         
         session = SessionLocal()
         try:
-            customer = session.query(Customer).filter(Customer.id == customer_id).first()
+            # Only this row's full token is read from the DB
+            customer = session.query(
+                Customer.full_name, Customer.aadhaar_encrypted, Customer.aadhaar_key_id
+            ).filter(Customer.id == customer_id).first()
             if customer:
-                # Retrieve the full encrypted string from the database object
-                encrypted_aadhaar = customer.aadhaar_encrypted
-                
-                # --- Decrypt the Data ---
-                decrypted_aadhaar = decrypt_data(encrypted_aadhaar)
+                # --- Decrypt the Data (cached for a few minutes, LRU-bounded) ---
+                decrypted_aadhaar = decrypt_cached(customer.aadhaar_encrypted, customer.aadhaar_key_id)
+                if decrypted_aadhaar == "DECRYPTION_FAILED":
+                    QMessageBox.critical(self, "डिक्रिप्शन त्रुटि", "इस ग्राहक का आधार डिक्रिप्ट नहीं हो सका।")
+                    return
+
+                self.customer_model.reveal(selected_row_index, decrypted_aadhaar)
+                self.mask_timer.start(self.REVEAL_SECONDS * 1000)
                 
                 # Show the result in a dialog box
                 QMessageBox.information(
@@ -465,6 +577,10 @@ class CustomerListView(QWidget):
         finally:
             session.close()
 
+    def mask_revealed_aadhaar(self):
+        self.customer_model.hide_revealed()
+        decrypt_cache.purge_expired()
+
 # --- MainWindow Modification ---
 # Modify the MainWindow class in main_app.py to include the new list view.
 class MainWindow(QMainWindow):
@@ -500,14 +616,27 @@ if __name__ == "__main__":
     window.show()
     sys.exit(app.exec())
     # main_app.py (Add the following imports)
-from PyQt6.QtWidgets import QComboBox, QDateEdit 
-from PyQt6.QtCore import QDate 
+from PyQt6.QtWidgets import QComboBox 
 import datetime as dt
 
 # Import all required models and functions
-from database import SessionLocal, Customer, LoanProduct, LoanAccount, create_tables 
+from database import create_tables 
 from loan_calc import calculate_daily_emi, generate_daily_schedule 
 
+def customer_choice_page(session, after_id, limit):
+    """One page of the customer dropdown: (customer_id, display text)."""
+    rows = session.query(Customer.id, Customer.full_name).filter(
+        Customer.id > (after_id or 0)
+    ).order_by(Customer.id).limit(limit).all()
+    return [(c_id, f"{full_name} (ID: {c_id})") for c_id, full_name in rows]
+
+def product_choice_page(session, after_id, limit):
+    """One page of the product dropdown: (product_id, display text, annual rate)."""
+    rows = session.query(LoanProduct.id, LoanProduct.name, LoanProduct.interest_rate).filter(
+        LoanProduct.id > (after_id or 0)
+    ).order_by(LoanProduct.id).limit(limit).all()
+    return [(p_id, f"{name} ({rate*100:.2f}%)", rate) for p_id, name, rate in rows]
+
 class LoanOriginationWindow(QWidget):
     """Form to sanction a new loan, calculate EMI, and generate the schedule."""
     def __init__(self, main_window):
@@ -521,9 +650,19 @@ class LoanOriginationWindow(QWidget):
         self.customer_combo = QComboBox()
         self.product_combo = QComboBox()
         
-        # Internal dictionaries to map names to database IDs
-        self.customer_map = self.load_customers()
-        self.product_map = self.load_products()
+        # Paged models; column 0 holds the database ID
+        self.customer_model = PagedQueryModel(["ID", "ग्राहक"], customer_choice_page, self)
+        self.customer_combo.setModel(self.customer_model)
+        self.customer_combo.setModelColumn(1)
+        self.product_model = PagedQueryModel(["ID", "उत्पाद", "दर"], product_choice_page, self)
+        self.product_combo.setModel(self.product_model)
+        self.product_combo.setModelColumn(1)
+        for model in (self.customer_model, self.product_model):
+            model.load_failed.connect(
+                lambda message: QMessageBox.critical(self, "DB Error", f"डेटा लोड करने में त्रुटि: {message}")
+            )
+        self.load_customers()
+        self.load_products()
 
         # --- Input Fields ---
         self.principal_input = QLineEdit()
@@ -557,48 +696,31 @@ class LoanOriginationWindow(QWidget):
         
         # Connect product change to update rate label
         self.product_combo.currentIndexChanged.connect(self.update_rate_label)
+        self.product_model.rows_loaded.connect(lambda _: self.update_rate_label())
         self.update_rate_label() # Initial call
 
     def load_customers(self):
-        """Fetches customers from DB and fills the dropdown."""
-        session = SessionLocal()
-        customer_map = {}
-        try:
-            customers = session.query(Customer).all()
-            for customer in customers:
-                display_name = f"{customer.full_name} (ID: {customer.id})"
-                self.customer_combo.addItem(display_name)
-                customer_map[display_name] = customer.id
-        finally:
-            session.close()
-        return customer_map
+        """Fills the customer dropdown from the DB (background, paged)."""
+        self.customer_model.reload()
 
     def load_products(self):
-        """Fetches loan products from DB and fills the dropdown."""
-        session = SessionLocal()
-        product_map = {}
-        try:
-            products = session.query(LoanProduct).all()
-            for product in products:
-                display_name = f"{product.name} ({product.interest_rate*100:.2f}%)"
-                self.product_combo.addItem(display_name)
-                product_map[product.name] = (product.id, product.interest_rate) # Store ID and Rate
-        finally:
-            session.close()
-        return product_map
+        """Fills the product dropdown from the DB (background, paged)."""
+        self.product_model.reload()
+
+    def selected_product(self):
+        """(product_id, annual_rate) of the selected product, or (None, None)."""
+        values = self.product_model.row_values(self.product_combo.currentIndex())
+        if not values:
+            return None, None
+        return values[0], values[2]
 
     def update_rate_label(self):
         """Updates the rate label based on the selected product."""
-        selected_text = self.product_combo.currentText()
-        if not selected_text:
+        _, rate = self.selected_product()
+        if rate is None:
             self.rate_label.setText("वार्षिक दर (A.R.): 0.0%")
             return
             
-        # Extract product name from the displayed text
-        product_name = selected_text.split(' (')[0]
-        
-        # Lookup the rate
-        _, rate = self.product_map.get(product_name, (None, 0.0))
         self.rate_label.setText(f"वार्षिक दर (A.R.): {rate*100:.2f}%")
         
     def calculate_emi_action(self):
@@ -607,9 +729,7 @@ class LoanOriginationWindow(QWidget):
             principal = float(self.principal_input.text())
             tenure_days = int(self.tenure_input.text())
             
-            selected_text = self.product_combo.currentText()
-            product_name = selected_text.split(' (')[0]
-            _, annual_rate = self.product_map.get(product_name)
+            _, annual_rate = self.selected_product()
             
             if principal <= 0 or tenure_days <= 0 or annual_rate is None:
                 raise ValueError("मान्य इनपुट दर्ज करें।")
@@ -631,12 +751,8 @@ class LoanOriginationWindow(QWidget):
         """Saves LoanAccount and generates Amortization Schedule."""
         try:
             # 1. Retrieve final data
-            customer_display = self.customer_combo.currentText()
-            customer_id = self.customer_map.get(customer_display)
-            
-            product_display = self.product_combo.currentText()
-            product_name = product_display.split(' (')[0]
-            product_id, annual_rate = self.product_map.get(product_name)
+            customer_id = self.customer_model.key_for_row(self.customer_combo.currentIndex())
+            product_id, annual_rate = self.selected_product()
             
             principal = float(self.principal_input.text())
             tenure_days = int(self.tenure_input.text())
@@ -701,7 +817,6 @@ class MainWindow(QMainWindow):
         self.loan_window.show()
         # main_app.py (Add new imports at the top)
 from reporting_logic import calculate_portfolio_at_risk, calculate_collection_efficiency
-from PyQt6.QtCore import QDate
 
 class ReportingWindow(QWidget):
     """Displays key MIS reports like PAR and Collection Efficiency."""
@@ -750,53 +865,60 @@ class ReportingWindow(QWidget):
         self.load_collection_efficiency() # Initial load
 
     def load_par_data(self):
-        """Fetches and displays PAR data."""
-        session = SessionLocal()
-        try:
-            par_data = calculate_portfolio_at_risk(session)
-            
-            data = [
-                ("कुल बकाया प्रिंसिपल", par_data['total_principal_outstanding']),
-                ("PAR > 1 दिन", par_data['PAR_1_DAY']),
-                ("PAR > 7 दिन", par_data['PAR_7_DAYS']),
-                ("PAR > 30 दिन (गंभीर)", par_data['PAR_30_DAYS'])
-            ]
+        """Fetches PAR data on the DB thread pool; show_par_data() fills the table."""
+        self.par_results.setRowCount(1)
+        self.par_results.setItem(0, 0, QTableWidgetItem("लोड हो रहा है..."))
+        run_query(
+            calculate_portfolio_at_risk,
+            on_result=self.show_par_data,
+            on_error=lambda message: QMessageBox.critical(self, "त्रुटि", f"PAR डेटा लोड करने में विफल: {message}")
+        )
+
+    def show_par_data(self, par_data):
+        """Displays PAR data."""
+        data = [
+            ("कुल बकाया प्रिंसिपल", par_data['total_principal_outstanding']),
+            ("PAR > 1 दिन", par_data['PAR_1_DAY']),
+            ("PAR > 7 दिन", par_data['PAR_7_DAYS']),
+            ("PAR > 30 दिन (गंभीर)", par_data['PAR_30_DAYS'])
+        ]
+        
+        self.par_results.setRowCount(len(data))
+        for i, (label, amount) in enumerate(data):
+            self.par_results.setItem(i, 0, QTableWidgetItem(label))
+            self.par_results.setItem(i, 1, QTableWidgetItem(f"₹ {amount:,.2f}"))
             
-            self.par_results.setRowCount(len(data))
-            for i, (label, amount) in enumerate(data):
-                self.par_results.setItem(i, 0, QTableWidgetItem(label))
-                self.par_results.setItem(i, 1, QTableWidgetItem(f"₹ {amount:,.2f}"))
-                
-            self.par_results.resizeColumnsToContents()
-
-        except Exception as e:
-            QMessageBox.critical(self, "त्रुटि", f"PAR डेटा लोड करने में विफल: {e}")
-        finally:
-            session.close()
+        self.par_results.resizeColumnsToContents()
 
     def load_collection_efficiency(self):
-        """Fetches and displays Collection Efficiency."""
-        session = SessionLocal()
-        try:
-            start_date_py = dt.date(self.ce_start_date.date().year(), self.ce_start_date.date().month(), self.ce_start_date.date().day())
-            end_date_py = dt.date(self.ce_end_date.date().year(), self.ce_end_date.date().month(), self.ce_end_date.date().day())
+        """Fetches Collection Efficiency on the DB thread pool."""
+        start_date_py = dt.date(self.ce_start_date.date().year(), self.ce_start_date.date().month(), self.ce_start_date.date().day())
+        end_date_py = dt.date(self.ce_end_date.date().year(), self.ce_end_date.date().month(), self.ce_end_date.date().day())
 
-            if start_date_py > end_date_py:
-                QMessageBox.warning(self, "तिथि त्रुटि", "आरंभ तिथि, समाप्ति तिथि से पहले होनी चाहिए।")
-                return
-
-            ce_data = calculate_collection_efficiency(session, start_date_py, end_date_py)
-            
-            output_text = (
-                f"परिणाम: **{ce_data['efficiency_percent']:.2f}%** "
-                f"(₹{ce_data['total_paid']:,.2f} Paid / ₹{ce_data['total_due']:,.2f} Due)"
-            )
-            self.ce_output.setText(output_text)
+        if start_date_py > end_date_py:
+            QMessageBox.warning(self, "तिथि त्रुटि", "आरंभ तिथि, समाप्ति तिथि से पहले होनी चाहिए।")
+            return
 
-        except Exception as e:
-            QMessageBox.critical(self, "त्रुटि", f"कलेक्शन एफ़िशिएंसी गणना में विफल: {e}")
-        finally:
-            session.close()
+        self.ce_calc_btn.setEnabled(False) # One calculation at a time
+        self.ce_output.setText("गणना हो रही है...")
+        run_query(
+            calculate_collection_efficiency, start_date_py, end_date_py,
+            on_result=self.show_collection_efficiency,
+            on_error=self.collection_efficiency_failed
+        )
+
+    def show_collection_efficiency(self, ce_data):
+        """Displays Collection Efficiency."""
+        self.ce_calc_btn.setEnabled(True)
+        output_text = (
+            f"परिणाम: **{ce_data['efficiency_percent']:.2f}%** "
+            f"(₹{ce_data['total_paid']:,.2f} Paid / ₹{ce_data['total_due']:,.2f} Due)"
+        )
+        self.ce_output.setText(output_text)
+
+    def collection_efficiency_failed(self, message):
+        self.ce_calc_btn.setEnabled(True)
+        QMessageBox.critical(self, "त्रुटि", f"कलेक्शन एफ़िशिएंसी गणना में विफल: {message}")
 
 # --- MainWindow Modification ---
 class MainWindow(QMainWindow):
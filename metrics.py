@@ -0,0 +1,396 @@
+# metrics.py
+# Prometheus metrics for the Flask app (app.py): request latency per route, DB connection and lock
+# waits, 'database is locked' errors, report replica hit rate, write transaction durations and
+# business counters (EMIs posted, loans disbursed, ...).
+#
+#   GET /metrics                                      Prometheus text format (0.0.4)
+#   python metrics.py scrape http://localhost:5000/metrics --interval 15 --count 4
+#   python metrics.py clear                           # drop the per-process files (e.g. after a deploy)
+#
+# Worker-safe: every process (gunicorn worker) keeps its numbers in memory and writes them every
+# FLUSH_SECONDS to METRICS_DIR/<pid>.json (write + atomic rename). Whichever worker serves /metrics
+# flushes its own file first and sums all of them, so counters and histograms cover every worker,
+# including ones gunicorn has restarted since (their last flush stays on disk). Recording a value is
+# a dict update under a lock - no disk or DB access on the request path.
+#
+#   METRICS=0            don't install (no /metrics, no timing)
+#   METRICS_DIR          default: <tmp>/finvestacore_metrics
+#   METRICS_FLUSH_SECONDS default 5: how stale another worker's numbers can be in a scrape
+#   METRICS_TOKEN        when set, /metrics wants "Authorization: Bearer <token>"
+#
+# "Report cache" is the report replica (db_backend.create_report_backend): a report served from the
+# replica is a hit, one that had to fall back to the primary a miss.
+
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'finvestacore_metrics')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DB_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'mfi_http_requests_total': ('counter', 'HTTP requests by route, method and status.', None),
+    'mfi_http_request_duration_seconds': ('histogram', 'HTTP request latency by route.', REQUEST_BUCKETS),
+    'mfi_db_connect_wait_seconds': ('histogram', 'Time to get a DB connection (pool wait / open).', DB_BUCKETS),
+    'mfi_db_lock_wait_seconds': ('histogram', 'SQLite BEGIN IMMEDIATE duration (waiting for the write lock).',
+                                 DB_BUCKETS),
+    'mfi_db_locked_errors_total': ('counter', "Statements that failed with 'database is locked' / lock timeouts "
+                                              "(each one a user-visible retry).", None),
+    'mfi_db_queries_total': ('counter', 'Statements run, by backend.', None),
+    'mfi_db_write_transaction_seconds': ('histogram', 'Write transactions from first write to commit/rollback.',
+                                         DB_BUCKETS),
+    'mfi_report_reads_total': ('counter', 'Report connections by source (replica = cache hit, primary = miss).',
+                               None),
+    'mfi_emis_posted_total': ('counter', 'EMI payments recorded.', None),
+    'mfi_emi_amount_rupees_total': ('counter', 'Rupees received as EMI payments.', None),
+    'mfi_advance_payments_total': ('counter', 'Advance payments recorded.', None),
+    'mfi_penalties_added_total': ('counter', 'Penalties added to loans.', None),
+    'mfi_loans_disbursed_total': ('counter', 'Loans disbursed: added as Active (add_loan) or Pending -> Active '
+                                             '(complete_loan).', None),
+    'mfi_loan_disbursed_amount_rupees_total': ('counter', 'Rupees disbursed as loans.', None),
+}
+
+_LOCK_ERRORS = ('database is locked', 'database table is locked', 'lock timeout', 'could not obtain lock',
+                'deadlock detected')
+
+
+# =====================================================================
+# PER-PROCESS REGISTRY
+# =====================================================================
+
+class Registry:
+    """Counters and histograms of this process; flushed to METRICS_DIR/<pid>.json."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}  # (name, labels) -> float (counter) / [bucket counts..., sum, count] (histogram)
+        self.pid = os.getpid()
+        self.flusher = None
+        self.enabled = False  # set by install(); until then recording is a no-op
+
+    def reset_after_fork(self):
+        # The child starts from zero: the parent's numbers stay in the parent's file
+        self.lock = threading.Lock()
+        self.values = {}
+        self.pid = os.getpid()
+        self.flusher = None
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self._start_flusher()
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        buckets = METRICS[name][2]
+        with self.lock:
+            hist = self.values.get(key)
+            if hist is None:
+                hist = self.values[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += value
+            hist[-1] += 1
+        self._start_flusher()
+
+    def _start_flusher(self):
+        if self.flusher is None:
+            with self.lock:
+                if self.flusher is None:
+                    self.flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+                    self.flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Metrics flush failed: {e}")
+
+    def flush(self):
+        with self.lock:
+            entries = [[name, list(labels), value] for (name, labels), value in self.values.items()]
+        if not entries:
+            return
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{self.pid}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp, path)
+
+
+registry = Registry()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.reset_after_fork)
+
+inc = registry.inc
+observe = registry.observe
+
+
+# =====================================================================
+# AGGREGATION / EXPOSITION
+# =====================================================================
+
+def collect(directory=METRICS_DIR):
+    """Sums every process file: {(name, labels): value}."""
+    totals = {}
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            continue  # being replaced right now; its numbers come back on the next scrape
+        for name, labels, value in entries:
+            if name not in METRICS:
+                continue
+            key = (name, tuple(tuple(pair) for pair in labels))
+            if isinstance(value, list):
+                current = totals.get(key)
+                totals[key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(totals):
+    """Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in totals.items() if metric == name)
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', _number(float(bound)))])} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {value[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(float(value[-2]))}")
+                lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+            else:
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def exposition():
+    registry.flush()
+    return render(collect())
+
+
+# =====================================================================
+# APP HOOKS
+# =====================================================================
+
+def _on_query(sql, params, seconds, backend_name, raw_connection, error):
+    inc('mfi_db_queries_total', backend=backend_name)
+    if backend_name == 'sqlite' and sql.lstrip()[:5].upper() == 'BEGIN':
+        observe('mfi_db_lock_wait_seconds', seconds)
+    if error is not None and any(text in str(error).lower() for text in _LOCK_ERRORS):
+        inc('mfi_db_locked_errors_total', backend=backend_name)
+
+
+def _on_transaction(seconds, outcome, backend_name):
+    observe('mfi_db_write_transaction_seconds', seconds, outcome=outcome)
+
+
+def install(app):
+    """GET /metrics plus request timing on app, DB listeners on db_backend."""
+    import db_backend
+    from flask import Response, g, request
+
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else '<unmatched>'  # bounded label set
+            observe('mfi_http_request_duration_seconds', time.perf_counter() - started,
+                    route=route, method=request.method)
+            inc('mfi_http_requests_total', route=route, method=request.method, status=str(response.status_code))
+        return response
+
+    def metrics_endpoint():
+        if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    registry.enabled = True
+    if _on_query not in db_backend.QUERY_LISTENERS:
+        db_backend.QUERY_LISTENERS.append(_on_query)
+    if _on_transaction not in db_backend.TRANSACTION_LISTENERS:
+        db_backend.TRANSACTION_LISTENERS.append(_on_transaction)
+    db_backend.forward_sqlalchemy_queries()
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
+
+
+# =====================================================================
+# SCRAPER STAND-IN
+# =====================================================================
+
+def parse(text):
+    """{(name, labels): value} from the text format; raises ValueError on malformed lines."""
+    samples = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line or line.startswith('#'):
+            continue
+        try:
+            head, value = line.rsplit(' ', 1)
+            if '{' in head:
+                name, rest = head.split('{', 1)
+                labels = []
+                for pair in rest.rstrip('}').split('",'):
+                    key, raw = pair.split('=', 1)
+                    labels.append((key, raw.strip('"').replace('\\"', '"').replace('\\n', '\n').replace('\\\\', '\\')))
+                labels = tuple(labels)
+            else:
+                name, labels = head, ()
+            samples[(name, labels)] = float(value)
+        except ValueError:
+            raise ValueError(f"line {number}: {line!r}")
+    return samples
+
+
+def validate(samples):
+    """Problems a Prometheus server would choke on or that mean double counting: non-cumulative buckets,
+    +Inf bucket != _count."""
+    problems = []
+    histograms = {}
+    for (name, labels), value in samples.items():
+        if name.endswith('_bucket'):
+            base = tuple(pair for pair in labels if pair[0] != 'le')
+            le = dict(labels)['le']
+            histograms.setdefault((name[:-7], base), []).append((math.inf if le == '+Inf' else float(le), value))
+    for (name, labels), buckets in histograms.items():
+        buckets.sort()
+        counts = [count for _, count in buckets]
+        if counts != sorted(counts):
+            problems.append(f"{name}{dict(labels)}: buckets not cumulative")
+        if samples.get((f"{name}_count", labels)) != counts[-1]:
+            problems.append(f"{name}{dict(labels)}: +Inf bucket != _count")
+    return problems
+
+
+def quantile(samples, name, labels, q):
+    """Histogram quantile the way PromQL's histogram_quantile interpolates inside a bucket."""
+    buckets = sorted((math.inf if dict(l)['le'] == '+Inf' else float(dict(l)['le']), v)
+                     for (n, l), v in samples.items()
+                     if n == f"{name}_bucket" and tuple(p for p in l if p[0] != 'le') == labels)
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower, below = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == math.inf:
+                return lower
+            return lower + (bound - lower) * ((rank - below) / (count - below) if count > below else 0)
+        lower, below = bound, count
+    return lower
+
+
+def scrape(url, interval, count, token=None):
+    previous, started = None, None
+    status = 0
+    for n in range(count):
+        if n:
+            time.sleep(interval)
+        request = urllib.request.Request(url, headers={'Authorization': f"Bearer {token}"} if token else {})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            text = response.read().decode('utf-8')
+        now = time.monotonic()
+        samples = parse(text)
+        problems = validate(samples)
+        print(f"scrape {n + 1}: {len(samples)} samples, {len(text)} bytes"
+              f"{'' if not problems else ', INVALID: ' + '; '.join(problems)}")
+        status = status or (1 if problems else 0)
+        routes = sorted({l for (name, l) in samples if name == 'mfi_http_request_duration_seconds_count'})
+        for labels in routes:
+            p50 = quantile(samples, 'mfi_http_request_duration_seconds', labels, 0.5)
+            p95 = quantile(samples, 'mfi_http_request_duration_seconds', labels, 0.95)
+            total = samples[('mfi_http_request_duration_seconds_count', labels)]
+            print(f"  {dict(labels).get('method', ''):6} {dict(labels).get('route', ''):40} n={total:<8.0f} "
+                  f"p50={p50 * 1000:8.1f}ms p95={p95 * 1000:8.1f}ms")
+        if previous is not None:
+            minutes = (now - started) / 60
+            for name in ('mfi_emis_posted_total', 'mfi_loans_disbursed_total', 'mfi_http_requests_total',
+                         'mfi_db_locked_errors_total'):
+                delta = sum(v for (n2, _), v in samples.items() if n2 == name) - \
+                        sum(v for (n2, _), v in previous.items() if n2 == name)
+                print(f"  {name}: {delta / minutes:.1f}/min")
+        hits = sum(v for (name, l), v in samples.items() if name == 'mfi_report_reads_total' and dict(l).get('source') == 'replica')
+        reads = sum(v for (name, _), v in samples.items() if name == 'mfi_report_reads_total')
+        if reads:
+            print(f"  report replica hit rate: {hits / reads:.1%} of {reads:.0f}")
+        previous, started = samples, now
+    return status
+
+
+def clear(directory=METRICS_DIR):
+    removed = 0
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+        removed += 1
+    print(f"Removed {removed} metrics files from {directory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape / reset the app's Prometheus metrics.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    scrape_parser = sub.add_parser('scrape', help="fetch /metrics like Prometheus would and summarize it")
+    scrape_parser.add_argument('url', nargs='?', default='http://localhost:5000/metrics')
+    scrape_parser.add_argument('--interval', type=float, default=15)
+    scrape_parser.add_argument('--count', type=int, default=1)
+    scrape_parser.add_argument('--token', default=METRICS_TOKEN)
+    sub.add_parser('clear', help="remove the per-process files in METRICS_DIR")
+    args = parser.parse_args()
+
+    if args.command == 'clear':
+        clear()
+        return 0
+    return scrape(args.url, args.interval, args.count, args.token)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
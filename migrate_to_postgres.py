@@ -0,0 +1,360 @@
+# migrate_to_postgres.py
+# One-shot copy of finvestacore.db into the PostgreSQL database from render.yaml.
+#
+#   DATABASE_URL=postgres://... python migrate_to_postgres.py
+#   python migrate_to_postgres.py --sqlite finvestacore.db --pg postgres://... --workers 4 --truncate
+#   python migrate_to_postgres.py --method insert      # multi-row INSERTs instead of COPY
+#
+# Steps:
+#   1. Schema: app.init_db() on Postgres (same DDL the app uses), plus translated SQLite DDL for
+#      any legacy table the app no longer creates.
+#   2. Foreign keys and secondary indexes are dropped so loading doesn't maintain them row by row.
+#   3. Tables load in parallel: each streams out of SQLite in --batch sized chunks and goes in
+#      with COPY FROM STDIN (or execute_values INSERTs), one transaction per table.
+#   4. Verify: row count and an order-independent checksum per table, SQLite vs Postgres.
+#   5. Normalized member lookup columns are backfilled, indexes and foreign keys are rebuilt,
+#      SERIAL sequences are moved past the copied ids, tables are ANALYZEd.
+#
+# The SQLite file is opened read-only. Exit code is 1 if any table failed or did not verify.
+
+import argparse
+import hashlib
+import importlib
+import io
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import psycopg2
+import psycopg2.extras
+
+from db_backend import translate_sql
+
+SKIP_TABLES = {'sqlite_sequence'}
+DEFAULT_BATCH = 10000
+
+
+def sqlite_connect(path):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    conn.text_factory = str
+    return conn
+
+
+def sqlite_tables(path):
+    with sqlite_connect(path) as conn:
+        rows = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall()
+    return [(name, sql) for name, sql in rows if name not in SKIP_TABLES]
+
+
+def _quoted(columns):
+    return ', '.join(f'"{c}"' for c in columns)
+
+
+def nonempty_tables(pg_url, table_names):
+    """Target tables that already hold rows (checked before init_db seeds its defaults)."""
+    with psycopg2.connect(pg_url) as conn, conn.cursor() as cur:
+        found = []
+        for table in table_names:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f'"{table}"',))
+            if cur.fetchone()[0]:
+                cur.execute(f'SELECT EXISTS (SELECT 1 FROM "{table}")')
+                if cur.fetchone()[0]:
+                    found.append(table)
+        return found
+
+
+def pg_columns(cur, table):
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position
+    """, (table,))
+    return [row[0] for row in cur.fetchall()]
+
+
+# =====================================================================
+# 1. SCHEMA
+# =====================================================================
+
+def create_schema(pg_url, tables):
+    """Creates the app schema on Postgres, then any extra SQLite tables from their own DDL."""
+    os.environ['DATABASE_URL'] = pg_url
+    importlib.import_module('app')  # init_db() runs on import against DATABASE_URL
+
+    with psycopg2.connect(pg_url) as conn, conn.cursor() as cur:
+        for name, ddl in tables:
+            if pg_columns(cur, name):
+                continue
+            # Legacy table: SQLite kept ALTER-added columns with "" defaults; Postgres reads "" as an identifier
+            ddl = ddl.replace('DEFAULT ""', "DEFAULT ''")
+            ddl = ddl.replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS', 1)
+            cur.execute(translate_sql(ddl, False))
+            print(f"  created legacy table {name}")
+
+
+def drop_constraints_and_indexes(pg_url, table_names):
+    """Drops FKs and non-constraint indexes on the tables; returns the DDL to recreate them."""
+    with psycopg2.connect(pg_url) as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.conname, t.relname, pg_get_constraintdef(c.oid)
+            FROM pg_constraint c JOIN pg_class t ON t.oid = c.conrelid
+            WHERE c.contype = 'f' AND t.relnamespace = current_schema()::regnamespace AND t.relname = ANY(%s)
+        """, (list(table_names),))
+        foreign_keys = cur.fetchall()
+        cur.execute("""
+            SELECT ic.relname, t.relname, pg_get_indexdef(i.indexrelid)
+            FROM pg_index i
+            JOIN pg_class ic ON ic.oid = i.indexrelid
+            JOIN pg_class t ON t.oid = i.indrelid
+            WHERE t.relnamespace = current_schema()::regnamespace AND t.relname = ANY(%s)
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+        """, (list(table_names),))
+        indexes = cur.fetchall()
+        for name, table, _ in foreign_keys:
+            cur.execute(f'ALTER TABLE "{table}" DROP CONSTRAINT "{name}"')
+        for name, _, _ in indexes:
+            cur.execute(f'DROP INDEX "{name}"')
+    return foreign_keys, indexes
+
+
+# =====================================================================
+# 2. LOAD
+# =====================================================================
+
+def _copy_text(value):
+    """One field in COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bytes):
+        return '\\\\x' + value.hex()
+    text = repr(value) if isinstance(value, float) else str(value)
+    return text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_batch(cur, table, columns, rows):
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join(_copy_text(v) for v in row))
+        buf.write('\n')
+    buf.seek(0)
+    cur.copy_expert(f'COPY "{table}" ({_quoted(columns)}) FROM STDIN', buf)
+
+
+def insert_batch(cur, table, columns, rows):
+    psycopg2.extras.execute_values(cur, f'INSERT INTO "{table}" ({_quoted(columns)}) VALUES %s', rows, page_size=1000)
+
+
+def load_table(sqlite_path, pg_url, table, batch_size, method):
+    """Replaces one table's rows in a single Postgres transaction. Returns a stats dict."""
+    started = time.perf_counter()
+    src = sqlite_connect(sqlite_path)
+    dst = psycopg2.connect(pg_url)
+    stats = {'table': table, 'rows': 0, 'error': None}
+    try:
+        with dst.cursor() as cur:
+            target_columns = set(pg_columns(cur, table))
+            source_columns = [row[1] for row in src.execute(f'PRAGMA table_info("{table}")')]
+            columns = [c for c in source_columns if c in target_columns]
+            skipped = [c for c in source_columns if c not in target_columns]
+            if skipped:
+                print(f"  {table}: columns not in Postgres, skipped: {', '.join(skipped)}")
+            stats['columns'] = columns
+
+            # Clears rows seeded by init_db (counters) or left by an earlier run (--truncate).
+            # Same transaction as the load: Postgres can skip WAL for the new rows (wal_level=minimal)
+            cur.execute(f'TRUNCATE "{table}"')
+
+            write = copy_batch if method == 'copy' else insert_batch
+            source = src.execute(f'SELECT {_quoted(columns)} FROM "{table}"')
+            while True:
+                rows = source.fetchmany(batch_size)
+                if not rows:
+                    break
+                write(cur, table, columns, rows)
+                stats['rows'] += len(rows)
+        dst.commit()
+    except Exception as e:
+        dst.rollback()
+        stats['error'] = f"{type(e).__name__}: {e}".strip()
+    finally:
+        src.close()
+        dst.close()
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+# =====================================================================
+# 3. VERIFY
+# =====================================================================
+
+def _canonical(value):
+    """Same text for a value read back from either database (REAL vs DOUBLE, NUMERIC vs Decimal)."""
+    if value is None:
+        return '\x00'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        number = float(value)
+        return str(int(number)) if number.is_integer() else repr(number)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+
+def _checksum(rows):
+    """Row count and sum of per-row hashes (mod 2**64), so row order doesn't matter."""
+    count, total = 0, 0
+    for row in rows:
+        digest = hashlib.blake2b('\x1f'.join(_canonical(v) for v in row).encode(), digest_size=8).digest()
+        total = (total + int.from_bytes(digest, 'big')) % (1 << 64)
+        count += 1
+    return count, total
+
+
+def _iter_batches(cursor, batch_size):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def verify_table(sqlite_path, pg_url, table, columns, batch_size):
+    column_list = _quoted(columns)
+    with sqlite_connect(sqlite_path) as src:
+        expected = _checksum(_iter_batches(src.execute(f'SELECT {column_list} FROM "{table}"'), batch_size))
+    with psycopg2.connect(pg_url) as dst:
+        with dst.cursor(name=f'verify_{table}') as cur:  # server-side cursor: streams, bounded memory
+            cur.itersize = batch_size
+            cur.execute(f'SELECT {column_list} FROM "{table}"')
+            actual = _checksum(cur)
+    return expected, actual
+
+
+# =====================================================================
+# 4. FINISH (backfill, indexes, FKs, sequences)
+# =====================================================================
+
+def backfill_lookup_columns(pg_url):
+    """Fills members.phone_e164/aadhaar_norm/pan_norm before their unique indexes come back."""
+    import app as flask_app
+    with flask_app.get_db_connection() as conn:
+        flask_app.backfill_member_lookup_columns(conn.cursor())
+
+
+def rebuild_index(pg_url, name, table, ddl):
+    with psycopg2.connect(pg_url) as conn, conn.cursor() as cur:
+        try:
+            cur.execute(ddl)
+            return None
+        except psycopg2.IntegrityError:
+            conn.rollback()
+            if not ddl.startswith('CREATE UNIQUE INDEX'):
+                raise
+            # Same fallback as app.create_member_lookup_indexes(): keep lookups fast, merge duplicates by hand
+            plain_name = name.replace('ux_', 'ix_', 1) if name.startswith('ux_') else f"{name}_nonunique"
+            cur.execute(ddl.replace('CREATE UNIQUE INDEX', 'CREATE INDEX', 1).replace(f' {name} ', f' {plain_name} ', 1))
+            return f"{name}: duplicate values, created non-unique {plain_name}"
+
+
+def rebuild_foreign_key(pg_url, name, table, definition):
+    with psycopg2.connect(pg_url) as conn, conn.cursor() as cur:
+        try:
+            cur.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+            return None
+        except psycopg2.IntegrityError as e:
+            # SQLite never enforced foreign keys; keep the constraint for new rows and report the orphans
+            conn.rollback()
+            cur.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition} NOT VALID')
+            return f"{table}.{name}: existing rows violate it, added NOT VALID ({str(e).splitlines()[0]})"
+
+
+def reset_sequences(pg_url, table_names):
+    with psycopg2.connect(pg_url) as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT table_name, column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ANY(%s) AND column_default LIKE 'nextval(%%'
+        """, (list(table_names),))
+        for table, column in cur.fetchall():
+            cur.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX(\"{column}\"), 0) + 1, false) FROM \"{table}\"",
+                (table, column)
+            )
+        for table in table_names:
+            cur.execute(f'ANALYZE "{table}"')
+
+
+# =====================================================================
+# 5. MAIN
+# =====================================================================
+
+def migrate(sqlite_path, pg_url, workers=4, batch_size=DEFAULT_BATCH, method='copy', truncate=False):
+    """Runs the whole migration. Returns True if every table loaded and verified."""
+    tables = sqlite_tables(sqlite_path)
+    names = [name for name, _ in tables]
+    print(f"Migrating {len(names)} tables from {sqlite_path} ({method}, {workers} workers, batch {batch_size})")
+
+    existing = nonempty_tables(pg_url, names)
+    if existing and not truncate:
+        print(f"Target already has rows in: {', '.join(existing)}. Re-run with --truncate to replace them.")
+        return False
+    create_schema(pg_url, tables)
+    foreign_keys, indexes = drop_constraints_and_indexes(pg_url, names)
+    print(f"Dropped {len(foreign_keys)} foreign keys and {len(indexes)} indexes for the load")
+
+    started = time.perf_counter()
+    ok = True
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda t: load_table(sqlite_path, pg_url, t, batch_size, method), names))
+        for stats in results:
+            if stats['error']:
+                ok = False
+                print(f"  FAILED {stats['table']}: {stats['error']}")
+            else:
+                rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+                print(f"  {stats['table']:<20} {stats['rows']:>10} rows  {stats['seconds']:7.2f}s  {rate:>10.0f} rows/s")
+        print(f"Loaded in {time.perf_counter() - started:.2f}s")
+
+        loaded = [s for s in results if not s['error']]
+        checks = pool.map(lambda s: (s['table'], verify_table(sqlite_path, pg_url, s['table'], s['columns'], batch_size)), loaded)
+        for table, (expected, actual) in checks:
+            status = 'OK' if expected == actual else 'MISMATCH'
+            ok = ok and expected == actual
+            print(f"  verify {table:<20} rows {expected[0]} -> {actual[0]}  checksum {expected[1]:016x} -> {actual[1]:016x}  {status}")
+
+        if 'members' in names:
+            backfill_lookup_columns(pg_url)
+        started = time.perf_counter()
+        warnings = list(pool.map(lambda ix: rebuild_index(pg_url, *ix), indexes))
+        warnings += [rebuild_foreign_key(pg_url, *fk) for fk in foreign_keys]
+        for warning in filter(None, warnings):
+            print(f"  WARNING {warning}")
+        print(f"Rebuilt {len(indexes)} indexes and {len(foreign_keys)} foreign keys in {time.perf_counter() - started:.2f}s")
+
+    reset_sequences(pg_url, names)
+    sys.modules['app'].db.dispose()
+    print("Migration complete." if ok else "Migration finished with errors (see above).")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy the SQLite database into PostgreSQL (COPY, parallel, verified).")
+    parser.add_argument('--sqlite', default='finvestacore.db', help="Source SQLite file")
+    parser.add_argument('--pg', default=os.environ.get('DATABASE_URL'), help="Target URL (default: $DATABASE_URL)")
+    parser.add_argument('--workers', type=int, default=4, help="Tables loaded in parallel")
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH, help="Rows per read/write batch")
+    parser.add_argument('--method', choices=['copy', 'insert'], default='copy')
+    parser.add_argument('--truncate', action='store_true', help="Empty target tables before loading")
+    args = parser.parse_args()
+
+    if not args.pg:
+        parser.error("--pg or DATABASE_URL is required")
+    if not os.path.exists(args.sqlite):
+        parser.error(f"{args.sqlite} not found")
+    sys.exit(0 if migrate(args.sqlite, args.pg, args.workers, args.batch, args.method, args.truncate) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import re
+
+# Canonical forms for member identifiers.
+# Raw values are stored as typed by staff (e.g. "+91 98765-43210", "1234 5678 9012");
+# the normalized shadow columns (phone_e164, aadhaar_norm, pan_norm) hold these forms
+# so duplicate checks and lookups become a single indexed equality probe.
+
+_NON_DIGITS = re.compile(r'[^\d]')
+_NON_ALNUM = re.compile(r'[^0-9A-Za-z]')
+
+DEFAULT_COUNTRY_CODE = '91'
+
+
+def normalize_phone(raw):
+    """Returns an Indian mobile number in E.164 form ('+919876543210') or None."""
+    if not raw:
+        return None
+    digits = _NON_DIGITS.sub('', str(raw))
+    if len(digits) == 10:
+        return f"+{DEFAULT_COUNTRY_CODE}{digits}"
+    if len(digits) == 11 and digits.startswith('0'):
+        # Trunk prefix, e.g. 09876543210
+        return f"+{DEFAULT_COUNTRY_CODE}{digits[1:]}"
+    if len(digits) == 12 and digits.startswith(DEFAULT_COUNTRY_CODE):
+        return f"+{digits}"
+    if len(digits) == 13 and digits.startswith('0' + DEFAULT_COUNTRY_CODE):
+        return f"+{digits[1:]}"
+    return f"+{digits}" if digits else None
+
+
+def normalize_aadhaar(raw):
+    """Returns the 12 Aadhaar digits without spaces/dashes, or None."""
+    if not raw:
+        return None
+    digits = _NON_DIGITS.sub('', str(raw))
+    return digits or None
+
+
+def normalize_pan(raw):
+    """Returns the PAN upper-cased with separators removed, or None."""
+    if not raw:
+        return None
+    value = _NON_ALNUM.sub('', str(raw)).upper()
+    return value or None
@@ -0,0 +1,235 @@
+# parallel_reports.py
+# Multi-year reports split into calendar months and computed in parallel worker processes.
+#
+#   python parallel_reports.py pnl 2019-01-01 2026-10-31 --workers 4
+#   python parallel_reports.py loan_dispatch 2019-01-01 2026-10-31 --out dispatch.csv
+#   python parallel_reports.py collection_efficiency 2019-01-01 2026-10-31
+#
+# Each worker opens its own read-only connection once (SQLite mode=ro, or a read-only Postgres
+# session) and computes partial aggregates for the months it is handed; the parent merges them.
+# The partial queries are the ones in app.get_pnl_report_data / fetch_loan_dispatch_report_data and
+# reporting_logic.calculate_collection_efficiency, restricted to one month - results are the same.
+# Months only read their own rows through the date indexes (app.create_report_date_indexes).
+#
+# Workers are started with 'spawn' (no fork of a process that already runs threads). The same
+# functions are registered as *_parallel jobs in job_queue.
+
+import argparse
+import datetime as dt
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from db_backend import translate_sql
+
+DEFAULT_SOURCE = os.environ.get('MFI_REPORT_SOURCE') or os.environ.get('DATABASE_URL') or 'finvestacore.db'
+DEFAULT_WORKERS = int(os.environ.get('REPORT_WORKERS', os.cpu_count() or 1))
+
+
+def month_partitions(from_date, to_date):
+    """[(first_day, last_day), ...] as ISO strings, one per calendar month, clipped to the range."""
+    start = dt.date.fromisoformat(str(from_date))
+    end = dt.date.fromisoformat(str(to_date))
+    parts = []
+    current = start
+    while current <= end:
+        next_month = (current.replace(day=1) + dt.timedelta(days=32)).replace(day=1)
+        parts.append((current.isoformat(), min(end, next_month - dt.timedelta(days=1)).isoformat()))
+        current = next_month
+    return parts
+
+
+# =====================================================================
+# WORKER SIDE (one connection per process)
+# =====================================================================
+
+_conn = None
+_is_postgres = False
+_session = None
+
+
+def _init_sql_worker(source):
+    global _conn, _is_postgres
+    if source.startswith(('postgres://', 'postgresql://')):
+        import psycopg2
+        _conn = psycopg2.connect(source)
+        _conn.set_session(readonly=True, autocommit=True)
+        _is_postgres = True
+    else:
+        path = source[len('sqlite:///'):] if source.startswith('sqlite:///') else source
+        _conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        _conn.row_factory = sqlite3.Row
+
+
+def _init_orm_worker():
+    global _session
+    from database import SessionLocal
+    _session = SessionLocal()
+
+
+def _close_worker():
+    global _conn, _session
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+    if _session is not None:
+        _session.close()
+        _session = None
+
+
+def _fetch(sql, params):
+    if _is_postgres:
+        import psycopg2.extras
+        cursor = _conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        cursor.execute(translate_sql(sql), params)
+    else:
+        cursor = _conn.execute(sql, params)
+    return cursor.fetchall()
+
+
+def _pnl_partial(part):
+    interest = _fetch("""
+        SELECT COALESCE(SUM(interest_amount), 0) FROM payments
+        WHERE pay_date BETWEEN ? AND ? AND type = 'emi'
+    """, part)[0][0]
+    fees = _fetch("SELECT COALESCE(SUM(amount), 0) FROM fees WHERE fee_date BETWEEN ? AND ?", part)[0][0]
+    operating = _fetch("""
+        SELECT COALESCE(SUM(amount), 0) FROM expenses
+        WHERE date BETWEEN ? AND ? AND category = 'operating'
+    """, part)[0][0]
+    return float(interest), float(fees), float(operating)
+
+
+def _loan_dispatch_partial(part):
+    rows = _fetch("""
+        SELECT l.loan_id, m.full_name as member_name, m.phone_number as mobile_no, l.amount as loan_amount,
+               l.loan_date, l.loan_closed_date, l.total_paid
+        FROM loans l
+        JOIN members m ON l.member_id = m.id
+        WHERE l.loan_date BETWEEN ? AND ?
+        ORDER BY l.loan_date
+    """, part)
+    return [{
+        'loan_id': row['loan_id'], 'member_name': row['member_name'], 'mobile_no': row['mobile_no'] or 'N/A',
+        'loan_amount': row['loan_amount'], 'loan_date': row['loan_date'], 'loan_closed_date': row['loan_closed_date'] or '',
+        'total_paid': row['total_paid'] or 0
+    } for row in rows]
+
+
+def _collection_efficiency_partial(part):
+    from sqlalchemy import func
+    from database import AmortizationSchedule, CollectionTransaction
+    first, last = (dt.date.fromisoformat(d) for d in part)
+    total_due = _session.query(func.sum(AmortizationSchedule.total_emi)).filter(
+        AmortizationSchedule.due_date >= first,
+        AmortizationSchedule.due_date <= last
+    ).scalar() or 0.0
+    total_paid = _session.query(func.sum(CollectionTransaction.amount_paid)).filter(
+        CollectionTransaction.payment_date >= first,
+        CollectionTransaction.payment_date <= last
+    ).scalar() or 0.0
+    return float(total_due), float(total_paid)
+
+
+# =====================================================================
+# EXECUTOR
+# =====================================================================
+
+def run_partitioned(func, parts, workers=DEFAULT_WORKERS, initializer=None, initargs=()):
+    """Runs func over the partitions (in order) in a process pool; in-process for one worker."""
+    if workers <= 1 or len(parts) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        try:
+            return [func(part) for part in parts]
+        finally:
+            _close_worker()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(parts)), mp_context=context,
+                             initializer=initializer, initargs=initargs) as pool:
+        return list(pool.map(func, parts))
+
+
+def parallel_pnl(from_date, to_date, source=DEFAULT_SOURCE, workers=DEFAULT_WORKERS):
+    """Same result as app.get_pnl_report_data, computed per month."""
+    partials = run_partitioned(_pnl_partial, month_partitions(from_date, to_date), workers,
+                               _init_sql_worker, (source,))
+    interest_income = round(math.fsum(p[0] for p in partials), 2)
+    other_income = round(math.fsum(p[1] for p in partials), 2)
+    operating_expenses = round(math.fsum(p[2] for p in partials), 2)
+    interest_paid = 0.0
+    total_income = interest_income + other_income
+    total_expenses = operating_expenses + interest_paid
+    return {
+        'interest_income': interest_income,
+        'other_income': other_income,
+        'total_income': total_income,
+        'operating_expenses': operating_expenses,
+        'interest_paid': interest_paid,
+        'total_expenses': total_expenses,
+        'net_profit': total_income - total_expenses
+    }
+
+
+def parallel_loan_dispatch(from_date, to_date, source=DEFAULT_SOURCE, workers=DEFAULT_WORKERS):
+    """Same rows as app.fetch_loan_dispatch_report_data (months come back in order)."""
+    partials = run_partitioned(_loan_dispatch_partial, month_partitions(from_date, to_date), workers,
+                               _init_sql_worker, (source,))
+    return [row for rows in partials for row in rows]
+
+
+def parallel_collection_efficiency(start_date, end_date, workers=DEFAULT_WORKERS):
+    """Same result as reporting_logic.calculate_collection_efficiency (database.py models)."""
+    partials = run_partitioned(_collection_efficiency_partial, month_partitions(start_date, end_date), workers,
+                               _init_orm_worker)
+    total_due = math.fsum(p[0] for p in partials)
+    total_paid = math.fsum(p[1] for p in partials)
+    efficiency = 0.0
+    if total_due > 0:
+        efficiency = (total_paid / total_due) * 100
+    return {
+        'total_due': round(total_due, 2),
+        'total_paid': round(total_paid, 2),
+        'efficiency_percent': round(efficiency, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Month-partitioned reports in parallel processes.")
+    parser.add_argument('report', choices=['pnl', 'loan_dispatch', 'collection_efficiency'])
+    parser.add_argument('from_date')
+    parser.add_argument('to_date')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help="SQLite file or postgres:// URL")
+    parser.add_argument('--out', help="loan_dispatch: write rows to this CSV file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    started = time.perf_counter()
+    if args.report == 'pnl':
+        result = parallel_pnl(args.from_date, args.to_date, args.source, args.workers)
+    elif args.report == 'collection_efficiency':
+        result = parallel_collection_efficiency(args.from_date, args.to_date, args.workers)
+    else:
+        rows = parallel_loan_dispatch(args.from_date, args.to_date, args.source, args.workers)
+        if args.out:
+            import export_utils
+            columns = list(rows[0].keys()) if rows else []
+            with open(args.out, 'w', encoding='utf-8', newline='') as f:
+                for chunk in export_utils.csv_chunks(columns, rows):
+                    f.write(chunk)
+        result = {'rows': len(rows), 'out': args.out}
+    elapsed = time.perf_counter() - started
+    print(json.dumps(result, indent=2))
+    print(f"{len(month_partitions(args.from_date, args.to_date))} months, {args.workers} workers, {elapsed:.2f}s",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# qt_models.py
+# Shared model/view helpers for the PyQt desktop app (main_app.py).
+#
+# - run_query():       runs a DB function on QThreadPool with its own Session, result back on the GUI thread
+# - PagedQueryModel:   QAbstractTableModel that keyset-pages rows in through run_query() as views scroll;
+#                      locate_key() reads ahead to a given key in the background (search -> select row)
+#
+# Page/query functions receive a Session and must return plain tuples (never ORM objects),
+# because the session is closed before the result reaches the GUI thread.
+
+from bisect import bisect_left
+
+from PyQt6.QtCore import (
+    Qt, QObject, QRunnable, QThreadPool, QAbstractTableModel, QModelIndex, pyqtSignal
+)
+
+from database import SessionLocal
+
+# SQLite serializes writers anyway; a few readers are enough to keep the GUI responsive
+MAX_DB_THREADS = 4
+
+
+def db_thread_pool():
+    pool = QThreadPool.globalInstance()
+    if pool.maxThreadCount() > MAX_DB_THREADS:
+        pool.setMaxThreadCount(MAX_DB_THREADS)
+    return pool
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class QueryWorker(QRunnable):
+    """Runs fn(session, *args) on a pool thread and emits the result (or the error text)."""
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.signals = WorkerSignals()
+
+    def run(self):
+        session = SessionLocal()
+        try:
+            result = self.fn(session, *self.args)
+        except Exception as e:
+            session.rollback()
+            self.signals.failed.emit(str(e))
+            return
+        finally:
+            session.close()
+        self.signals.finished.emit(result)
+
+
+def run_query(fn, *args, on_result=None, on_error=None):
+    """Queues fn(session, *args) on the DB pool. Callbacks run on the GUI thread."""
+    worker = QueryWorker(fn, *args)
+    if on_result:
+        worker.signals.finished.connect(on_result)
+    if on_error:
+        worker.signals.failed.connect(on_error)
+    db_thread_pool().start(worker)
+    return worker
+
+
+class PagedQueryModel(QAbstractTableModel):
+    """
+    Read-only table model filled a page at a time.
+
+    page_query(session, after_key, limit) must return up to `limit` tuples ordered by their
+    first element (the keyset key, usually the primary key) with key > after_key (None = start).
+    Views (QTableView, QComboBox popups) call fetchMore() as the user scrolls; the page is read
+    on the DB pool so the GUI thread never waits on SQLite.
+    """
+    rows_loaded = pyqtSignal(int)  # number of rows added by the page that just arrived
+    load_failed = pyqtSignal(str)
+
+    PAGE_SIZE = 200
+    LOCATE_BATCH = 5000  # rows per query when locate_key() reads ahead to a key
+
+    def __init__(self, headers, page_query, parent=None, page_size=None, formatters=None):
+        super().__init__(parent)
+        self.headers = list(headers)
+        self.page_query = page_query
+        self.page_size = page_size or self.PAGE_SIZE
+        self.formatters = formatters or {}  # column -> callable(value) for display text
+        self._rows = []
+        self._keys = []  # first column of each loaded row (ascending), for bisect lookups
+        self._last_key = None
+        self._exhausted = False
+        self._loading = False
+        self._generation = 0  # bumped by reset(); pages from an older generation are dropped
+
+    # --- QAbstractTableModel ---
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return self.display_value(index.row(), index.column())
+
+    def display_value(self, row, column):
+        value = self._rows[row][column]
+        formatter = self.formatters.get(column)
+        if formatter:
+            return formatter(value)
+        return "" if value is None else str(value)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted or self._loading:
+            return
+        self._loading = True
+        generation = self._generation
+        run_query(
+            self.page_query, self._last_key, self.page_size,
+            on_result=lambda page: self._append_page(page, generation),
+            on_error=lambda message: self._page_failed(message, generation),
+        )
+
+    # --- Paging ---
+    def _append_page(self, page, generation):
+        if generation != self._generation:
+            return
+        self._append_rows(page, len(page) < self.page_size)
+
+    def _append_rows(self, rows, exhausted):
+        self._loading = False
+        if exhausted:
+            self._exhausted = True
+        if rows:
+            first = len(self._rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+            self._rows.extend(rows)
+            self._keys.extend(values[0] for values in rows)
+            self.endInsertRows()
+            self._last_key = rows[-1][0]
+        self.rows_loaded.emit(len(rows))
+
+    def _page_failed(self, message, generation):
+        if generation != self._generation:
+            return
+        self._loading = False
+        self._exhausted = True  # stop the view from retrying in a loop
+        self.load_failed.emit(message)
+
+    def reset(self):
+        """Drops loaded rows; call fetchMore() (or let the view do it) to start again."""
+        self.beginResetModel()
+        self._generation += 1
+        self._rows = []
+        self._keys = []
+        self._last_key = None
+        self._exhausted = False
+        self._loading = False
+        self.endResetModel()
+
+    def reload(self):
+        self.reset()
+        self.fetchMore()
+
+    # --- Row access ---
+    def row_values(self, row):
+        if row < 0 or row >= len(self._rows):
+            return None
+        return self._rows[row]
+
+    def key_for_row(self, row):
+        values = self.row_values(row)
+        return values[0] if values else None
+
+    def row_for_key(self, key):
+        """Row holding `key` among the rows loaded so far, or None (never reads the DB)."""
+        row = bisect_left(self._keys, key)
+        return row if row < len(self._keys) and self._keys[row] == key else None
+
+    def locate_key(self, key, on_found):
+        """
+        Calls on_found(row) for the row holding `key` (None if there is none). Rows up to it that
+        aren't loaded yet are read on the DB pool, LOCATE_BATCH at a time, and appended in one insert.
+        """
+        if self._exhausted or (self._last_key is not None and self._last_key >= key):
+            on_found(self.row_for_key(key))
+            return
+        if self._loading:
+            # The page in flight starts at the same key; this read covers it
+            self._generation += 1
+        self._loading = True
+        generation = self._generation
+
+        def located(result):
+            if generation != self._generation:
+                return
+            rows, exhausted = result
+            self._append_rows(rows, exhausted)
+            on_found(self.row_for_key(key))
+
+        def failed(message):
+            self._page_failed(message, generation)
+            on_found(None)
+
+        run_query(self._rows_through, self._last_key, key, on_result=located, on_error=failed)
+
+    def _rows_through(self, session, after_key, key):
+        """(rows after after_key up to and including key, exhausted) -- runs on the DB pool."""
+        rows = []
+        while True:
+            page = self.page_query(session, after_key, self.LOCATE_BATCH)
+            rows.extend(page)
+            if len(page) < self.LOCATE_BATCH:
+                return rows, True
+            after_key = page[-1][0]
+            if after_key >= key:
+                return rows, False
@@ -26,7 +26,8 @@ def calculate_portfolio_at_risk(db: Session, as_of_date: date = date.today()) ->
     }
     
     # सक्रिय लोन ID प्राप्त करें
-    active_loan_ids = [loan.id for loan in db.query(LoanAccount).filter(LoanAccount.status == 'ACTIVE').all()]
+    # FIXED: IDs only (full rows also pulled each loan's customer via LoanAccount.customer)
+    active_loan_ids = [row[0] for row in db.query(LoanAccount.id).filter(LoanAccount.status == 'ACTIVE').all()]
     
     # यदि कोई सक्रिय लोन नहीं है, तो तुरंत रिटर्न करें
     if not active_loan_ids:
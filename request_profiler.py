@@ -0,0 +1,184 @@
+# request_profiler.py
+# Opt-in per-request profiling for the Flask app (app.py): how many statements each route runs,
+# how long they take, the slowest one, and the Python time around them.
+#
+#   PROFILE_REQUESTS=1 gunicorn app:app
+#   GET    /admin/profile     per-route latency histogram + mean queries / SQL time (admin login)
+#   DELETE /admin/profile     reset it
+#
+# Every profiled response gets a Server-Timing header (db / app / total, shown in the browser's
+# network panel) and one JSON line on the "finvestacore.profile" logger. Statements are seen through
+# db_backend.QUERY_LISTENERS (get_db_connection / get_report_connection) and SQLAlchemy's cursor
+# events (database.py engines). Only statements run on the request's own thread are counted; time
+# spent streaming a response body after the view returns is not.
+#
+# The histogram lives in process memory: with several gunicorn workers each one keeps its own.
+# With PROFILE_REQUESTS unset nothing is installed and statements are not timed at all.
+
+import json
+import logging
+import threading
+import time
+
+from flask import g, jsonify, request, session
+
+import db_backend
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SLOWEST_SQL_CHARS = 300
+
+logger = logging.getLogger('finvestacore.profile')
+
+_local = threading.local()
+_routes = {}
+_routes_lock = threading.Lock()
+
+
+class RequestStats:
+    """Statements seen on one request's thread."""
+
+    __slots__ = ('started', 'queries', 'sql_seconds', 'slowest_seconds', 'slowest_sql')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_sql = None
+
+    def record(self, sql, seconds):
+        self.queries += 1
+        self.sql_seconds += seconds
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_sql = sql
+
+
+class RouteHistogram:
+    """Latency buckets and totals for one 'METHOD /rule'."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)  # last one: slower than every bound
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.sql_ms = 0.0
+        self.queries = 0
+        self.slowest_ms = 0.0
+        self.slowest_sql = None
+
+    def add(self, total_ms, stats):
+        index = next((i for i, bound in enumerate(BUCKETS_MS) if total_ms <= bound), len(BUCKETS_MS))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += total_ms
+        self.max_ms = max(self.max_ms, total_ms)
+        self.sql_ms += stats.sql_seconds * 1000
+        self.queries += stats.queries
+        if stats.slowest_seconds * 1000 >= self.slowest_ms:
+            self.slowest_ms = stats.slowest_seconds * 1000
+            self.slowest_sql = stats.slowest_sql
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 2) if self.count else 0,
+            'max_ms': round(self.max_ms, 2),
+            'mean_sql_ms': round(self.sql_ms / self.count, 2) if self.count else 0,
+            'mean_queries': round(self.queries / self.count, 2) if self.count else 0,
+            'slowest_statement_ms': round(self.slowest_ms, 2),
+            'slowest_statement': _shorten(self.slowest_sql),
+            'buckets': list(self.buckets),  # counts per BUCKETS_MS bound, then the overflow
+        }
+
+
+def _shorten(sql):
+    if sql is None:
+        return None
+    sql = ' '.join(str(sql).split())
+    return sql if len(sql) <= SLOWEST_SQL_CHARS else sql[:SLOWEST_SQL_CHARS] + '...'
+
+
+def _on_query(sql, params, seconds, backend_name, raw_connection, error):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats.record(sql, seconds)
+
+
+# =====================================================================
+# FLASK HOOKS
+# =====================================================================
+
+def _start_request():
+    _local.stats = g.profile_stats = RequestStats()
+
+
+def _finish_request(response):
+    stats = g.pop('profile_stats', None)
+    _local.stats = None
+    if stats is None:
+        return response
+    total_ms = (time.perf_counter() - stats.started) * 1000
+    sql_ms = stats.sql_seconds * 1000
+    python_ms = max(0.0, total_ms - sql_ms)
+    route = f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}"
+    response.headers.add('Server-Timing', f'db;desc="{stats.queries} queries";dur={sql_ms:.1f}')
+    response.headers.add('Server-Timing', f'app;dur={python_ms:.1f}')
+    response.headers.add('Server-Timing', f'total;dur={total_ms:.1f}')
+    with _routes_lock:
+        _routes.setdefault(route, RouteHistogram()).add(total_ms, stats)
+    logger.info(json.dumps({
+        'event': 'request',
+        'route': route,
+        'path': request.path,
+        'status': response.status_code,
+        'total_ms': round(total_ms, 2),
+        'sql_ms': round(sql_ms, 2),
+        'python_ms': round(python_ms, 2),
+        'queries': stats.queries,
+        'slowest_ms': round(stats.slowest_seconds * 1000, 2),
+        'slowest_sql': _shorten(stats.slowest_sql),
+    }, ensure_ascii=False))
+    return response
+
+
+def _clear_request(exc=None):
+    _local.stats = None
+
+
+def snapshot():
+    """{route: histogram dict}, slowest mean first."""
+    with _routes_lock:
+        routes = {route: hist.to_dict() for route, hist in _routes.items()}
+    return dict(sorted(routes.items(), key=lambda item: item[1]['mean_ms'], reverse=True))
+
+
+def reset():
+    with _routes_lock:
+        _routes.clear()
+
+
+def admin_profile():
+    if session.get('user_type') != 'admin':
+        return jsonify({'error': 'Admin login required'}), 403
+    if request.method == 'DELETE':
+        reset()
+        return jsonify({'success': True})
+    return jsonify({'buckets_ms': list(BUCKETS_MS), 'routes': snapshot()})
+
+
+def install(app):
+    """Hooks the profiler into app and starts timing statements."""
+    if _on_query not in db_backend.QUERY_LISTENERS:
+        db_backend.QUERY_LISTENERS.append(_on_query)
+    db_backend.forward_sqlalchemy_queries()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_clear_request)
+    app.add_url_rule('/admin/profile', 'admin_profile', admin_profile, methods=['GET', 'DELETE'])
+    if logger.level == logging.NOTSET:
+        logger.setLevel(logging.INFO)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+        logger.addHandler(handler)
@@ -0,0 +1,142 @@
+# rotate_keys.py
+# Re-encrypts PII columns under the primary key of the keyring (encryption_utils.KEYRING).
+#
+# Steps for a rotation:
+#   1. Generate a new key:   python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+#   2. Put it FIRST in MFI_ENCRYPTION_KEYS, keep the old one after it:  k2:<new>,k1:<old>
+#   3. Restart the apps (new rows are now written with k2, old rows still decrypt with k1)
+#   4. Run:  python rotate_keys.py            (safe to stop with Ctrl+C and run again)
+#   5. When it reports 0 remaining, remove k1 from MFI_ENCRYPTION_KEYS.
+#
+# Each chunk is its own short transaction followed by a pause, so collection/payment writes
+# are never waiting on one long table-wide lock.
+
+import argparse
+import json
+import os
+import re
+import time
+
+from cryptography.fernet import InvalidToken
+from sqlalchemy import or_, update, func
+
+from database import SessionLocal, Customer, upgrade_schema
+from encryption_utils import PRIMARY_KEY_ID, encrypt_data, rotate_data
+
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_PAUSE_SECONDS = 0.05
+STATE_FILE = 'key_rotation_state.json'
+
+# (model, encrypted column, key-id column) -- add new PII columns here
+ROTATION_TARGETS = [
+    (Customer, 'aadhaar_encrypted', 'aadhaar_key_id'),
+]
+
+
+def _load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_state(state):
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def _rotate_value(value, key_id):
+    """Returns the value encrypted under the primary key (legacy plaintext digits get encrypted)."""
+    if re.fullmatch(r'[\d\s-]{12,14}', value):
+        # Early desktop builds stored Aadhaar unencrypted
+        return encrypt_data(value)
+    return rotate_data(value, key_id)
+
+
+def rotate_column(session, model, value_attr, key_id_attr, state,
+                  chunk_size=DEFAULT_CHUNK_SIZE, pause=DEFAULT_PAUSE_SECONDS):
+    """
+    Rotates one column in id order. state[<table>.<column>] keeps the last processed id so an
+    interrupted run resumes where it stopped; rows already on the primary key are filtered out anyway.
+    """
+    value_col = getattr(model, value_attr)
+    key_id_col = getattr(model, key_id_attr)
+    state_key = f"{model.__tablename__}.{value_attr}"
+    progress = state.setdefault(state_key, {'last_id': 0, 'rotated': 0, 'failed': 0})
+
+    pending_filter = [
+        value_col.isnot(None),
+        value_col != '',
+        or_(key_id_col.is_(None), key_id_col != PRIMARY_KEY_ID),
+    ]
+    remaining = session.query(func.count(model.id)).filter(model.id > progress['last_id'], *pending_filter).scalar()
+    print(f"{state_key}: {remaining} rows to rotate to key '{PRIMARY_KEY_ID}'")
+
+    started = time.perf_counter()
+    done = 0
+    while True:
+        rows = session.query(model.id, value_col, key_id_col).filter(
+            model.id > progress['last_id'], *pending_filter
+        ).order_by(model.id).limit(chunk_size).all()
+        if not rows:
+            break
+
+        updates = []
+        for row_id, value, key_id in rows:
+            try:
+                updates.append({
+                    'id': row_id,
+                    value_attr: _rotate_value(value, key_id),
+                    key_id_attr: PRIMARY_KEY_ID,
+                })
+            except InvalidToken:
+                progress['failed'] += 1
+                print(f"  ID {row_id}: no key in the keyring decrypts this value; skipped")
+
+        if updates:
+            session.execute(update(model), updates)
+        session.commit()  # short transaction per chunk
+
+        progress['last_id'] = rows[-1][0]
+        progress['rotated'] += len(updates)
+        _save_state(state)
+
+        done += len(rows)
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (remaining - done) / rate if rate else 0.0
+        print(f"  {done}/{remaining} rows ({rate:,.0f} rows/s, ETA {eta:,.0f}s)")
+
+        if pause:
+            time.sleep(pause)  # let live writers take the lock between chunks
+
+    return progress
+
+
+def run_rotation(chunk_size=DEFAULT_CHUNK_SIZE, pause=DEFAULT_PAUSE_SECONDS, restart=False):
+    state = {} if restart else _load_state()
+    if state.get('target_key_id') != PRIMARY_KEY_ID:
+        # A new rotation target: start over
+        state = {'target_key_id': PRIMARY_KEY_ID}
+
+    session = SessionLocal()
+    try:
+        for model, value_attr, key_id_attr in ROTATION_TARGETS:
+            progress = rotate_column(session, model, value_attr, key_id_attr, state, chunk_size, pause)
+            print(f"✅ {model.__tablename__}.{value_attr}: rotated={progress['rotated']} failed={progress['failed']}")
+    finally:
+        session.close()
+    return state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Re-encrypt PII columns under the primary keyring key.")
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per transaction")
+    parser.add_argument('--pause', type=float, default=DEFAULT_PAUSE_SECONDS, help="Seconds to sleep between chunks")
+    parser.add_argument('--restart', action='store_true', help="Ignore saved progress and scan from the first row")
+    args = parser.parse_args()
+
+    upgrade_schema()
+    run_rotation(chunk_size=args.chunk, pause=args.pause, restart=args.restart)
@@ -0,0 +1,266 @@
+# slow_query_log.py
+# Slow-query log for every database path: app.py (db_backend), db_functions.py (plain sqlite3) and
+# the SQLAlchemy modules (database.py engines).
+#
+#   SLOW_QUERY_MS=250                     # threshold in milliseconds (0 turns the log off)
+#   SLOW_QUERY_LOG=slow_queries.log       # rotating JSON-lines file (5 MB x 5 backups by default)
+#
+#   python slow_query_log.py summary                     # top offenders by total time
+#   python slow_query_log.py summary --top 10 --since 2026-10-01 --plans
+#
+# Each statement slower than the threshold is written as one JSON line: normalized text (literals and
+# IN-lists folded, so the same query groups together), the statement as run, the shape of the bound
+# parameters (types and lengths - never the values, members' Aadhaar/PAN/phone pass through here),
+# where it ran (request path or thread) and its EXPLAIN QUERY PLAN (Postgres: EXPLAIN). The plan is
+# captured once per normalized statement every PLAN_EVERY_SECONDS, so a burst of slow queries
+# doesn't run EXPLAIN for each. Each gunicorn worker appends to the same file; rotation is per
+# process, so point SLOW_QUERY_LOG at a per-worker name if the file grows fast.
+
+import argparse
+import datetime as dt
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import db_backend
+
+THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_MS', 250))
+LOG_PATH = os.environ.get('SLOW_QUERY_LOG', 'slow_queries.log')
+LOG_MAX_BYTES = int(os.environ.get('SLOW_QUERY_LOG_BYTES', 5 * 1024 * 1024))
+LOG_BACKUPS = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', 5))
+PLAN_EVERY_SECONDS = 60
+MAX_SQL_CHARS = 2000
+
+logger = logging.getLogger('finvestacore.slow_query')
+
+_plan_seen = {}
+_plan_lock = threading.Lock()
+_installed = False
+
+
+# =====================================================================
+# NORMALIZATION
+# =====================================================================
+
+_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDERS = re.compile(r'%\(\w+\)s|%s|:\w+|\?')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_VALUES_LIST = re.compile(r'\bVALUES\s*\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """The statement with literals/placeholders as '?' and IN / VALUES lists folded, on one line."""
+    sql = _COMMENTS.sub(' ', str(sql))
+    sql = _STRINGS.sub('?', sql)
+    sql = _NUMBERS.sub('?', sql)
+    sql = _PLACEHOLDERS.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _VALUES_LIST.sub('VALUES (...)', sql)
+    return ' '.join(sql.split())
+
+
+def _shape(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+
+def param_shapes(params):
+    """Types (and lengths for text) of the bound parameters; 'executemany' when there are many rows."""
+    if params is None:
+        return 'executemany'
+    if isinstance(params, dict):
+        return {name: _shape(value) for name, value in params.items()}
+    return [_shape(value) for value in params]
+
+
+# =====================================================================
+# PLAN CAPTURE
+# =====================================================================
+
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+def explain(sql, params, backend_name, raw_connection):
+    """EXPLAIN QUERY PLAN (SQLite) / EXPLAIN (Postgres) lines for the statement; the statement itself isn't run."""
+    if params is None or not _EXPLAINABLE.match(sql):
+        return None  # executemany (no single row of parameters to plan with), DDL, PRAGMA
+    if backend_name == 'sqlite':
+        cursor = sqlite3.Cursor(raw_connection)  # a plain cursor: an instrumented one would report EXPLAIN too
+        try:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    if backend_name == 'postgres':
+        cursor = raw_connection.cursor()
+        try:
+            # Savepoint: an EXPLAIN error must not abort the caller's transaction
+            cursor.execute("SAVEPOINT slow_query_plan")
+            try:
+                cursor.execute(f"EXPLAIN {sql}", params or None)
+                plan = [row[0] for row in cursor.fetchall()]
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_plan")
+                raise
+            cursor.execute("RELEASE SAVEPOINT slow_query_plan")
+            return plan
+        finally:
+            cursor.close()
+    return None
+
+
+def _plan_due(fingerprint):
+    now = time.monotonic()
+    with _plan_lock:
+        if now - _plan_seen.get(fingerprint, -PLAN_EVERY_SECONDS) < PLAN_EVERY_SECONDS:
+            return False
+        _plan_seen[fingerprint] = now
+        return True
+
+
+def _where():
+    try:
+        from flask import has_request_context, request
+        if has_request_context():
+            return f"{request.method} {request.path}"
+    except ImportError:
+        pass
+    return threading.current_thread().name
+
+
+# =====================================================================
+# LISTENER
+# =====================================================================
+
+def _on_query(sql, params, seconds, backend_name, raw_connection, error):
+    ms = seconds * 1000
+    if ms < THRESHOLD_MS:
+        return
+    fingerprint = normalize_sql(sql)
+    record = {
+        'ts': dt.datetime.now().isoformat(timespec='milliseconds'),
+        'ms': round(ms, 2),
+        'backend': backend_name,
+        'normalized': fingerprint,
+        'sql': ' '.join(str(sql).split())[:MAX_SQL_CHARS],
+        'params': param_shapes(params),
+        'where': _where(),
+        'pid': os.getpid(),
+    }
+    if error is not None:
+        record['error'] = str(error)  # e.g. 'database is locked' after the whole busy timeout
+    if raw_connection is not None and _plan_due(fingerprint):
+        try:
+            record['plan'] = explain(sql, params, backend_name, raw_connection)
+        except Exception as e:
+            record['plan_error'] = str(e)
+    logger.warning(json.dumps(record, ensure_ascii=False))
+
+
+def install():
+    """Starts logging slow statements (idempotent; does nothing when SLOW_QUERY_MS is 0)."""
+    global _installed
+    if _installed or THRESHOLD_MS <= 0:
+        return
+    if not logger.handlers:
+        handler = logging.handlers.RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                                       encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+        logger.propagate = False
+    db_backend.QUERY_LISTENERS.append(_on_query)
+    db_backend.forward_sqlalchemy_queries()
+    _installed = True
+
+
+# =====================================================================
+# SUMMARY CLI
+# =====================================================================
+
+def read_records(path=LOG_PATH, since=None):
+    """Records from the log and its rotated backups (oldest file first)."""
+    backups = sorted(glob.glob(f"{glob.escape(path)}.*"),
+                     key=lambda name: int(name.rsplit('.', 1)[1]) if name.rsplit('.', 1)[1].isdigit() else 0,
+                     reverse=True)
+    for name in backups + [path]:
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if since and record.get('ts', '') < since:
+                    continue
+                yield record
+
+
+def summarize(records, top=20):
+    """Top normalized statements by total time: count, total/mean/max ms, where, latest plan."""
+    groups = {}
+    for record in records:
+        group = groups.setdefault(record['normalized'], {
+            'normalized': record['normalized'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'last_seen': '', 'where': {}, 'plan': None, 'slowest_sql': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += record['ms']
+        if record['ms'] >= group['max_ms']:
+            group['max_ms'] = record['ms']
+            group['slowest_sql'] = record['sql']
+        group['last_seen'] = max(group['last_seen'], record.get('ts', ''))
+        group['where'][record.get('where')] = group['where'].get(record.get('where'), 0) + 1
+        if record.get('plan'):
+            group['plan'] = record['plan']
+    ranked = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)[:top]
+    for group in ranked:
+        group['total_ms'] = round(group['total_ms'], 2)
+        group['mean_ms'] = round(group['total_ms'] / group['count'], 2)
+        group['where'] = sorted(group['where'], key=group['where'].get, reverse=True)[:3]
+    return ranked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the slow-query log.")
+    parser.add_argument('command', choices=['summary'])
+    parser.add_argument('--log', default=LOG_PATH)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--since', help="only records at or after this ISO date/time")
+    parser.add_argument('--plans', action='store_true', help="print the captured plan under each statement")
+    parser.add_argument('--json', action='store_true', help="machine-readable output")
+    args = parser.parse_args()
+
+    ranked = summarize(read_records(args.log, args.since), args.top)
+    if args.json:
+        print(json.dumps(ranked, indent=2, ensure_ascii=False))
+        return 0
+    if not ranked:
+        print(f"No slow queries in {args.log}")
+        return 0
+    print(f"{'#':>3} {'count':>6} {'total ms':>11} {'mean ms':>9} {'max ms':>9}  statement")
+    for rank, group in enumerate(ranked, 1):
+        print(f"{rank:>3} {group['count']:>6} {group['total_ms']:>11.1f} {group['mean_ms']:>9.1f} "
+              f"{group['max_ms']:>9.1f}  {group['normalized'][:120]}")
+        print(f"{'':>43}where: {', '.join(str(w) for w in group['where'])}  last: {group['last_seen']}")
+        if args.plans and group['plan']:
+            for line in group['plan']:
+                print(f"{'':>45}{line}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
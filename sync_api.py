@@ -1,27 +1,130 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, insert, update, func, type_coerce, String
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
+import functools
 import json
+import os
+import time
+import zlib
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 
 # Import Database and Models (assuming they are set up correctly)
-from database import SessionLocal, LoanAccount, AmortizationSchedule, CollectionTransaction
-from accounting_logic import post_collection_to_gl # Required for collection posting
+from database import (
+    engine, SessionLocal, LoanAccount, AmortizationSchedule, CollectionTransaction, GeneralLedger, SyncTombstone, SyncDevice,
+    current_change_seq, reserve_change_seq
+)
+from accounting_logic import allocate_amount, collection_gl_rows # Required for collection posting
+
+# --- DB EXECUTOR ---
+# Endpoints are async; every piece of DB work runs on a small dedicated thread pool instead of
+# the event loop (or Starlette's shared pool). At most DB_MAX_PENDING units of DB work may be
+# running or queued; beyond that a request waits up to DB_QUEUE_TIMEOUT seconds for a slot and
+# then gets 503 + Retry-After, so a burst of collectors degrades into retries, not timeouts.
+# Streamed downloads keep a DB connection open between chunks, so they are limited separately
+# (DB_MAX_STREAMS); DB_WORKERS + DB_MAX_STREAMS must stay within the engine's connection pool.
+DB_WORKERS = int(os.environ.get('MFI_SYNC_DB_WORKERS', '4'))
+DB_MAX_PENDING = int(os.environ.get('MFI_SYNC_DB_MAX_PENDING', '64'))
+DB_MAX_STREAMS = int(os.environ.get('MFI_SYNC_DB_MAX_STREAMS', '8'))
+DB_QUEUE_TIMEOUT = float(os.environ.get('MFI_SYNC_DB_QUEUE_TIMEOUT', '2.0'))
+
+class DbRunner:
+    """Bounded executor for blocking DB calls (each call opens and closes its own Session)."""
+    def __init__(self, workers=DB_WORKERS, max_pending=DB_MAX_PENDING, max_streams=DB_MAX_STREAMS,
+                 queue_timeout=DB_QUEUE_TIMEOUT):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sync-db')
+        self.slots = asyncio.Semaphore(max_pending)
+        self.streams = asyncio.Semaphore(max_streams)
+        self.queue_timeout = queue_timeout
+        self.rejected = 0
+
+    async def _acquire(self, semaphore):
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Sync server busy, retry shortly",
+                                headers={"Retry-After": "2"})
+
+    async def run(self, fn, *args):
+        """Runs fn(*args) on the DB pool once a slot is free."""
+        await self._acquire(self.slots)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args))
+        finally:
+            self.slots.release()
+
+    async def open_stream(self, iterator):
+        """
+        Reserves a stream slot (503 when none frees up in time) and returns an async iterator
+        over the blocking generator; each next() runs on the DB pool.
+        """
+        await self._acquire(self.streams)
+        return self._iterate(iterator)
+
+    async def _iterate(self, iterator):
+        loop = asyncio.get_running_loop()
+        done = object()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, iterator, done)
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            # Closes the generator (and its Session) on the DB thread, also on client disconnect
+            await loop.run_in_executor(self.executor, iterator.close)
+            self.streams.release()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.db = DbRunner()
+    try:
+        yield
+    finally:
+        app.state.db.shutdown()
+        engine.dispose()
+
+def get_db_runner(request: Request) -> DbRunner:
+    return request.app.state.db
 
 app = FastAPI(
     title="MFI Local Sync API", 
-    description="Secure local API for syncing collections with the desktop LMS."
+    description="Secure local API for syncing collections with the desktop LMS.",
+    lifespan=lifespan
 )
 
 # Pydantic Schemas for Data Transfer (What mobile sends/receives)
 
 class ScheduleItem(BaseModel):
     """Schema for a single schedule item to be sent to mobile."""
+    schedule_id: int
     loan_id: int
     installment_number: int
     due_date: dt.date
     total_emi: float
     paid_status: bool
+
+class RemovedItem(BaseModel):
+    """A loan or schedule row the device should drop (deleted, closed, or reassigned)."""
+    entity: str # 'loan' or 'schedule'
+    entity_id: int
+    loan_id: Optional[int] = None
+
+class ScheduleSyncResponse(BaseModel):
+    """Schedule download. Send `cursor` back as `since` on the next sync to get only changes."""
+    cursor: int
+    full: bool # True: replace the local copy; False: apply items/removed on top of it
+    items: List[ScheduleItem]
+    removed: List[RemovedItem] = []
     
 class CollectionIn(BaseModel):
     """Schema for a single collection entry received from mobile."""
@@ -31,86 +134,471 @@ class CollectionIn(BaseModel):
     # Optional: collector_id, collection_center
     
 # --- 1. DOWNLOAD Endpoint (Pushing Schedules to Mobile) ---
-@app.get("/sync/loan_schedules", response_model=List[ScheduleItem])
-def get_active_schedules():
-    """Fetches all UNPAID schedule items for active loans."""
-    session = SessionLocal()
-    try:
-        # Fetch only the schedule items that are NOT paid yet
-        schedules = session.query(AmortizationSchedule).join(LoanAccount).filter(
+# The body is streamed: rows come off the DB cursor in batches of STREAM_BATCH_ROWS, are encoded
+# straight to JSON text and (optionally) compressed chunk by chunk, so server memory stays flat
+# no matter how big the book is. ScheduleSyncResponse documents the JSON shape.
+STREAM_BATCH_ROWS = 2000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+_json = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+def _loan_scope(query, collector_id, branch_id):
+    """Restricts a query (already joined to LoanAccount) to one collector's / branch's loans."""
+    if collector_id:
+        query = query.filter(LoanAccount.collector_id == collector_id)
+    if branch_id:
+        query = query.filter(LoanAccount.branch_id == branch_id)
+    return query
+
+def _schedule_json(row):
+    """One schedule row as ScheduleItem JSON (formatted directly: no Pydantic object or dict per row)."""
+    schedule_id, loan_id, installment_number, due_date, total_emi, paid_status = row
+    if due_date is None:
+        due_date = 'null'
+    else:
+        due_date = '"%s"' % (due_date if isinstance(due_date, str) else due_date.isoformat())
+    # repr() of a finite float is valid JSON and is what json.dumps would write
+    total_emi = 'null' if total_emi is None else repr(float(total_emi))
+    return (
+        f'{{"schedule_id":{schedule_id},"loan_id":{loan_id},"installment_number":{installment_number},'
+        f'"due_date":{due_date},"total_emi":{total_emi},"paid_status":{"true" if paid_status else "false"}}}'
+    )
+
+def _removed_json(entity, entity_id, loan_id):
+    return _json.encode({'entity': entity, 'entity_id': entity_id, 'loan_id': loan_id})
+
+SCHEDULE_COLUMNS = (
+    AmortizationSchedule.id, AmortizationSchedule.loan_account_id, AmortizationSchedule.installment_number,
+    AmortizationSchedule.due_date, AmortizationSchedule.total_emi, AmortizationSchedule.paid_status
+)
+
+def _full_rows(session, collector_id, branch_id):
+    """All UNPAID schedule items for active loans, streamed from the cursor."""
+    # due_date is read as the stored 'YYYY-MM-DD' text on SQLite (skips a str -> date -> str round trip per row)
+    columns = SCHEDULE_COLUMNS[:3] + (type_coerce(AmortizationSchedule.due_date, String).label('due_date'),) + SCHEDULE_COLUMNS[4:]
+    query = _loan_scope(
+        select(*columns).select_from(AmortizationSchedule).join(LoanAccount).where(
             LoanAccount.status == 'ACTIVE',
             AmortizationSchedule.paid_status == False
-        ).all()
-        
-        # Format the data according to the Pydantic schema
-        data_to_sync = []
-        for item in schedules:
-            data_to_sync.append(ScheduleItem(
-                loan_id=item.loan_account_id,
-                installment_number=item.installment_number,
-                due_date=item.due_date,
-                total_emi=item.total_emi,
-                paid_status=item.paid_status
-            ))
-        
-        return data_to_sync
-        
+        ),
+        collector_id, branch_id
+    )
+    # Core select (plain Row tuples) is noticeably cheaper per row than an ORM Query here
+    return session.execute(
+        query.order_by(AmortizationSchedule.loan_account_id, AmortizationSchedule.installment_number)
+        .execution_options(yield_per=STREAM_BATCH_ROWS)
+    )
+
+def _delta_rows(session, since, collector_id, branch_id):
+    """
+    Rows changed after `since` plus removals. Bounded by the day's changes, so these
+    are collected in memory (keyed by id to drop duplicates) before streaming.
+    """
+    active_rows = _loan_scope(
+        session.query(*SCHEDULE_COLUMNS).join(LoanAccount).filter(LoanAccount.status == 'ACTIVE'),
+        collector_id, branch_id
+    )
+
+    # Rows that changed themselves (paid ones included, so the device can drop them)
+    changed = {r.id: r for r in active_rows.filter(AmortizationSchedule.change_seq > since)}
+
+    # Loans that changed (re-assigned, re-activated, ...): resend their open installments
+    changed_loan_ids = [loan_id for (loan_id,) in _loan_scope(
+        session.query(LoanAccount.id).filter(LoanAccount.change_seq > since, LoanAccount.status == 'ACTIVE'),
+        collector_id, branch_id
+    )]
+    if changed_loan_ids:
+        for r in active_rows.filter(
+            AmortizationSchedule.loan_account_id.in_(changed_loan_ids),
+            AmortizationSchedule.paid_status == False
+        ):
+            changed.setdefault(r.id, r)
+
+    # Removals: tombstones, plus loans that stopped being ACTIVE
+    removed = []
+    tombstones = session.query(SyncTombstone.entity, SyncTombstone.entity_id, SyncTombstone.loan_account_id).filter(
+        SyncTombstone.change_seq > since
+    )
+    if collector_id:
+        tombstones = tombstones.filter(
+            (SyncTombstone.collector_id == collector_id) | (SyncTombstone.collector_id.is_(None))
+        )
+    if branch_id:
+        tombstones = tombstones.filter(
+            (SyncTombstone.branch_id == branch_id) | (SyncTombstone.branch_id.is_(None))
+        )
+    removed.extend(tuple(t) for t in tombstones)
+
+    closed_loans = _loan_scope(
+        session.query(LoanAccount.id).filter(LoanAccount.change_seq > since, LoanAccount.status != 'ACTIVE'),
+        collector_id, branch_id
+    )
+    removed.extend(('loan', loan_id, loan_id) for (loan_id,) in closed_loans)
+
+    return [changed[key] for key in sorted(changed)], removed
+
+def _encode_json(cursor, full, rows, removed):
+    """Yields the ScheduleSyncResponse JSON document in pieces."""
+    yield f'{{"cursor":{cursor},"full":{"true" if full else "false"},"items":['
+    first = True
+    for row in rows:
+        yield ('' if first else ',') + _schedule_json(row)
+        first = False
+    yield '],"removed":[' + ','.join(_removed_json(*r) for r in removed) + ']}'
+
+def _encode_ndjson(cursor, full, rows, removed):
+    """Header line {"cursor","full"}, one line per ScheduleItem, then one {"removed":{...}} line per removal."""
+    yield _json.encode({'cursor': cursor, 'full': full}) + '\n'
+    for row in rows:
+        yield _schedule_json(row) + '\n'
+    for r in removed:
+        yield '{"removed":' + _removed_json(*r) + '}\n'
+
+def _batched(pieces, batch_bytes=64 * 1024):
+    """Joins small text pieces into ~64 KB byte chunks (one write per chunk, not per row)."""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= batch_bytes:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+def _pick_encoding(accept_encoding: str):
+    """'gzip', 'deflate' or None from an Accept-Encoding header (q=0 means refused)."""
+    offered = {}
+    for part in (accept_encoding or '').lower().split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip()] = q
+    for name in ('gzip', 'deflate'):
+        if offered.get(name, offered.get('*', 0.0)) > 0:
+            return name
+    return None
+
+def _compressed(chunks, encoding):
+    if not encoding:
+        yield from chunks
+        return
+    # wbits 31 = gzip container, 15 = zlib container (what HTTP calls "deflate")
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31 if encoding == 'gzip' else 15)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+def stream_schedules(cursor, since=None, collector_id=None, branch_id=None, fmt='json', encoding=None):
+    """Generator of response body bytes. Opens (and always closes) its own session."""
+    session = SessionLocal()
+    try:
+        if since:
+            rows, removed = _delta_rows(session, since, collector_id, branch_id)
+        else:
+            rows, removed = _full_rows(session, collector_id, branch_id), []
+        encoder = _encode_ndjson if fmt == 'ndjson' else _encode_json
+        yield from _compressed(_batched(encoder(cursor, not since, rows, removed)), encoding)
+    finally:
+        session.close()
+
+def _read_cursor():
+    session = SessionLocal()
+    try:
+        return current_change_seq(session)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error during sync: {e}")
     finally:
         session.close()
 
+@app.get("/sync/loan_schedules", response_model=ScheduleSyncResponse)
+async def get_active_schedules(request: Request, since: Optional[int] = None, collector_id: Optional[str] = None,
+                               branch_id: Optional[str] = None, format: str = 'json',
+                               db: DbRunner = Depends(get_db_runner)):
+    """
+    Without `since`: all UNPAID schedule items for active loans (full download).
+    With `since=<cursor>`: only schedule rows changed after the cursor (paid ones included, so the
+    device can drop them), unpaid rows of loans that changed or were assigned to this collector,
+    and removals. Optional collector_id / branch_id restrict the book.
+
+    format=json (default, ScheduleSyncResponse) or ndjson; gzip/deflate per Accept-Encoding.
+    The new cursor is also sent in the X-Sync-Cursor header.
+    """
+    # Read the cursor FIRST: anything committed after this point has a higher
+    # change_seq and is picked up by the next sync (at worst sent twice, never skipped).
+    cursor = await db.run(_read_cursor)
+
+    fmt = 'ndjson' if format == 'ndjson' or NDJSON_MEDIA_TYPE in request.headers.get('accept', '') else 'json'
+    encoding = _pick_encoding(request.headers.get('accept-encoding'))
+    headers = {'X-Sync-Cursor': str(cursor), 'X-Sync-Full': 'false' if since else 'true', 'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    body = await db.open_stream(stream_schedules(cursor, since, collector_id, branch_id, fmt, encoding))
+    return StreamingResponse(
+        body,
+        media_type=NDJSON_MEDIA_TYPE if fmt == 'ndjson' else 'application/json',
+        headers=headers
+    )
+
 # --- 2. UPLOAD Endpoint (Pulling Collections from Mobile) ---
+# Set-based: every loan referenced by the batch is loaded in one query, the allocation runs in
+# memory (accounting_logic.allocate_amount), and transactions, GL lines and paid installments are
+# written with bulk statements in ONE transaction.
+
+class CollectionResult(BaseModel):
+    """Outcome of one uploaded collection (same order as the request)."""
+    index: int
+    loan_id: int
+    status: str # 'applied' or 'skipped'
+    reason: Optional[str] = None
+    principal_paid: float = 0.0
+    interest_paid: float = 0.0
+    excess: float = 0.0 # paid beyond outstanding principal + interest
+    installments_paid: int = 0
+
+def apply_collections(session, collections: List[CollectionIn]):
+    """
+    Allocates and writes a batch of collections in the caller's transaction (no commit).
+    Returns the per-item CollectionResult list, in request order.
+    """
+    results = [None] * len(collections)
+    loan_ids = {c.loan_id for c in collections}
+    if not loan_ids:
+        return []
+
+    # 1. Prefetch: loans, collection totals and installment totals -- one query each
+    loans = {row.id: row for row in session.query(
+        LoanAccount.id, LoanAccount.annual_interest_rate, LoanAccount.principal_amount, LoanAccount.disbursement_date
+    ).filter(LoanAccount.id.in_(loan_ids))}
+    paid_so_far = {loan_id: (principal or 0.0, amount or 0.0, last_date) for loan_id, principal, amount, last_date in session.query(
+        CollectionTransaction.loan_account_id,
+        func.sum(CollectionTransaction.principal_paid),
+        func.sum(CollectionTransaction.amount_paid),
+        func.max(CollectionTransaction.payment_date)
+    ).filter(CollectionTransaction.loan_account_id.in_(loans.keys())).group_by(CollectionTransaction.loan_account_id)}
+    emi_settled = dict(session.query(
+        AmortizationSchedule.loan_account_id, func.sum(AmortizationSchedule.total_emi)
+    ).filter(
+        AmortizationSchedule.loan_account_id.in_(loans.keys()),
+        AmortizationSchedule.paid_status == True
+    ).group_by(AmortizationSchedule.loan_account_id).all())
+
+    # Open installments in due order, per loan: [id, total_emi]
+    open_installments = {loan_id: [] for loan_id in loans}
+    for sched_id, loan_id, total_emi in session.query(
+        AmortizationSchedule.id, AmortizationSchedule.loan_account_id, AmortizationSchedule.total_emi
+    ).filter(
+        AmortizationSchedule.loan_account_id.in_(loans.keys()),
+        AmortizationSchedule.paid_status == False
+    ).order_by(AmortizationSchedule.loan_account_id, AmortizationSchedule.installment_number):
+        open_installments[loan_id].append((sched_id, total_emi or 0.0))
+
+    # Running per-loan state so several payments for one loan in a batch allocate in date order
+    state = {}
+    for loan_id, loan in loans.items():
+        principal_paid, amount_paid, last_date = paid_so_far.get(loan_id, (0.0, 0.0, None))
+        if isinstance(last_date, dt.datetime):
+            last_date = last_date.date()
+        state[loan_id] = {
+            'outstanding': (loan.principal_amount or 0.0) - principal_paid,
+            'last_date': last_date or loan.disbursement_date,
+            'rate': loan.annual_interest_rate,
+            # Collected but not yet matched to a whole installment (partial payments carry over)
+            'credit': max(0.0, amount_paid - (emi_settled.get(loan_id) or 0.0)),
+            'next_installment': 0,
+        }
+
+    # 2. Allocate in memory
+    tx_rows, gl_rows, paid_schedule_ids = [], [], []
+    tx_date = dt.datetime.now()
+    order = sorted(range(len(collections)), key=lambda i: (collections[i].loan_id, collections[i].payment_date, i))
+    for i in order:
+        c = collections[i]
+        if c.loan_id not in loans:
+            results[i] = CollectionResult(index=i, loan_id=c.loan_id, status='skipped', reason='loan not found')
+            continue
+        if c.amount_paid <= 0:
+            results[i] = CollectionResult(index=i, loan_id=c.loan_id, status='skipped', reason='amount must be positive')
+            continue
+
+        loan_state = state[c.loan_id]
+        principal, interest, excess = allocate_amount(
+            c.amount_paid, loan_state['outstanding'], loan_state['rate'], loan_state['last_date'], c.payment_date
+        )
+        loan_state['outstanding'] -= principal
+        loan_state['last_date'] = max(loan_state['last_date'], c.payment_date) if loan_state['last_date'] else c.payment_date
+
+        # Mark installments paid (oldest first) while the collected amount covers them
+        loan_state['credit'] += c.amount_paid
+        installments = open_installments[c.loan_id]
+        marked = 0
+        while loan_state['next_installment'] < len(installments):
+            sched_id, total_emi = installments[loan_state['next_installment']]
+            if loan_state['credit'] + 0.005 < total_emi:
+                break
+            loan_state['credit'] -= total_emi
+            loan_state['next_installment'] += 1
+            paid_schedule_ids.append(sched_id)
+            marked += 1
+
+        tx_rows.append({
+            'loan_account_id': c.loan_id, 'amount_paid': c.amount_paid, 'payment_date': c.payment_date,
+            'principal_paid': principal, 'interest_paid': interest
+        })
+        gl_rows.extend(collection_gl_rows(c.loan_id, c.amount_paid, principal, interest, tx_date))
+        results[i] = CollectionResult(index=i, loan_id=c.loan_id, status='applied', principal_paid=principal,
+                                      interest_paid=interest, excess=excess, installments_paid=marked)
+
+    # 3. Bulk writes (executemany), no per-row flush
+    if tx_rows:
+        session.execute(insert(CollectionTransaction), tx_rows)
+        session.execute(insert(GeneralLedger), gl_rows)
+    if paid_schedule_ids:
+        # Bulk UPDATE bypasses the flush hook, so tag the rows for delta sync here
+        seq = reserve_change_seq(session)
+        session.execute(update(AmortizationSchedule), [
+            {'id': sched_id, 'paid_status': True, 'change_seq': seq} for sched_id in paid_schedule_ids
+        ])
+    return results
+
 @app.post("/sync/collections")
-def receive_collections(collections: List[CollectionIn]):
-    """Receives a list of collection transactions and posts them to the GL."""
+async def receive_collections(collections: List[CollectionIn], db: DbRunner = Depends(get_db_runner)):
+    """Receives a list of collection transactions, allocates them and posts them to the GL."""
+    return await db.run(_receive_collections, collections)
+
+def _receive_collections(collections: List[CollectionIn]):
     session = SessionLocal()
-    transactions_processed = 0
+    started = time.perf_counter()
     
     try:
-        for collection in collections:
-            # 1. Fetch Loan Details
-            loan = session.query(LoanAccount).filter(LoanAccount.id == collection.loan_id).first()
-            if not loan:
-                print(f"Loan ID {collection.loan_id} not found. Skipping transaction.")
-                continue
-
-            # 2. CRITICAL: Payment Allocation Logic (Needs full implementation)
-            # This is where you allocate: Amount Paid -> Interest Paid -> Principal Paid
-            # For this demo, we will use a simple allocation (e.g., 50/50 split)
-            
-            principal_allocated = round(collection.amount_paid / 2, 2) 
-            interest_allocated = round(collection.amount_paid / 2, 2)
-            
-            # 3. Create Collection Transaction
-            new_tx = CollectionTransaction(
-                loan_account_id=collection.loan_id,
-                amount_paid=collection.amount_paid,
-                payment_date=collection.payment_date,
-                principal_paid=principal_allocated,
-                interest_paid=interest_allocated
+        results = apply_collections(session, collections)
+        session.commit()
+        seconds = time.perf_counter() - started
+        applied = sum(1 for r in results if r.status == 'applied')
+        return {
+            "status": "success",
+            "message": f"{applied} transactions processed and posted to GL.",
+            "results": [r.model_dump() for r in results],
+            "stats": {
+                "received": len(collections),
+                "applied": applied,
+                "skipped": len(collections) - applied,
+                "seconds": round(seconds, 4),
+                "items_per_second": round(len(collections) / seconds, 1) if seconds > 0 else None
+            }
+        }
+
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(status_code=500, detail=f"Transaction processing failed: {e}")
+    finally:
+        session.close()
+
+
+# --- 3. CHUNKED UPLOAD (Resumable, per-device sequence numbers) ---
+# The device splits its day's collections into chunks numbered 1, 2, 3... per device_id and sends
+# them in order. Each chunk is applied in one transaction together with the device's ack, so a
+# chunk is either fully applied and acknowledged or not at all. A resent chunk (seq <= ack) is
+# answered from the ack without reprocessing; a chunk past the next expected seq gets 409 so the
+# device resumes from GET /sync/devices/{device_id}/ack.
+MAX_CHUNK_ITEMS = 500
+
+class CollectionChunk(BaseModel):
+    device_id: str
+    seq: int # 1-based, consecutive per device
+    collections: List[CollectionIn]
+
+def _device_ack(session, device_id):
+    return session.query(SyncDevice.last_seq).filter(SyncDevice.device_id == device_id).scalar()
+
+def _ensure_device(session, device_id):
+    if _device_ack(session, device_id) is not None:
+        return
+    try:
+        session.execute(insert(SyncDevice).values(device_id=device_id, last_seq=0, applied_items=0))
+        session.commit()
+    except IntegrityError:
+        session.rollback() # registered concurrently by another request
+
+@app.get("/sync/devices/{device_id}/ack")
+async def get_device_ack(device_id: str, db: DbRunner = Depends(get_db_runner)):
+    """Highest chunk sequence applied for this device (0 if none). Resume uploads from ack + 1."""
+    return await db.run(_get_device_ack, device_id)
+
+def _get_device_ack(device_id: str):
+    session = SessionLocal()
+    try:
+        return {"device_id": device_id, "ack": _device_ack(session, device_id) or 0}
+    finally:
+        session.close()
+
+@app.post("/sync/collections/chunk")
+async def receive_collection_chunk(chunk: CollectionChunk, db: DbRunner = Depends(get_db_runner)):
+    """Applies one numbered chunk of collections exactly once per device."""
+    if chunk.seq < 1:
+        raise HTTPException(status_code=422, detail="seq starts at 1")
+    if len(chunk.collections) > MAX_CHUNK_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_CHUNK_ITEMS} collections per chunk")
+    return await db.run(_receive_collection_chunk, chunk)
+
+def _receive_collection_chunk(chunk: CollectionChunk):
+    session = SessionLocal()
+    started = time.perf_counter()
+    try:
+        _ensure_device(session, chunk.device_id)
+
+        # Claim the sequence number first: this UPDATE is the dedupe check AND takes the write
+        # lock, so two concurrent sends of the same chunk cannot both apply it.
+        claimed = session.execute(
+            update(SyncDevice).where(
+                SyncDevice.device_id == chunk.device_id,
+                SyncDevice.last_seq == chunk.seq - 1
+            ).values(
+                last_seq=chunk.seq,
+                applied_items=SyncDevice.applied_items + len(chunk.collections),
+                last_seen_at=dt.datetime.now()
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+
+        if not claimed:
+            session.rollback()
+            ack = _device_ack(session, chunk.device_id) or 0
+            if chunk.seq <= ack:
+                # Replay of a chunk that already landed: acknowledge, don't reprocess
+                return {"status": "duplicate", "device_id": chunk.device_id, "seq": chunk.seq, "ack": ack}
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Out-of-order chunk", "expected_seq": ack + 1, "ack": ack}
             )
-            session.add(new_tx)
-            session.flush() # Get TX ID
-            
-            # 4. Post to General Ledger (Automatic Double-Entry)
-            post_collection_to_gl(session, new_tx, principal_allocated, interest_allocated)
-            
-            # 5. Update Amortization Schedule (Mark nearest installment as paid)
-            # Find the closest unpaid installment to the payment_date and mark it True
-            
-            # Placeholder for schedule update:
-            # schedule_item = session.query(AmortizationSchedule).filter(...).first()
-            # if schedule_item:
-            #     schedule_item.paid_status = True
-            
-            transactions_processed += 1
 
+        results = apply_collections(session, chunk.collections)
         session.commit()
-        return {"status": "success", "message": f"{transactions_processed} transactions processed and posted to GL."}
+        seconds = time.perf_counter() - started
+        applied = sum(1 for r in results if r.status == 'applied')
+        return {
+            "status": "success",
+            "device_id": chunk.device_id,
+            "seq": chunk.seq,
+            "ack": chunk.seq,
+            "results": [r.model_dump() for r in results],
+            "stats": {
+                "received": len(chunk.collections),
+                "applied": applied,
+                "skipped": len(chunk.collections) - applied,
+                "seconds": round(seconds, 4)
+            }
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
         session.rollback()
-        raise HTTPException(status_code=500, detail=f"Transaction processing failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Chunk processing failed: {e}")
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
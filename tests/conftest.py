@@ -0,0 +1,6 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database.py opens its engine at import; keep the tests off ./microfinance.db
+os.environ.setdefault('MFI_DATABASE_URL', 'sqlite://')
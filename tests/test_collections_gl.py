@@ -0,0 +1,56 @@
+import datetime as dt
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+import database
+from sync_api import CollectionIn, apply_collections
+
+
+@pytest.fixture
+def session():
+    engine = sa.create_engine('sqlite://')
+    database.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(database.Customer(id=1, full_name='Test'))
+    session.add(database.LoanAccount(id=1, customer_id=1, disbursement_date=dt.date(2026, 1, 1),
+                                     principal_amount=1000.0, annual_interest_rate=0.24, tenure_months=10))
+    session.commit()
+    yield session
+    session.close()
+
+
+def _totals(session):
+    """(total debit, total credit) over the whole ledger, to the paisa."""
+    return session.query(sa.func.round(sa.func.sum(database.GeneralLedger.debit), 2),
+                         sa.func.round(sa.func.sum(database.GeneralLedger.credit), 2)).one()
+
+
+def test_overpaying_batch_balances(session):
+    results = apply_collections(session, [
+        CollectionIn(loan_id=1, amount_paid=1500.0, payment_date=dt.date(2026, 2, 1)),
+        CollectionIn(loan_id=1, amount_paid=200.0, payment_date=dt.date(2026, 2, 10)),
+        CollectionIn(loan_id=1, amount_paid=333.33, payment_date=dt.date(2026, 2, 11)),
+    ])
+    session.commit()
+    assert [r.status for r in results] == ['applied'] * 3
+    assert results[0].excess > 0
+    debit, credit = _totals(session)
+    assert debit == pytest.approx(2033.33)
+    assert credit == pytest.approx(debit)
+    advance = session.query(sa.func.sum(database.GeneralLedger.credit)).filter(
+        database.GeneralLedger.account_head == 'Customer Advance A/C').scalar()
+    assert advance == pytest.approx(sum(r.excess for r in results))
+
+
+def test_partial_payments_balance(session):
+    apply_collections(session, [
+        CollectionIn(loan_id=1, amount_paid=amount, payment_date=dt.date(2026, 1, 1) + dt.timedelta(days=day))
+        for day, amount in enumerate((101.37, 99.99, 250.01, 3.0, 77.77), start=7)
+    ])
+    session.commit()
+    debit, credit = _totals(session)
+    assert credit == pytest.approx(debit)
+    assert session.query(database.GeneralLedger).filter(
+        database.GeneralLedger.account_head == 'Customer Advance A/C').count() == 0
@@ -0,0 +1,175 @@
+import os
+import re
+import sqlite3
+
+import pytest
+import sqlalchemy as sa
+
+import db_backend
+from db_backend import psycopg2
+
+
+@pytest.fixture
+def recorded():
+    calls = []
+
+    def listener(sql, params, seconds, backend_name, raw_connection, error):
+        calls.append((sql, error))
+
+    db_backend.QUERY_LISTENERS.append(listener)
+    db_backend.forward_sqlalchemy_queries()
+    yield calls
+    db_backend.QUERY_LISTENERS.remove(listener)
+
+
+def test_sqlalchemy_failure_raises_original_error(recorded):
+    engine = sa.create_engine('sqlite://')
+    with engine.connect() as conn:
+        with pytest.raises(sa.exc.OperationalError, match='no such table'):
+            conn.execute(sa.text('SELECT * FROM nope'))
+    assert recorded[-1][0] == 'SELECT * FROM nope'
+    assert isinstance(recorded[-1][1], sqlite3.OperationalError)
+
+
+def test_sqlalchemy_integrity_error_still_catchable(recorded):
+    engine = sa.create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(sa.text('CREATE TABLE t (id INTEGER PRIMARY KEY)'))
+        conn.execute(sa.text('INSERT INTO t VALUES (1)'))
+        with pytest.raises(sa.exc.IntegrityError):
+            conn.execute(sa.text('INSERT INTO t VALUES (1)'))
+
+
+def test_broken_listener_does_not_replace_error(recorded):
+    def broken(*args):
+        raise RuntimeError('listener bug')
+
+    db_backend.QUERY_LISTENERS.append(broken)
+    try:
+        engine = sa.create_engine('sqlite://')
+        with engine.connect() as conn:
+            with pytest.raises(sa.exc.OperationalError):
+                conn.execute(sa.text('SELECT * FROM nope'))
+    finally:
+        db_backend.QUERY_LISTENERS.remove(broken)
+
+
+def test_backend_cursor_reports_error(tmp_path, recorded):
+    backend = db_backend.create_backend(None, sqlite_path=str(tmp_path / 't.db'))
+    conn = backend.connect()
+    try:
+        with pytest.raises(db_backend.OperationalError):
+            conn.cursor().execute('SELECT * FROM nope')
+    finally:
+        conn.close()
+    assert isinstance(recorded[-1][1], sqlite3.OperationalError)
+
+
+# --- translate_sql: SQLite dialect -> PostgreSQL ---
+
+def test_translate_skips_begin_immediate_and_pragma():
+    for sql in ('BEGIN IMMEDIATE', 'BEGIN', 'begin exclusive;', 'PRAGMA foreign_keys = ON'):
+        assert db_backend.translate_sql(sql) is None
+
+
+def test_translate_insert_or_ignore():
+    sql = db_backend.translate_sql("INSERT OR IGNORE INTO counters (name, value) VALUES (?, ?);")
+    assert sql == "INSERT INTO counters (name, value) VALUES (%s, %s) ON CONFLICT DO NOTHING"
+
+
+def test_translate_ddl_types():
+    sql = db_backend.translate_sql(
+        "CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, amount REAL, pay_date DATE, created_at TIMESTAMP)")
+    assert sql == "CREATE TABLE t (id SERIAL PRIMARY KEY, amount DOUBLE PRECISION, pay_date TEXT, created_at TEXT)"
+    assert db_backend.translate_sql("ALTER TABLE t ADD COLUMN note TEXT") == \
+        "ALTER TABLE t ADD COLUMN IF NOT EXISTS note TEXT"
+
+
+def test_translate_placeholders_outside_quotes_only():
+    sql = db_backend.translate_sql("SELECT 'a?b', \"odd?name\" FROM t WHERE note LIKE '50%' AND id = ? -- why?")
+    assert sql == "SELECT 'a?b', \"odd?name\" FROM t WHERE note LIKE '50%%' AND id = %s -- why?"
+
+
+def test_double_quotes_and_strftime_pass_through():
+    # Postgres reads "..." as an identifier and has no strftime(): translate_sql doesn't guess,
+    # so app SQL uses single-quoted literals and date bounds computed in Python
+    assert db_backend.translate_sql('SELECT * FROM loans WHERE status = "Active"') == \
+        'SELECT * FROM loans WHERE status = "Active"'
+    assert db_backend.translate_sql("SELECT strftime('%Y-%m', loan_date) FROM loans") == \
+        "SELECT strftime('%%Y-%%m', loan_date) FROM loans"
+
+
+def test_app_sql_has_no_strftime():
+    with open(os.path.join(os.path.dirname(__file__), '..', 'app.py'), encoding='utf-8') as f:
+        source = f.read()
+    assert not re.search(r"(?<![.\w])strftime\(\s*'%", source)
+
+
+# --- Connection API, same tests on SQLite and Postgres ---
+
+@pytest.fixture(scope='module')
+def postgres_url(tmp_path_factory):
+    if psycopg2 is None:
+        pytest.skip('psycopg2 not installed')
+    url = os.environ.get('TEST_DATABASE_URL')
+    if url:
+        yield url
+        return
+    pgserver = pytest.importorskip('pgserver', reason='no TEST_DATABASE_URL and no local pgserver stand-in')
+    try:
+        server = pgserver.get_server(str(tmp_path_factory.mktemp('pg')), cleanup_mode='stop')
+    except Exception as e:
+        pytest.skip(f'local Postgres stand-in unavailable: {e}')
+    yield server.get_uri()
+    server.cleanup()
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        backend = db_backend.create_backend(None, sqlite_path=str(tmp_path / 'app.db'))
+    else:
+        backend = db_backend.create_backend(request.getfixturevalue('postgres_url'))
+    with backend.connect() as conn:
+        conn.execute("DROP TABLE IF EXISTS api_loans")
+        conn.execute("CREATE TABLE api_loans (id INTEGER PRIMARY KEY AUTOINCREMENT, loan_id TEXT UNIQUE, "
+                     "amount REAL, status TEXT)")
+    yield backend
+    backend.dispose()
+
+
+def test_rows_by_index_and_name(backend):
+    with backend.connect() as conn:
+        cur = conn.cursor()
+        cur.execute("INSERT INTO api_loans (loan_id, amount, status) VALUES (?, ?, 'Active')", ('PL1', 1000.0))
+        cur.execute("SELECT loan_id, amount FROM api_loans WHERE status = 'Active'")
+        row = cur.fetchone()
+    assert row[0] == 'PL1' and row['amount'] == 1000.0 and dict(row) == {'loan_id': 'PL1', 'amount': 1000.0}
+
+
+def test_begin_immediate_and_insert_or_ignore(backend):
+    with backend.connect() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.executemany("INSERT INTO api_loans (loan_id, amount, status) VALUES (?, ?, ?)",
+                        [('PL1', 100.0, 'Active'), ('PL2', 200.0, 'Closed')])
+        cur.execute("INSERT OR IGNORE INTO api_loans (loan_id, amount, status) VALUES (?, ?, ?)", ('PL1', 999.0, 'x'))
+        conn.commit()
+        cur.execute("SELECT COUNT(*), SUM(amount) FROM api_loans")
+        assert tuple(cur.fetchone()) == (2, 300.0)
+
+
+def test_with_block_rolls_back_on_error(backend):
+    with pytest.raises(db_backend.IntegrityError):
+        with backend.connect() as conn:
+            conn.execute("INSERT INTO api_loans (loan_id, amount) VALUES (?, ?)", ('PL1', 1.0))
+            conn.execute("INSERT INTO api_loans (loan_id, amount) VALUES (?, ?)", ('PL1', 2.0))
+    with backend.connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM api_loans").fetchone()[0] == 0
+
+
+def test_literals_with_placeholder_characters(backend):
+    with backend.connect() as conn:
+        conn.execute("INSERT INTO api_loans (loan_id, amount, status) VALUES (?, ?, 'paid 100% - why?')", ('PL1', 1.0))
+        row = conn.execute("SELECT status FROM api_loans WHERE loan_id = ? AND status LIKE '%why?'", ('PL1',)).fetchone()
+    assert row['status'] == 'paid 100% - why?'
@@ -0,0 +1,29 @@
+import importlib
+
+import pytest
+from cryptography.fernet import Fernet
+
+
+@pytest.fixture
+def load(monkeypatch):
+    def load(blind_index_key):
+        monkeypatch.setenv('MFI_ENCRYPTION_KEYS', 'k1:' + Fernet.generate_key().decode())
+        if blind_index_key is None:
+            monkeypatch.delenv('MFI_BLIND_INDEX_KEY', raising=False)
+        else:
+            monkeypatch.setenv('MFI_BLIND_INDEX_KEY', blind_index_key)
+        import encryption_utils
+        return importlib.reload(encryption_utils)
+    return load
+
+
+def test_blind_index_refuses_without_key(load):
+    encryption_utils = load(None)
+    with pytest.raises(RuntimeError, match='MFI_BLIND_INDEX_KEY'):
+        encryption_utils.blind_index('1234 5678 9012')
+
+
+def test_blind_index_depends_on_key(load):
+    first = load('secret-one').blind_index('1234 5678 9012')
+    assert load('secret-one').blind_index('123456789012') == first
+    assert load('secret-two').blind_index('1234 5678 9012') != first
@@ -0,0 +1,20 @@
+from flask import Flask
+
+import export_utils
+
+
+def _export(fmt):
+    app = Flask(__name__)
+    with app.test_request_context():
+        response = export_utils.stream_response(fmt, 'report', [{'loan_id': 'PL0001', 'amount': 1000}])
+        return response.headers['Content-Type'], response.get_data()
+
+
+def test_csv_content_type_has_one_charset():
+    content_type, body = _export('csv')
+    assert content_type == 'text/csv; charset=utf-8'
+    assert b'PL0001' in body
+
+
+def test_ndjson_content_type():
+    assert _export('ndjson')[0] == 'application/x-ndjson'
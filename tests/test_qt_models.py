@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('PyQt6.QtWidgets')
+
+from PyQt6.QtCore import QThreadPool  # noqa: E402
+
+from qt_models import PagedQueryModel  # noqa: E402
+
+KEYS = list(range(2, 200002, 2))  # 100k rows, even ids
+
+
+@pytest.fixture(scope='module')
+def qapp():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+@pytest.fixture
+def model(qapp):
+    calls = []
+
+    def page_query(session, after_key, limit):
+        calls.append(limit)
+        start = 0 if after_key is None else KEYS.index(after_key) + 1
+        return [(key, f"Customer {key}") for key in KEYS[start:start + limit]]
+
+    model = PagedQueryModel(["ID", "Name"], page_query)
+    model.calls = calls
+    return model
+
+
+def _locate(qapp, model, key):
+    found = []
+    model.locate_key(key, found.append)
+    while not found:
+        QThreadPool.globalInstance().waitForDone()
+        qapp.processEvents()
+    return found[0]
+
+
+def test_locate_key_near_the_end_reads_in_batches(qapp, model):
+    row = _locate(qapp, model, 199_990)
+    assert row == KEYS.index(199_990)
+    assert model.key_for_row(row) == 199_990
+    assert len(model.calls) == len(KEYS) // PagedQueryModel.LOCATE_BATCH
+
+
+def test_locate_loaded_key_does_not_query(qapp, model):
+    _locate(qapp, model, 1000)
+    calls = len(model.calls)
+    assert _locate(qapp, model, 500) == KEYS.index(500)
+    assert _locate(qapp, model, 501) is None
+    assert len(model.calls) == calls
+
+
+def test_locate_missing_key_past_the_end(qapp, model):
+    assert _locate(qapp, model, 300_000) is None
+    assert model.rowCount() == len(KEYS)
+    assert not model.canFetchMore()
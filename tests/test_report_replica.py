@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import db_backend
+
+
+@pytest.fixture
+def primary(tmp_path):
+    path = str(tmp_path / 'main.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE loans (loan_id TEXT)')
+    conn.commit()
+    yield path, conn
+    conn.close()
+
+
+def _write(conn, loan_id):
+    conn.execute('INSERT INTO loans VALUES (?)', (loan_id,))
+    conn.commit()
+
+
+def _loans(replica):
+    with replica.connect() as conn:
+        return [row[0] for row in conn.execute('SELECT loan_id FROM loans ORDER BY loan_id').fetchall()]
+
+
+def test_copies_are_per_process(primary):
+    replica = db_backend.SQLiteReportReplica(primary[0])
+    assert all(f"-{os.getpid()}-" in path for path in replica.paths)
+    replica._pid = -1  # as if inherited across a fork
+    replica.age()
+    assert replica._pid == os.getpid()
+
+
+def test_refresh_never_rewrites_a_copy_being_read(primary):
+    path, writer = primary
+    replica = db_backend.SQLiteReportReplica(path)
+    _write(writer, 'PL1')
+    reader = replica.connect()  # open on the first copy
+    _write(writer, 'PL2')
+    assert replica.refresh()    # fills the other copy
+    _write(writer, 'PL3')
+    assert not replica.refresh()  # back to the first copy: still being read, deferred
+    assert [row[0] for row in reader.execute('SELECT loan_id FROM loans').fetchall()] == ['PL1']
+    assert _loans(replica) == ['PL1', 'PL2']
+    reader.close()
+    assert replica.refresh()
+    assert _loans(replica) == ['PL1', 'PL2', 'PL3']
+    replica._remove_copies()
+
+
+def test_copies_removed_at_exit_and_stale_ones_swept(primary):
+    path = primary[0]
+    dead = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                          capture_output=True, text=True).stdout.strip()
+    stale = f"{os.path.splitext(path)[0]}.report-{dead}-a.db"
+    open(stale, 'w').close()
+    replica = db_backend.SQLiteReportReplica(path, refresh_seconds=3600)
+    replica.start()
+    assert not os.path.exists(stale)
+    assert os.path.exists(replica.paths[replica.current])
+    replica._remove_copies()
+    assert not any(os.path.exists(p) for p in replica.paths)